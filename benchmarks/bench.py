@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+from llvmact.synthetic import write_results
+
+# Benchmarks for the results pipeline, run against synthetic lit results.
+#
+#   python benchmarks/bench.py --sizes small,medium
+#   python benchmarks/bench.py --save-baseline main
+#   python benchmarks/bench.py --compare main
+#
+# Every (dataset, benchmark) pair runs in a fresh interpreter, so the peak RSS
+# reported is that benchmark's alone. Comparing against a saved baseline exits
+# with a non-zero status when any time or peak RSS grew by more than the
+# threshold.
+
+BASELINES = Path(__file__).resolve().parent / 'baselines'
+
+DATASETS = {
+  'small': dict(tests=1000),
+  'medium': dict(tests=20000),
+  'large': dict(tests=200000),
+  'long-stderr': dict(tests=5000, fail=0.5, stderr_lines=200),
+  'huge-stderr': dict(tests=2000, fail=0.5, huge_fraction=0.05, huge_stderr_lines=50000),
+}
+
+BENCHMARKS = ['load', 'parse', 'largest', 'raw', 'compact', 'diagnostics', 'annotate', 'analytics']
+
+
+def _failures(path):
+  from llvmact.lit_results import LITResultsReader
+  from llvmact.types.llvm import FAILING_CODES
+  return [t for t in LITResultsReader(path) if t.code in FAILING_CODES]
+
+
+def bench_load(path):
+  from llvmact.lit_results import LITResultsReader
+  start = time.perf_counter()
+  n = sum(1 for _ in LITResultsReader(path))
+  return time.perf_counter() - start, n
+
+
+def bench_parse(path):
+  from llvmact.libcxx_test_parser import parse_test_outputs
+  outputs = [t.output for t in _failures(path)]
+  start = time.perf_counter()
+  parse_test_outputs(outputs, jobs=1, cache=False)
+  return time.perf_counter() - start, len(outputs)
+
+
+# The largest failing output of a dataset, in a file of its own as `parse
+# --raw` reads it. Only the largest one is kept while looking for it.
+def _largest_output(path):
+  from llvmact.lit_results import LITResultsReader
+  out = Path(path).with_suffix('.largest.txt')
+  if not out.exists():
+    largest = max((t['output'] for t in LITResultsReader(path, validate=False) if t['code'] == 'FAIL'), key=len)
+    out.write_text(largest)
+  return out
+
+
+# `parse --raw` on the largest output: read into a str and split into lines
+# (`largest`), or memory mapped and decoded only where kept (`raw`).
+def bench_largest(path):
+  from llvmact.libcxx_test_parser import parse_test_output
+  out = _largest_output(path)
+  start = time.perf_counter()
+  parsed = parse_test_output(out.read_text(), cache=False)
+  return time.perf_counter() - start, len(parsed.Output)
+
+
+def bench_raw(path):
+  from llvmact.libcxx_test_parser import parse_test_output
+  from llvmact.line_source import LineSource
+  out = _largest_output(path)
+  start = time.perf_counter()
+  with LineSource.from_file(out) as source:
+    parsed = parse_test_output(source)
+  return time.perf_counter() - start, len(parsed.Output)
+
+
+# Parsing while keeping every result in the compact form aggregate holds;
+# its peak RSS is comparable with `parse`, which keeps the full models.
+def bench_compact(path):
+  from llvmact.compact import CommandTable
+  from llvmact.libcxx_test_parser import parse_test_output
+  outputs = [t.output for t in _failures(path)]
+  start = time.perf_counter()
+  table = CommandTable()
+  parsed = [table.compact(parse_test_output(o, cache=False)) for o in outputs]
+  return time.perf_counter() - start, len(parsed)
+
+
+def bench_diagnostics(path):
+  from llvmact.clang_diagnostics import parse_diagnostics
+  from llvmact.libcxx_test_parser import ExecutedCommandBlock, parse_test_outputs
+  parsed = parse_test_outputs([t.output for t in _failures(path)], jobs=1, cache=False)
+  stderrs = [b.stderr for p in parsed for b in p.Output if isinstance(b, ExecutedCommandBlock) and b.stderr]
+  start = time.perf_counter()
+  n = sum(len(parse_diagnostics(s).diagnostics) for s in stderrs)
+  return time.perf_counter() - start, n
+
+
+def bench_annotate(path):
+  from llvmact.diagnostic_index import DiagnosticIndex
+  from llvmact.libcxx_test_parser import parse_test_outputs
+  failures = _failures(path)
+  parsed = parse_test_outputs([t.output for t in failures], jobs=1, cache=False)
+  start = time.perf_counter()
+  index = DiagnosticIndex()
+  for t, p in zip(failures, parsed):
+    index.add(t.name, 'synthetic', p.clang_errors)
+  n = len(index.annotations())
+  return time.perf_counter() - start, n
+
+
+def bench_analytics(path):
+  from llvmact.analytics import TimingColumns
+  from llvmact.lit_results import LITResultsReader
+  start = time.perf_counter()
+  columns = TimingColumns.from_tests(LITResultsReader(path, validate=False))
+  columns.group_totals('directory')
+  columns.distribution('config')
+  columns.slowest(20)
+  return time.perf_counter() - start, len(columns)
+
+
+def run_child(bench, path):
+  wall, items = globals()[f'bench_{bench}'](path)
+  # ru_maxrss is in KiB on Linux and bytes on macOS.
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    rss //= 1024
+  print(json.dumps({'wall': wall, 'rss_kb': rss, 'items': items}))
+
+
+def generate(work_dir, name):
+  path = Path(work_dir, f'{name}.json')
+  if not path.exists():
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+      write_results(f, **DATASETS[name])
+    os.replace(tmp, path)
+  return path
+
+
+def run(sizes, benches, work_dir):
+  results = {}
+  for name in sizes:
+    path = generate(work_dir, name)
+    for bench in benches:
+      out = subprocess.run([sys.executable, __file__, '--child', bench, str(path)],
+                           check=True, capture_output=True, text=True).stdout
+      results[f'{name}/{bench}'] = json.loads(out.strip().splitlines()[-1])
+      r = results[f'{name}/{bench}']
+      print(f"{name + '/' + bench:28} {r['wall']:10.3f}s {r['rss_kb'] / 1024:10.1f} MiB {r['items']:10}")
+  return results
+
+
+# Differences smaller than these are treated as noise.
+MIN_DELTA = {'wall': 0.05, 'rss_kb': 4096}
+
+
+def compare(results, baseline, threshold):
+  regressions = []
+  for key, new in results.items():
+    old = baseline.get(key)
+    if old is None:
+      continue
+    for metric in ['wall', 'rss_kb']:
+      if new[metric] - old[metric] < MIN_DELTA[metric]:
+        continue
+      if old[metric] > 0 and new[metric] > old[metric] * (1 + threshold):
+        regressions.append(f'{key} {metric}: {old[metric]:.3f} -> {new[metric]:.3f} '
+                           f'(+{(new[metric] / old[metric] - 1) * 100:.0f}%)')
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the lit results pipeline')
+  parser.add_argument('--sizes', default='small,medium', help=f"comma separated datasets: {', '.join(DATASETS)}")
+  parser.add_argument('--benchmarks', default=','.join(BENCHMARKS))
+  parser.add_argument('--work-dir', default=None, help='where generated datasets are kept (default: a temporary directory)')
+  parser.add_argument('--save-baseline', metavar='NAME')
+  parser.add_argument('--compare', metavar='NAME')
+  parser.add_argument('--threshold', type=float, default=0.25,
+                      help='fractional growth in time or RSS reported as a regression')
+  parser.add_argument('--child', nargs=2, metavar=('BENCHMARK', 'FILE'), help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    run_child(*args.child)
+    return 0
+
+  sizes = args.sizes.split(',')
+  benches = args.benchmarks.split(',')
+  for s in sizes:
+    if s not in DATASETS:
+      parser.error(f'unknown dataset {s}')
+  for b in benches:
+    if b not in BENCHMARKS:
+      parser.error(f'unknown benchmark {b}')
+
+  if args.work_dir:
+    Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+    results = run(sizes, benches, args.work_dir)
+  else:
+    with tempfile.TemporaryDirectory() as d:
+      results = run(sizes, benches, d)
+
+  if args.save_baseline:
+    BASELINES.mkdir(exist_ok=True)
+    path = BASELINES / f'{args.save_baseline}.json'
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+    print(f'saved baseline to {path}')
+
+  if args.compare:
+    baseline = json.loads((BASELINES / f'{args.compare}.json').read_text())
+    regressions = compare(results, baseline, args.threshold)
+    for r in regressions:
+      print(f'REGRESSION: {r}')
+    if regressions:
+      return 1
+    print(f'no regressions against {args.compare}')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
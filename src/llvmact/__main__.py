@@ -0,0 +1,142 @@
+import argparse
+import importlib
+import os
+import sys
+
+# `python -m llvmact <command>`, the entry point the actions run.
+#
+# Many small steps across the CI matrix pay for this startup, so only the
+# standard library is imported here. Each command imports what it needs when
+# it runs, and nothing talks to GitHub until a command has something to send.
+#
+#   python -m llvmact parse results.json
+#   python -m llvmact report results.json --config generic-cxx23
+#   python -m llvmact email --output user_email
+#   python -m llvmact aggregate artifacts/
+#   python -m llvmact select --base origin/main --workflow callable.yaml
+#   python -m llvmact watch -- lit -v build/libcxx/test
+#   python -m llvmact abi artifacts/ --baseline libcxx/lib/abi
+
+# What `python -m llvmact --help` may cost, in seconds. Checked by the tests.
+STARTUP_BUDGET = 0.25
+
+# Commands which are modules with a main(argv) of their own; their arguments
+# are passed through untouched.
+DELEGATED = {
+  'report': ('.pipeline', 'create a check run from lit results'),
+  'aggregate': ('.aggregate', 'combine the results of many configurations into one check run'),
+  'analytics': ('.analytics', 'where the test time goes'),
+  'select': ('.selection', 'the tests and configurations affected by a change'),
+  'shard': ('.sharding', 'split the tests of each configuration into balanced shards'),
+  'watch': ('.watch', 'report failures to a check run while lit is running'),
+  'abi': ('.abi', 'compare the ABI lists of every configuration with their baselines'),
+}
+
+
+def cmd_parse(args) -> int:
+  from .libcxx_test_parser import parse_test_output, parse_test_outputs
+  if args.raw:
+    # The output is parsed from its bytes (a file is memory mapped), decoding
+    # only the parts which are kept.
+    from .line_source import LineSource
+    source = LineSource(sys.stdin.buffer.read()) if args.input == '-' else LineSource.from_file(args.input)
+    with source:
+      print(parse_test_output(source).model_dump_json(indent=2))
+    return 0
+  from .lit_results import read_results
+  from .types.llvm import FAILING_CODES
+  failures = [t for t in read_results(args.input) if t.code in FAILING_CODES]
+  for test, parsed in zip(failures, parse_test_outputs([t.output for t in failures], jobs=args.jobs)):
+    if args.json:
+      print(parsed.model_dump_json())
+      continue
+    print(test.name)
+    for e in parsed.clang_errors:
+      print(f'  {e.file}:{e.line}:{e.column}: error: {e.text}')
+  return 0
+
+
+def cmd_email(args) -> int:
+  from .pr_email import run
+  return run(args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(prog='python -m llvmact', description='Tools for the libc++ CI actions')
+  commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+  p = commands.add_parser('parse', help='parse the output of failing tests')
+  p.add_argument('input', help="the results.json (or test-results.xml) produced by lit, or with --raw one test's output ('-' for stdin)")
+  p.add_argument('--raw', action='store_true', help='the input is the output of a single test')
+  p.add_argument('--json', action='store_true', help='print the parsed output of every failure as JSON lines')
+  p.add_argument('-j', '--jobs', type=int, default=None)
+  p.set_defaults(func=cmd_parse)
+
+  p = commands.add_parser('email', help="print the e-mail address of a pull request's author")
+  p.add_argument('--commits-url', default=None,
+                 help="the pull request's commits URL (default: $PULL_REQUEST_COMMITS_HREF, else ask git)")
+  p.add_argument('--ref', default='HEAD', help='commit to ask git about when there is no URL')
+  p.add_argument('--output', default=None, help='also set this step output')
+  p.add_argument('--cache-dir', default=os.environ.get('LLVMACT_GITHUB_CACHE'),
+                 help='directory of cached API responses, revalidated with their ETags')
+  p.set_defaults(func=cmd_email)
+
+  for name, (_, description) in DELEGATED.items():
+    commands.add_parser(name, help=description, add_help=False)
+  return parser
+
+
+def main(argv=None) -> int:
+  argv = sys.argv[1:] if argv is None else list(argv)
+  if argv and argv[0] in DELEGATED:
+    module = importlib.import_module(DELEGATED[argv[0]][0], __package__)
+    return module.main(argv[1:])
+  args = build_parser().parse_args(argv)
+  return args.func(args)
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestMain(unittest.TestCase):
+  def test_startup(self):
+    import json
+    import subprocess
+    from pathlib import Path
+    src = Path(__file__).resolve().parents[1]
+    code = ('import sys, time\n'
+            'start = time.perf_counter()\n'
+            'from llvmact.__main__ import build_parser\n'
+            'build_parser().format_help()\n'
+            'elapsed = time.perf_counter() - start\n'
+            'heavy = ["github", "requests", "rich", "actions_toolkit", "pydantic", "numpy"]\n'
+            'print(json.dumps({"elapsed": elapsed, "loaded": [m for m in heavy if m in sys.modules]}))\n')
+    out = subprocess.run([sys.executable, '-c', 'import json\n' + code], cwd=src, check=True,
+                         capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': str(src)}).stdout
+    result = json.loads(out)
+    self.assertEqual(result['loaded'], [])
+    self.assertLess(result['elapsed'], STARTUP_BUDGET)
+
+  def test_parse(self):
+    import contextlib
+    import io
+    from pathlib import Path
+    results = Path(__file__).resolve().parents[2] / 'python-test' / 'results.json'
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      self.assertEqual(main(['parse', str(results), '-j', '1']), 0)
+    self.assertIn('fails-to-compile.pass.cpp', out.getvalue())
+    self.assertIn("error: no viable overloaded '+='", out.getvalue())
+
+  def test_report_dry_run(self):
+    import contextlib
+    import io
+    from pathlib import Path
+    results = Path(__file__).resolve().parents[2] / 'python-test' / 'results.json'
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      self.assertEqual(main(['report', str(results), '-j', '1', '--dry-run']), 0)
+    self.assertIn('2 tests failed.', out.getvalue())
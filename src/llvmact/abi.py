@@ -0,0 +1,276 @@
+import argparse
+import ast
+import fnmatch
+import io
+import os
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from .aggregate import artifact_config, find_artifacts
+
+# Checks the ABI lists the CI jobs upload against the ones in the source tree.
+#
+# An .abilist file (libcxx/lib/abi/*.abilist) has one exported symbol per
+# line, written as a Python dict:
+#
+#   {'is_defined': True, 'name': '_ZNSt3__16vectorIiNS_9allocatorIiEEE...', 'type': 'FUNC'}
+#   {'is_defined': True, 'name': '_ZTINSt3__112bad_weak_ptrE', 'size': 24, 'type': 'OBJECT'}
+#
+# Each list is loaded into a dict keyed by symbol name, so comparing it with
+# its baseline is a few set operations: names only in the build were added,
+# names only in the baseline removed, and names in both whose type, size or
+# definedness differ changed. The artifacts of every configuration are read
+# in parallel, and the changes are reported once each, with the
+# configurations which have them.
+#
+#   python -m llvmact abi artifacts/ --baseline llvm-project/libcxx/lib/abi
+
+ABILIST_PATTERN = '*.abilist'
+
+# The layout libc++'s tools write, matched in one go; anything else is read
+# field by field.
+_symbol_re = re.compile(r"^\{'is_defined': (?P<is_defined>True|False), 'name': '(?P<name>[^']*)', "
+                        r"(?:'size': (?P<size>\d+), )?'type': '(?P<type>[^']*)'\}$")
+_field_re = re.compile(r"'(?P<key>\w+)': (?:'(?P<str>[^']*)'|(?P<other>\w+))")
+
+
+class Symbol(NamedTuple):
+  name: str
+  type: Optional[str] = None
+  size: Optional[int] = None
+  is_defined: bool = True
+
+  def describe(self) -> str:
+    attrs = [self.type or '?']
+    if self.size is not None:
+      attrs.append(f'size {self.size}')
+    if not self.is_defined:
+      attrs.append('undefined')
+    return f"{self.name} ({', '.join(attrs)})"
+
+
+def parse_symbol(line: str) -> Optional[Symbol]:
+  line = line.strip()
+  if not line or line.startswith('#'):
+    return None
+  if m := _symbol_re.match(line):
+    size = m.group('size')
+    return Symbol(m.group('name'), m.group('type'), int(size) if size else None, m.group('is_defined') == 'True')
+  fields = {}
+  for m in _field_re.finditer(line):
+    fields[m.group('key')] = m.group('str') if m.group('str') is not None else m.group('other')
+  if 'name' not in fields:
+    # Not the usual layout; let Python read it.
+    fields = ast.literal_eval(line)
+  size = fields.get('size')
+  return Symbol(fields['name'], fields.get('type'), int(size) if size is not None else None,
+                fields.get('is_defined', True) not in (False, 'False'))
+
+
+# The symbols of one ABI list, by name.
+class ABIList:
+  def __init__(self, symbols: dict[str, Symbol]):
+    self.symbols = symbols
+
+  def __len__(self):
+    return len(self.symbols)
+
+  @classmethod
+  def parse(cls, lines: Iterable[str]) -> 'ABIList':
+    symbols = {}
+    for line in lines:
+      s = parse_symbol(line)
+      if s is not None:
+        symbols[s.name] = s
+    return cls(symbols)
+
+  @classmethod
+  def load(cls, path: Union[str, os.PathLike]) -> 'ABIList':
+    with open(path, encoding='utf-8') as f:
+      return cls.parse(f)
+
+
+class ABIDiff(BaseModel):
+  added: list[Symbol] = Field(default_factory=list)
+  removed: list[Symbol] = Field(default_factory=list)
+  # (baseline, build) pairs.
+  changed: list[tuple[Symbol, Symbol]] = Field(default_factory=list)
+
+  def __bool__(self):
+    return bool(self.added or self.removed or self.changed)
+
+
+def diff(baseline: ABIList, current: ABIList) -> ABIDiff:
+  old, new = baseline.symbols, current.symbols
+  old_names, new_names = old.keys(), new.keys()
+  changed = [n for n in old_names & new_names if old[n] != new[n]]
+  # Built from symbols which are already valid; validating them again would
+  # cost more than the diff.
+  return ABIDiff.model_construct(
+    added=[new[n] for n in sorted(new_names - old_names)],
+    removed=[old[n] for n in sorted(old_names - new_names)],
+    changed=[(old[n], new[n]) for n in sorted(changed)])
+
+
+class ListResult(BaseModel):
+  config: str
+  # The file name of the list, which names the target and ABI flavour and is
+  # the name of its baseline.
+  abilist: str
+  symbols: int = 0
+  diff: Optional[ABIDiff] = None
+  error: Optional[str] = None
+
+
+def _artifact_lists(path: Path) -> Iterable[tuple[str, ABIList]]:
+  if path.is_dir():
+    for p in sorted(path.rglob(ABILIST_PATTERN)):
+      yield p.name, ABIList.load(p)
+    return
+  with zipfile.ZipFile(path) as zf:
+    for name in sorted(zf.namelist()):
+      if fnmatch.fnmatch(Path(name).name, ABILIST_PATTERN):
+        with zf.open(name) as f:
+          yield Path(name).name, ABIList.parse(io.TextIOWrapper(f, encoding='utf-8'))
+
+
+# Every ABI list of one artifact, compared with the list of the same name in
+# `baseline_dir`.
+def check_artifact(path: Union[str, os.PathLike], baseline_dir: Union[str, os.PathLike]) -> list[ListResult]:
+  path = Path(path)
+  config = artifact_config(path)
+  results = []
+  try:
+    for name, current in _artifact_lists(path):
+      baseline = Path(baseline_dir, name)
+      if not baseline.is_file():
+        results.append(ListResult(config=config, abilist=name, symbols=len(current), error='no baseline'))
+        continue
+      results.append(ListResult(config=config, abilist=name, symbols=len(current),
+                                diff=diff(ABIList.load(baseline), current)))
+  except (OSError, ValueError, SyntaxError, zipfile.BadZipFile) as e:
+    results.append(ListResult(config=config, abilist=path.name, error=str(e)))
+  return results
+
+
+def check_artifacts(paths: list[Path], baseline_dir: Union[str, os.PathLike],
+                    jobs: Optional[int] = None) -> list[ListResult]:
+  jobs = min(jobs or os.cpu_count() or 1, len(paths))
+  if jobs <= 1:
+    return [r for p in paths for r in check_artifact(p, baseline_dir)]
+  with ProcessPoolExecutor(max_workers=jobs) as pool:
+    return [r for rs in pool.map(check_artifact, paths, [baseline_dir] * len(paths)) for r in rs]
+
+
+class Change(NamedTuple):
+  kind: str  # 'added', 'removed' or 'changed'
+  abilist: str
+  description: str
+
+
+# Each change once, with the configurations which have it, grouped by the
+# set of configurations so a change shared by thirty builds is listed once.
+def shared_changes(results: list[ListResult]) -> dict[tuple[str, ...], list[Change]]:
+  configs: dict[Change, set[str]] = {}
+  for r in results:
+    if not r.diff:
+      continue
+    changes = [Change('added', r.abilist, s.describe()) for s in r.diff.added]
+    changes += [Change('removed', r.abilist, s.describe()) for s in r.diff.removed]
+    changes += [Change('changed', r.abilist, f'{old.describe()} -> {new.describe()}') for old, new in r.diff.changed]
+    for c in changes:
+      configs.setdefault(c, set()).add(r.config)
+  groups: dict[tuple[str, ...], list[Change]] = {}
+  for c, cs in configs.items():
+    groups.setdefault(tuple(sorted(cs)), []).append(c)
+  return {k: sorted(v) for k, v in sorted(groups.items(), key=lambda kv: (-len(kv[0]), kv[0]))}
+
+
+def render(results: list[ListResult], max_changes: int = 100) -> str:
+  lines = ['## ABI lists', '']
+  checked = [r for r in results if r.diff is not None]
+  changed = [r for r in checked if r.diff]
+  lines.append(f'{len(checked)} ABI lists checked in {len({r.config for r in results})} configurations, '
+               f'{len(changed)} with changes.')
+  for r in results:
+    if r.error:
+      lines.append(f'- {r.config}: {r.abilist}: {r.error}')
+  for configs, changes in shared_changes(results).items():
+    lines += ['', f"### {', '.join(configs)}", '', '```diff']
+    marks = {'added': '+', 'removed': '-', 'changed': '!'}
+    lines += [f'{marks[c.kind]} {c.description}  [{c.abilist}]' for c in changes[:max_changes]]
+    if len(changes) > max_changes:
+      lines.append(f'# ... and {len(changes) - max_changes} more')
+    lines.append('```')
+  return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m llvmact abi',
+                                   description='Compare the ABI lists of every configuration with their baselines')
+  parser.add_argument('directory', help='directory of downloaded *-results artifacts')
+  parser.add_argument('--baseline', required=True, help='directory of the expected .abilist files (libcxx/lib/abi)')
+  parser.add_argument('-j', '--jobs', type=int, default=None)
+  parser.add_argument('--max-changes', type=int, default=100, help='changes listed per group of configurations')
+  parser.add_argument('--check', action='store_true', help='exit with 1 when any list changed')
+  args = parser.parse_args(argv)
+
+  results = check_artifacts(find_artifacts(args.directory), args.baseline, jobs=args.jobs)
+  text = render(results, args.max_changes)
+  print(text)
+  from .workflow import WorkflowCommands
+  with WorkflowCommands() as wf:
+    wf.summary(text)
+  return 1 if args.check and any(r.diff for r in results) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestABI(unittest.TestCase):
+  baseline = [
+    "{'is_defined': True, 'name': '_ZNSt3__14cout', 'size': 160, 'type': 'OBJECT'}",
+    "{'is_defined': True, 'name': '_ZNSt3__15mutex4lockEv', 'type': 'FUNC'}",
+    "{'is_defined': False, 'name': '__cxa_throw', 'type': 'FUNC'}",
+  ]
+
+  def test_diff(self):
+    current = self.baseline[1:] + ["{'is_defined': True, 'name': '_ZNSt3__14cout', 'size': 168, 'type': 'OBJECT'}",
+                                   "{'is_defined': True, 'name': '_ZNSt3__15mutex6unlockEv', 'type': 'FUNC'}"]
+    d = diff(ABIList.parse(self.baseline), ABIList.parse(current))
+    self.assertEqual([s.name for s in d.added], ['_ZNSt3__15mutex6unlockEv'])
+    self.assertEqual(d.removed, [])
+    self.assertEqual([(o.size, n.size) for o, n in d.changed], [(160, 168)])
+    self.assertFalse(ABIList.parse(self.baseline).symbols['__cxa_throw'].is_defined)
+    self.assertFalse(diff(ABIList.parse(self.baseline), ABIList.parse(reversed(self.baseline))))
+
+  def test_artifacts(self):
+    import tempfile
+    name = 'x86_64-unknown-linux-gnu.libcxxabi.v1.stable.exceptions.nonew.abilist'
+    with tempfile.TemporaryDirectory() as d:
+      Path(d, 'baseline').mkdir()
+      Path(d, 'baseline', name).write_text('\n'.join(self.baseline) + '\n')
+      artifacts = Path(d, 'artifacts')
+      for config in ['generic-cxx20', 'generic-cxx23']:
+        Path(artifacts, f'{config}-results', 'build', 'lib').mkdir(parents=True)
+        Path(artifacts, f'{config}-results', 'build', 'lib', name).write_text('\n'.join(self.baseline[1:]) + '\n')
+      with zipfile.ZipFile(Path(artifacts, 'generic-gcc-results.zip'), 'w') as zf:
+        zf.writestr(f'build/lib/{name}', '\n'.join(self.baseline) + '\n')
+      results = check_artifacts(find_artifacts(artifacts), Path(d, 'baseline'), jobs=2)
+    self.assertEqual([(r.config, bool(r.diff)) for r in results],
+                     [('generic-cxx20', True), ('generic-cxx23', True), ('generic-gcc', False)])
+    groups = shared_changes(results)
+    self.assertEqual(list(groups), [('generic-cxx20', 'generic-cxx23')])
+    self.assertEqual([c.kind for c in groups[('generic-cxx20', 'generic-cxx23')]], ['removed'])
+    text = render(results)
+    self.assertIn('3 ABI lists checked in 3 configurations, 2 with changes.', text)
+    self.assertIn('- _ZNSt3__14cout (OBJECT, size 160)', text)
@@ -0,0 +1,208 @@
+import argparse
+import fnmatch
+import os
+import sys
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Union
+from xml.etree.ElementTree import ParseError
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from .compact import CommandTable, CompactTestOutput
+from .libcxx_test_parser import parse_test_outputs
+from .lit_results import read_results
+from .report import Report
+from .types.llvm import FAILING_CODES, TestResult
+
+# Files inside an artifact which hold lit results, in order of preference:
+# lit's JSON when a job wrote it, else the JUnit XML every job uploads.
+RESULTS_PATTERNS = ['*results.json', 'test-results.xml']
+
+
+class ArtifactResults(BaseModel):
+  model_config = ConfigDict(arbitrary_types_allowed=True)
+
+  config: str
+  path: str
+  counts: dict[str, int] = Field(default_factory=dict)
+  failures: list[TestResult] = Field(default_factory=list)
+  # Every configuration's parsed failures are held until the report is
+  # built, so they're kept compact: the compile and run commands of one
+  # configuration share a template and are stored once.
+  parsed: list[CompactTestOutput] = Field(default_factory=list)
+  error: Optional[str] = None
+
+
+# The configuration an artifact belongs to, from its name. The CI jobs upload
+# '<config>-results' or '<config>-<compiler>-results'.
+def artifact_config(path: Union[str, os.PathLike]) -> str:
+  name = Path(path).name
+  if name.endswith('.zip'):
+    name = name[:-len('.zip')]
+  if name.endswith('-results'):
+    name = name[:-len('-results')]
+  return name
+
+
+# Every artifact in `directory`: zip archives and already extracted
+# directories, as downloaded by actions/download-artifact.
+def find_artifacts(directory: Union[str, os.PathLike]) -> list[Path]:
+  return sorted(p for p in Path(directory).iterdir() if p.is_dir() or p.suffix == '.zip')
+
+
+def _results_files(names: list[str]) -> list[str]:
+  for pattern in RESULTS_PATTERNS:
+    matches = sorted(n for n in names if fnmatch.fnmatch(Path(n).name, pattern))
+    if matches:
+      return matches
+  return []
+
+
+def iter_artifact_tests(path: Path, validate: bool = True) -> Iterator[TestResult]:
+  if path.is_dir():
+    files = {str(p): p for p in path.rglob('*') if p.is_file()}
+    for name in _results_files(list(files)):
+      yield from read_results(files[name], validate=validate)
+    return
+  # Read straight out of the archive rather than extracting it.
+  with zipfile.ZipFile(path) as zf:
+    for name in _results_files(zf.namelist()):
+      with zf.open(name) as f:
+        yield from read_results(f, validate=validate)
+
+
+def load_artifact(path: Union[str, os.PathLike], config: Optional[str] = None) -> ArtifactResults:
+  path = Path(path)
+  config = config or artifact_config(path)
+  counts = Counter()
+  failures = []
+  try:
+    for test in iter_artifact_tests(path):
+      test.config = config
+      counts[test.code] += 1
+      if test.code in FAILING_CODES:
+        failures.append(test)
+  except (OSError, ValueError, ParseError, zipfile.BadZipFile) as e:
+    return ArtifactResults(config=config, path=str(path), counts=counts, error=str(e))
+  table = CommandTable()
+  parsed = [table.compact(p) for p in parse_test_outputs([t.output for t in failures], jobs=1)]
+  return ArtifactResults(config=config, path=str(path), counts=counts, failures=failures, parsed=parsed)
+
+
+# Load and parse every artifact, using up to `jobs` processes. Results are in
+# the same order as `paths`.
+def load_artifacts(paths: list[Path], jobs: Optional[int] = None) -> list[ArtifactResults]:
+  jobs = min(jobs or os.cpu_count() or 1, len(paths))
+  if jobs <= 1:
+    return [load_artifact(p) for p in paths]
+  with ProcessPoolExecutor(max_workers=jobs) as pool:
+    return list(pool.map(load_artifact, paths))
+
+
+def build_report(artifacts: list[ArtifactResults]) -> Report:
+  report = Report()
+  if not artifacts:
+    report.add_error('no results artifacts were found')
+  for a in artifacts:
+    if a.error:
+      report.add_error(f'{a.path}: {a.error}')
+    elif not a.counts:
+      report.add_error(f'{a.path}: no test results')
+    report.counts[a.config].update(a.counts)
+    for test, output in zip(a.failures, a.parsed):
+      report.add_failure(test, output, a.config)
+  return report
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Combine the results of many CI configurations into one check run')
+  parser.add_argument('directory', help='directory of downloaded *-results artifacts')
+  parser.add_argument('-j', '--jobs', type=int, default=None)
+  parser.add_argument('--name', default='Libc++ Test Suite')
+  parser.add_argument('--repo', default=os.environ.get('GITHUB_REPOSITORY', 'efcs/action'))
+  parser.add_argument('--sha', default=os.environ.get('GITHUB_SHA'))
+  parser.add_argument('--dry-run', action='store_true', help="print the summary instead of creating a check run")
+  args = parser.parse_args(argv)
+
+  artifacts = load_artifacts(find_artifacts(args.directory), jobs=args.jobs)
+  for a in artifacts:
+    if a.error:
+      print(f'warning: could not read {a.path}: {a.error}', file=sys.stderr)
+  report = build_report(artifacts)
+  annotations = report.annotations()
+  summary = report.summary()
+  print(summary)
+  if args.dry_run:
+    return 0
+
+  from .checks import CheckRunUploader
+  uploader = CheckRunUploader(args.repo, os.environ.get('GITHUB_TOKEN'),
+                              api_url=os.environ.get('GITHUB_API_URL', 'https://api.github.com'))
+  run = uploader.publish(name=args.name, head_sha=args.sha, conclusion=report.conclusion,
+                         title=f'{len(artifacts)} configurations', summary=summary, annotations=annotations)
+  print(f"Check run {run['id']} completed: {report.conclusion}, {len(annotations)} annotations")
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestAggregate(unittest.TestCase):
+  def test_junit_artifact(self):
+    import tempfile
+    from .libcxx_test_parser import TEST_CASES
+    xml = ('<testsuites><testsuite name="suite">'
+           '<testcase classname="suite.std/example" name="ok.pass.cpp" time="0.1"/>'
+           '<testcase classname="suite.std/example" name="fails-to-compile.pass.cpp" time="0.2">'
+           f'<failure><![CDATA[{TEST_CASES[2]}]]></failure></testcase></testsuite></testsuites>')
+    with tempfile.TemporaryDirectory() as d:
+      with zipfile.ZipFile(Path(d, 'generic-gcc-results.zip'), 'w') as zf:
+        zf.writestr('build/test/test-results.xml', xml)
+        zf.writestr('build/lib/libc++.abilist', '')
+      a = load_artifact(Path(d, 'generic-gcc-results.zip'))
+    self.assertIsNone(a.error)
+    self.assertEqual(a.counts, {'PASS': 1, 'FAIL': 1})
+    self.assertEqual(a.failures[0].name, 'suite :: std/example/fails-to-compile.pass.cpp')
+    self.assertEqual(len(a.parsed[0].clang_errors), 1)
+    # The table comes along when the results are sent back from a worker.
+    import pickle
+    self.assertEqual(pickle.loads(pickle.dumps(a)).parsed[0].to_model(), a.parsed[0].to_model())
+
+  def test_aggregate(self):
+    import json
+    import tempfile
+    from .libcxx_test_parser import TEST_CASES
+
+    def results(codes):
+      return json.dumps({'__version__': [18, 0, 0], 'elapsed': 1.0, 'tests': [
+        {'code': c, 'elapsed': 0.1, 'name': f'suite :: std/example/t{i}.pass.cpp', 'output': t}
+        for i, (c, t) in enumerate(zip(codes, TEST_CASES))]})
+
+    with tempfile.TemporaryDirectory() as d:
+      with zipfile.ZipFile(Path(d, 'generic-cxx20-results.zip'), 'w') as zf:
+        zf.writestr('build/test/results.json', results(['PASS', 'FAIL', 'FAIL']))
+      Path(d, 'generic-cxx23-results', 'nested').mkdir(parents=True)
+      Path(d, 'generic-cxx23-results', 'nested', 'results.json').write_text(results(['PASS', 'PASS', 'FAIL']))
+      Path(d, 'generic-bad-results.zip').write_bytes(b'not a zip')
+
+      paths = find_artifacts(d)
+      self.assertEqual([artifact_config(p) for p in paths], ['generic-bad', 'generic-cxx20', 'generic-cxx23'])
+      artifacts = load_artifacts(paths, jobs=2)
+      self.assertIsNotNone(artifacts[0].error)
+      self.assertEqual(artifacts[1].counts, {'PASS': 1, 'FAIL': 2})
+      self.assertEqual({t.config for t in artifacts[2].failures}, {'generic-cxx23'})
+
+      report = build_report(artifacts)
+      self.assertEqual(report.failures, 3)
+      self.assertEqual(len(report.errors), 1)
+      self.assertIn('generic-bad-results.zip', report.summary())
+      self.assertEqual(build_report([]).conclusion, 'failure')
+      annotations = report.annotations()
+      self.assertEqual(len(annotations), 2)
+      self.assertEqual(annotations[0]['title'], 'Error in 1 test across 2 configurations')
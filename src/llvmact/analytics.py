@@ -0,0 +1,317 @@
+import argparse
+import os
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .stages import stage_of, workflow_stages
+from .types.llvm import TestResult
+
+# Where test time goes, computed over column arrays rather than per-test
+# objects.
+#
+#   columns = TimingColumns.from_tests(LITResultsReader('results.json', validate=False))
+#   columns.group_totals('directory')
+#   columns.slowest(20)
+#
+# Each test becomes one row: its elapsed time, and indexes into the label
+# lists for its result code, configuration and directory. Everything after
+# loading is a numpy operation over those columns.
+
+# Directory components of the test path used to group tests, so
+# 'std/containers/sequences/vector/size.pass.cpp' falls under 'std/containers'.
+DIRECTORY_DEPTH = 2
+
+# Upper bounds, in seconds, of the buckets used for time distributions.
+BUCKETS = (0.1, 1.0, 10.0, 60.0, np.inf)
+
+PERCENTILES = (50, 95, 99)
+
+
+class GroupTotal(NamedTuple):
+  label: str
+  count: int
+  total: float
+  # Fraction of the total time of all tests.
+  share: float
+
+
+class Distribution(NamedTuple):
+  label: str
+  count: int
+  total: float
+  percentiles: tuple[float, ...]
+  max: float
+  # Number of tests in each of BUCKETS.
+  buckets: tuple[int, ...]
+
+
+class SlowTest(NamedTuple):
+  name: str
+  config: str
+  code: str
+  elapsed: float
+
+
+class _Labels:
+  def __init__(self):
+    self.index: dict[str, int] = {}
+    self.labels: list[str] = []
+
+  def __call__(self, label: str) -> int:
+    i = self.index.get(label)
+    if i is None:
+      i = self.index[label] = len(self.labels)
+      self.labels.append(label)
+    return i
+
+
+def directory_of(name: str, depth: int = DIRECTORY_DEPTH) -> str:
+  path = name.split('::', 1)[-1].strip()
+  parts = path.split('/')[:-1]
+  return '/'.join(parts[:depth]) or '.'
+
+
+class TimingColumns:
+  def __init__(self, elapsed: np.ndarray, code: np.ndarray, config: np.ndarray, directory: np.ndarray,
+               names: list[str], code_labels: list[str], config_labels: list[str], directory_labels: list[str]):
+    self.elapsed = elapsed
+    self.code = code
+    self.config = config
+    self.directory = directory
+    self.names = names
+    self.labels = {'code': code_labels, 'config': config_labels, 'directory': directory_labels}
+
+  def __len__(self):
+    return len(self.elapsed)
+
+  # Load from TestResults or the raw dicts of LITResultsReader(validate=False).
+  # `config` is used for tests which don't have one, falling back to the lit
+  # suite name.
+  @classmethod
+  def from_tests(cls, tests: Iterable[Union[TestResult, dict[str, Any]]], config: Optional[str] = None,
+                 depth: int = DIRECTORY_DEPTH) -> 'TimingColumns':
+    elapsed, code, cfg, directory = array('d'), array('i'), array('i'), array('i')
+    names = []
+    codes, configs, directories = _Labels(), _Labels(), _Labels()
+    # Tests in the same directory are usually adjacent, and there are far
+    # fewer directories than tests.
+    dir_cache: dict[str, int] = {}
+    for t in tests:
+      if isinstance(t, dict):
+        name, e, c, tc = t['name'], t.get('elapsed'), t['code'], t.get('config')
+      else:
+        name, e, c, tc = t.name, t.elapsed, t.code, t.config
+      names.append(name)
+      elapsed.append(e or 0.0)
+      code.append(codes(c))
+      cfg.append(configs(tc or config or name.split('::', 1)[0].strip()))
+      parent = name.rpartition('/')[0]
+      d = dir_cache.get(parent)
+      if d is None:
+        d = dir_cache[parent] = directories(directory_of(name, depth))
+      directory.append(d)
+    return cls(np.frombuffer(elapsed, dtype=np.float64) if elapsed else np.zeros(0),
+               np.frombuffer(code, dtype=np.intc) if code else np.zeros(0, np.intc),
+               np.frombuffer(cfg, dtype=np.intc) if cfg else np.zeros(0, np.intc),
+               np.frombuffer(directory, dtype=np.intc) if directory else np.zeros(0, np.intc),
+               names, codes.labels, configs.labels, directories.labels)
+
+  # Combine the columns of several results files into one.
+  @classmethod
+  def concat(cls, parts: list['TimingColumns']) -> 'TimingColumns':
+    merged = {k: _Labels() for k in ('code', 'config', 'directory')}
+    columns = {k: [] for k in merged}
+    for p in parts:
+      for k, labels in merged.items():
+        remap = np.array([labels(l) for l in p.labels[k]], dtype=np.intc)
+        columns[k].append(remap[getattr(p, k)] if len(remap) else getattr(p, k))
+    cat = lambda arrays, dtype: np.concatenate(arrays) if arrays else np.zeros(0, dtype)
+    return cls(cat([p.elapsed for p in parts], np.float64),
+               *(cat(columns[k], np.intc) for k in ('code', 'config', 'directory')),
+               [n for p in parts for n in p.names],
+               merged['code'].labels, merged['config'].labels, merged['directory'].labels)
+
+  @property
+  def total(self) -> float:
+    return float(self.elapsed.sum())
+
+  # The group index of every test and the group labels. `by` is 'code',
+  # 'config' or 'directory', or 'stage' with a mapping from configuration to
+  # stage (see stage_of()).
+  def groups(self, by: str, stages: Optional[dict[str, str]] = None) -> tuple[np.ndarray, list[str]]:
+    if by != 'stage':
+      return getattr(self, by), self.labels[by]
+    stage_labels = _Labels()
+    remap = np.array([stage_labels(stage_of(c, stages or {})) for c in self.labels['config']], dtype=np.intc)
+    return (remap[self.config] if len(remap) else self.config), stage_labels.labels
+
+  def group_totals(self, by: str, stages: Optional[dict[str, str]] = None) -> list[GroupTotal]:
+    idx, labels = self.groups(by, stages)
+    counts = np.bincount(idx, minlength=len(labels))
+    totals = np.bincount(idx, weights=self.elapsed, minlength=len(labels))
+    grand = totals.sum() or 1.0
+    order = np.argsort(-totals, kind='stable')
+    return [GroupTotal(labels[i], int(counts[i]), float(totals[i]), float(totals[i] / grand)) for i in order]
+
+  def percentiles(self, qs: Iterable[float] = PERCENTILES) -> tuple[float, ...]:
+    if not len(self):
+      return tuple(0.0 for _ in qs)
+    return tuple(float(v) for v in np.percentile(self.elapsed, list(qs)))
+
+  # Percentiles and a bucketed histogram of test times for each group.
+  def distribution(self, by: str, stages: Optional[dict[str, str]] = None,
+                   qs: Iterable[float] = PERCENTILES) -> list[Distribution]:
+    qs = list(qs)
+    idx, labels = self.groups(by, stages)
+    # Sort once by (group, elapsed) so every group is a contiguous sorted run.
+    order = np.lexsort((self.elapsed, idx))
+    elapsed, idx = self.elapsed[order], idx[order]
+    bounds = np.searchsorted(idx, np.arange(len(labels) + 1))
+    edges = np.concatenate(([0.0], BUCKETS))
+    result = []
+    for g, label in enumerate(labels):
+      e = elapsed[bounds[g]:bounds[g + 1]]
+      if not len(e):
+        continue
+      result.append(Distribution(label, len(e), float(e.sum()), tuple(float(v) for v in np.percentile(e, qs)),
+                                 float(e[-1]), tuple(int(n) for n in np.histogram(e, edges)[0])))
+    return sorted(result, key=lambda d: -d.total)
+
+  def slowest(self, n: int = 20) -> list[SlowTest]:
+    n = min(n, len(self))
+    if n <= 0:
+      return []
+    top = np.argpartition(-self.elapsed, n - 1)[:n]
+    top = top[np.argsort(-self.elapsed[top], kind='stable')]
+    return [SlowTest(self.names[i], self.labels['config'][self.config[i]], self.labels['code'][self.code[i]],
+                     float(self.elapsed[i])) for i in top]
+
+
+def _seconds(s: float) -> str:
+  if s >= 3600:
+    return f'{s / 3600:.1f}h'
+  if s >= 60:
+    return f'{s / 60:.1f}m'
+  return f'{s:.2f}s'
+
+
+def format_table(headers: list[str], rows: list[list[Any]], markdown: bool = False) -> str:
+  rows = [[str(c) for c in r] for r in rows]
+  if markdown:
+    lines = ['| ' + ' | '.join(headers) + ' |', '| --- |' + ' ---: |' * (len(headers) - 1)]
+    return '\n'.join(lines + ['| ' + ' | '.join(r) + ' |' for r in rows])
+  widths = [max(len(x) for x in col) for col in zip(headers, *rows)]
+  fmt = lambda r: '  '.join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(r, widths)))
+  return '\n'.join([fmt(headers)] + [fmt(r) for r in rows])
+
+
+# The tables printed by the CLI and written to the step summary.
+def render(columns: TimingColumns, top: int = 20, stages: Optional[dict[str, str]] = None,
+           markdown: bool = False) -> str:
+  qs = [f'p{q}' for q in PERCENTILES]
+  buckets = [f'<{_seconds(b)}' if b != np.inf else f'>={_seconds(BUCKETS[-2])}' for b in BUCKETS]
+  sections = []
+
+  def section(title, headers, rows):
+    sections.append((f'#### {title}' if markdown else title) + '\n\n' + format_table(headers, rows, markdown))
+
+  p = columns.percentiles()
+  section('Test time', ['tests', 'total'] + qs,
+          [[len(columns), _seconds(columns.total)] + [_seconds(v) for v in p]])
+  if stages:
+    section('By stage', ['stage', 'tests', 'total'] + qs + ['max'] + buckets,
+            [[d.label, d.count, _seconds(d.total)] + [_seconds(v) for v in d.percentiles] + [_seconds(d.max)] +
+             list(d.buckets) for d in columns.distribution('stage', stages)])
+  section('By configuration', ['configuration', 'tests', 'total', 'share'],
+          [[g.label, g.count, _seconds(g.total), f'{g.share:.1%}'] for g in columns.group_totals('config')])
+  section(f'Top {top} directories', ['directory', 'tests', 'total', 'share'],
+          [[g.label, g.count, _seconds(g.total), f'{g.share:.1%}'] for g in columns.group_totals('directory')[:top]])
+  section(f'Slowest {top} tests', ['test', 'configuration', 'result', 'elapsed'],
+          [[t.name, t.config, t.code, _seconds(t.elapsed)] for t in columns.slowest(top)])
+  return '\n\n'.join(sections) + '\n'
+
+
+def write_step_summary(text: str, path: Optional[str] = None):
+  from .workflow import WorkflowCommands
+  with WorkflowCommands(environ={'GITHUB_STEP_SUMMARY': path} if path else None) as wf:
+    wf.summary(text)
+
+
+def load(paths: list[Union[str, os.PathLike]], config: Optional[str] = None,
+         depth: int = DIRECTORY_DEPTH) -> TimingColumns:
+  from .aggregate import artifact_config, iter_artifact_tests
+  from .lit_results import read_results
+  parts = []
+  for path in map(Path, paths):
+    if path.is_dir() or path.suffix == '.zip':
+      tests, cfg = iter_artifact_tests(path, validate=False), config or artifact_config(path)
+    else:
+      tests, cfg = read_results(path, validate=False), config
+    parts.append(TimingColumns.from_tests(tests, cfg, depth))
+  return parts[0] if len(parts) == 1 else TimingColumns.concat(parts)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Where the time goes in lit results')
+  parser.add_argument('inputs', nargs='+', help='results.json files, or *-results artifacts (zip or directory)')
+  parser.add_argument('--config', default=None, help='configuration name for results without one')
+  parser.add_argument('--workflow', default=None,
+                      help='workflow whose matrix jobs give the stage of each configuration')
+  parser.add_argument('--top', type=int, default=20)
+  parser.add_argument('--depth', type=int, default=DIRECTORY_DEPTH, help='directory components to group by')
+  parser.add_argument('--step-summary', action='store_true', help='also write the tables to the step summary')
+  args = parser.parse_args(argv)
+
+  columns = load(args.inputs, args.config, args.depth)
+  stages = workflow_stages(args.workflow) if args.workflow else None
+  print(render(columns, args.top, stages))
+  if args.step_summary:
+    write_step_summary('### Test time\n\n' + render(columns, args.top, stages, markdown=True))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestTimingColumns(unittest.TestCase):
+  tests = [
+    {'code': 'PASS', 'elapsed': 1.0, 'name': 's :: std/containers/vector/a.pass.cpp', 'config': 'generic-cxx03-clang++-18'},
+    {'code': 'PASS', 'elapsed': 3.0, 'name': 's :: std/containers/map/b.pass.cpp', 'config': 'generic-cxx03-clang++-18'},
+    {'code': 'FAIL', 'elapsed': 120.0, 'name': 's :: std/ranges/c.pass.cpp', 'config': 'generic-msan'},
+    {'code': 'PASS', 'elapsed': 0.05, 'name': 's :: libcxx/d.compile.pass.cpp', 'config': 'generic-msan'},
+  ]
+
+  def test_columns(self):
+    columns = TimingColumns.from_tests(self.tests)
+    self.assertEqual(len(columns), 4)
+    self.assertAlmostEqual(columns.total, 124.05)
+    self.assertEqual(columns.group_totals('directory')[:2],
+                     [GroupTotal('std/ranges', 1, 120.0, 120.0 / 124.05), GroupTotal('std/containers', 2, 4.0, 4.0 / 124.05)])
+    self.assertEqual(columns.slowest(2), [SlowTest('s :: std/ranges/c.pass.cpp', 'generic-msan', 'FAIL', 120.0),
+                                          SlowTest('s :: std/containers/map/b.pass.cpp', 'generic-cxx03-clang++-18', 'PASS', 3.0)])
+    self.assertEqual(columns.percentiles([50]), (2.0,))
+
+    model = TimingColumns.from_tests([TestResult(output='', **t) for t in self.tests[:2]])
+    both = TimingColumns.concat([model, TimingColumns.from_tests(self.tests[2:])])
+    self.assertEqual([(g.label, g.count) for g in both.group_totals('config')],
+                     [('generic-msan', 2), ('generic-cxx03-clang++-18', 2)])
+    np.testing.assert_array_equal(both.elapsed, columns.elapsed)
+
+  def test_stages(self):
+    path = Path(__file__).resolve().parents[2] / '.github' / 'workflows' / 'callable.yaml'
+    stages = workflow_stages(path)
+    columns = TimingColumns.from_tests(self.tests)
+    [stage3, stage1] = columns.distribution('stage', stages)
+    self.assertEqual((stage3.label, stage3.count, stage3.max), ('stage3', 2, 120.0))
+    self.assertEqual(stage3.buckets, (1, 0, 0, 0, 1))
+    self.assertEqual(stage1.buckets, (0, 0, 2, 0, 0))
+    text = render(columns, top=2, stages=stages)
+    self.assertIn('stage3', text)
+    self.assertIn('| std/ranges | 1 | 2.0m | 96.7% |', render(columns, top=2, stages=stages, markdown=True))
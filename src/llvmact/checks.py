@@ -0,0 +1,175 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import requests
+from pydantic import BaseModel
+
+from .github_client import GitHubAPIError, GitHubClient
+from .instrument import get_instrumentation
+
+# The checks API rejects requests carrying more annotations than this.
+MAX_ANNOTATIONS_PER_REQUEST = 50
+
+
+class BatchReport(BaseModel):
+  index: int
+  annotations: int
+  attempts: int
+  latency: float
+
+
+def batched(items: Iterable[Any], n: int) -> Iterator[list[Any]]:
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) == n:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+# Uploads a check run and an arbitrary number of annotations to it.
+#
+# The check run is created once (carrying the first batch of annotations),
+# the remaining annotations are sent in batches of 50 through updates to the
+# run, and finally the run is completed. Updates are issued from a small pool
+# of threads sharing the GitHubClient's keep-alive session, and failed
+# requests are retried by the client: updates on rate limits and server
+# errors, creating the run only on rate limits.
+class CheckRunUploader:
+  def __init__(self, repo: str, token: Optional[str], api_url: str = 'https://api.github.com',
+               max_workers: int = 4, max_retries: int = 5, backoff: float = 1.0,
+               max_backoff: float = 60.0, session: Optional[requests.Session] = None,
+               sleep: Callable[[float], None] = time.sleep, client: Optional[GitHubClient] = None):
+    self.repo = repo
+    self.max_workers = max_workers
+    self.check_run_id: Optional[int] = None
+    self.reports: list[BatchReport] = []
+    self.client = client or GitHubClient(token, api_url, max_workers=max_workers, session=session,
+                                         max_retries=max_retries, backoff=backoff, max_backoff=max_backoff,
+                                         sleep=sleep)
+
+  def _request(self, method: str, path: str, body: dict[str, Any]) -> tuple[dict[str, Any], int]:
+    return self.client.request(method, f'/repos/{self.repo}/{path}', json=body)
+
+  def _output(self, title: str, summary: str, annotations: list[dict[str, Any]]) -> dict[str, Any]:
+    output = {'title': title, 'summary': summary}
+    if annotations:
+      output['annotations'] = annotations
+    return output
+
+  def create(self, name: str, head_sha: str, title: str, summary: str,
+             annotations: Optional[list[dict[str, Any]]] = None) -> int:
+    annotations = annotations or []
+    start = time.perf_counter()
+    run, attempts = self._request('POST', 'check-runs', {
+      'name': name,
+      'head_sha': head_sha,
+      'status': 'in_progress',
+      'output': self._output(title, summary, annotations),
+    })
+    report = BatchReport(index=0, annotations=len(annotations), attempts=attempts,
+                         latency=time.perf_counter() - start)
+    self.reports.append(report)
+    inst = get_instrumentation()
+    inst.observe('upload.batch_latency', report.latency)
+    inst.count('upload.annotations', len(annotations))
+    self.check_run_id = run['id']
+    return self.check_run_id
+
+  def _send_batch(self, index: int, batch: list[dict[str, Any]], title: str, summary: str) -> BatchReport:
+    start = time.perf_counter()
+    _, attempts = self._request('PATCH', f'check-runs/{self.check_run_id}',
+                                {'output': self._output(title, summary, batch)})
+    report = BatchReport(index=index, annotations=len(batch), attempts=attempts,
+                         latency=time.perf_counter() - start)
+    inst = get_instrumentation()
+    inst.observe('upload.batch_latency', report.latency)
+    inst.count('upload.annotations', len(batch))
+    return report
+
+  def upload(self, annotations: Iterable[dict[str, Any]], title: str, summary: str) -> list[BatchReport]:
+    assert self.check_run_id is not None, 'create() must be called first'
+    first = len(self.reports)
+    batches = batched(annotations, MAX_ANNOTATIONS_PER_REQUEST)
+    with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+      futures = [pool.submit(self._send_batch, first + i, b, title, summary) for i, b in enumerate(batches)]
+      reports = [f.result() for f in futures]
+    self.reports.extend(reports)
+    return reports
+
+  def complete(self, conclusion: str, title: str, summary: str) -> dict[str, Any]:
+    run, _ = self._request('PATCH', f'check-runs/{self.check_run_id}', {
+      'status': 'completed',
+      'conclusion': conclusion,
+      'output': self._output(title, summary, []),
+    })
+    return run
+
+  def publish(self, name: str, head_sha: str, conclusion: str, title: str, summary: str,
+              annotations: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    batches = batched(annotations, MAX_ANNOTATIONS_PER_REQUEST)
+    self.create(name, head_sha, title, summary, next(batches, []))
+    self.upload((a for b in batches for a in b), title, summary)
+    return self.complete(conclusion, title, summary)
+
+
+import unittest
+
+class TestCheckRunUploader(unittest.TestCase):
+  def make_annotations(self, n):
+    return [{'path': f'libcxx/test/t{i}.pass.cpp', 'start_line': 1, 'end_line': 1,
+             'annotation_level': 'failure', 'message': f'Test {i} FAILED', 'title': 'Test Failure'}
+            for i in range(n)]
+
+  def test_publish_batches(self):
+    from .fake_github import FakeGitHub
+    with FakeGitHub() as gh:
+      uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url, sleep=lambda s: None)
+      run = uploader.publish('Libc++ Test Suite', 'abc', 'failure', 'title', 'summary',
+                             self.make_annotations(175))
+      self.assertEqual(run['status'], 'completed')
+      self.assertEqual(run['conclusion'], 'failure')
+      annotations = gh.check_runs[run['id']]['annotations']
+      self.assertEqual(sorted(a['message'] for a in annotations),
+                       sorted(f'Test {i} FAILED' for i in range(175)))
+      self.assertEqual([r.annotations for r in uploader.reports], [50, 50, 50, 25])
+      self.assertEqual([m for m, _ in gh.requests], ['POST'] + ['PATCH'] * 4)
+
+  def test_retries_rate_limit(self):
+    from .fake_github import FakeGitHub
+    delays = []
+    with FakeGitHub() as gh:
+      uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url, sleep=delays.append)
+      uploader.create('Libc++ Test Suite', 'abc', 'title', 'summary')
+      gh.fail_next = [(429, {'Retry-After': '3'}), (502, {})]
+      reports = uploader.upload(self.make_annotations(10), 'title', 'summary')
+      self.assertEqual(reports[0].attempts, 3)
+      self.assertEqual(delays, [3.0, 2.0])
+      self.assertEqual(len(gh.check_runs[uploader.check_run_id]['annotations']), 10)
+
+  def test_gives_up(self):
+    from .fake_github import FakeGitHub
+    with FakeGitHub() as gh:
+      uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url, max_retries=1, sleep=lambda s: None)
+      uploader.create('Libc++ Test Suite', 'abc', 'title', 'summary')
+      gh.fail_next = [(500, {}), (500, {})]
+      with self.assertRaises(GitHubAPIError):
+        uploader.complete('success', 'title', 'summary')
+      self.assertEqual([m for m, _ in gh.requests], ['POST'] + ['PATCH'] * 2)
+
+  def test_create_retries_only_rate_limits(self):
+    from .fake_github import FakeGitHub
+    delays = []
+    with FakeGitHub() as gh:
+      uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url, sleep=delays.append)
+      gh.fail_next = [(502, {})]
+      with self.assertRaises(GitHubAPIError):
+        uploader.create('Libc++ Test Suite', 'abc', 'title', 'summary')
+      self.assertEqual((len(gh.requests), delays), (1, []))
+      gh.fail_next = [(429, {'Retry-After': '3'})]
+      uploader.create('Libc++ Test Suite', 'abc', 'title', 'summary')
+      self.assertEqual(delays, [3.0])
+      self.assertEqual(len(gh.check_runs), 1)
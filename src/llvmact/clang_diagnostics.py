@@ -0,0 +1,156 @@
+import re
+from typing import Iterable, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+Severity = Literal['fatal error', 'error', 'warning', 'note', 'remark']
+
+_diag_re = re.compile(
+  r'^(?:(?P<file>[^\s:][^:]*?|[A-Za-z]:[^:]*?):(?P<line>\d+):(?:(?P<column>\d+):)? |(?P<tool>[\w.+-]+): )?'
+  r'(?P<severity>fatal error|error|warning|note|remark): (?P<text>.*)$')
+_include_re = re.compile(r'^(?:In file included from|\s+from) (?P<file>.+):(?P<line>\d+):$')
+_generated_re = re.compile(
+  r'^(?:(?P<warnings>\d+) warnings?(?: and )?)?(?:(?P<errors>\d+) errors?)? generated\.$')
+
+
+class IncludeLocation(BaseModel):
+  file: str
+  line: int
+
+
+class Diagnostic(BaseModel):
+  severity: Severity
+  text: str
+  file: Optional[str] = None
+  line: Optional[int] = None
+  column: Optional[int] = None
+  # Where the file containing the diagnostic was included from, innermost
+  # first, as printed by clang before the diagnostic.
+  include_stack: list[IncludeLocation] = Field(default_factory=list)
+  # The source line and caret lines printed after the diagnostic.
+  snippet: list[str] = Field(default_factory=list)
+  notes: list['Diagnostic'] = Field(default_factory=list)
+
+  @property
+  def location(self) -> str:
+    if self.file is None:
+      return ''
+    loc = f'{self.file}:{self.line}'
+    if self.column is not None:
+      loc += f':{self.column}'
+    return loc
+
+  def render(self, notes: bool = True, snippet: bool = True) -> str:
+    lines = [f'In file included from {inc.file}:{inc.line}:' for inc in self.include_stack]
+    loc = self.location
+    lines.append(f'{loc + ": " if loc else ""}{self.severity}: {self.text}')
+    if snippet:
+      lines += self.snippet
+    if notes:
+      lines += [n.render(notes=False, snippet=snippet) for n in self.notes]
+    return '\n'.join(lines)
+
+
+class DiagnosticReport(BaseModel):
+  diagnostics: list[Diagnostic] = Field(default_factory=list)
+  # From the trailing 'N errors generated.' line, when there is one.
+  errors_generated: Optional[int] = None
+  warnings_generated: Optional[int] = None
+
+  @property
+  def errors(self) -> list[Diagnostic]:
+    return [d for d in self.diagnostics if d.severity in ('error', 'fatal error')]
+
+
+# Parse the diagnostics clang printed to stderr into a tree, in a single pass
+# over the lines.
+#
+# Each error, warning or remark becomes a top level Diagnostic and the notes
+# which follow it are attached to it. 'In file included from' chains are
+# attached to the diagnostic that follows them, and any other lines (the
+# source snippet and caret line) to the diagnostic or note they follow.
+def parse_diagnostics(stderr: Union[str, Iterable[str]]) -> DiagnosticReport:
+  lines = stderr.splitlines() if isinstance(stderr, str) else stderr
+  report = DiagnosticReport()
+  diagnostics = report.diagnostics
+  current: Optional[Diagnostic] = None   # Receives notes.
+  last: Optional[Diagnostic] = None      # Receives snippet lines.
+  includes: list[IncludeLocation] = []
+
+  for ln in lines:
+    # Cheap filter, every line we care about other than snippets has a colon
+    # followed by a space or ends in one.
+    if ': ' not in ln and not ln.endswith(':') and not ln.endswith('generated.'):
+      if last is not None:
+        last.snippet.append(ln)
+      continue
+
+    if m := _diag_re.match(ln):
+      line, column = m.group('line'), m.group('column')
+      d = Diagnostic.model_construct(
+        severity=m.group('severity'), text=m.group('text'), file=m.group('file'),
+        line=int(line) if line else None, column=int(column) if column else None,
+        include_stack=includes, snippet=[], notes=[])
+      includes = []
+      if d.severity == 'note' and current is not None:
+        current.notes.append(d)
+      else:
+        diagnostics.append(d)
+        current = d if d.severity != 'note' else None
+      last = d
+      continue
+
+    if m := _include_re.match(ln):
+      includes.append(IncludeLocation.model_construct(file=m.group('file'), line=int(m.group('line'))))
+      last = None
+      continue
+
+    if ln.endswith('generated.') and (m := _generated_re.match(ln)):
+      if m.group('errors'):
+        report.errors_generated = int(m.group('errors'))
+      if m.group('warnings'):
+        report.warnings_generated = int(m.group('warnings'))
+      current = last = None
+      continue
+
+    if last is not None:
+      last.snippet.append(ln)
+
+  return report
+
+
+import unittest
+
+class TestParseDiagnostics(unittest.TestCase):
+  stderr = '''In file included from /src/libcxx/test/std/foo.pass.cpp:3:
+In file included from /build/include/c++/v1/vector:10:
+/build/include/c++/v1/__vector/vector.h:42:7: error: no viable overloaded '+='
+   42 |     S += V;
+      |     ~ ^  ~
+/src/libcxx/test/std/foo.pass.cpp:12:5: note: in instantiation of function template specialization 'foo<int>' requested here
+   12 |     foo(s, v);
+      |     ^
+/build/include/c++/v1/string:1216:71: note: candidate function not viable
+/src/libcxx/test/std/foo.pass.cpp:20:1: warning: unused variable 'x' [-Wunused-variable]
+clang++: error: linker command failed with exit code 1
+1 warning and 2 errors generated.'''
+
+  def test_tree(self):
+    report = parse_diagnostics(self.stderr)
+    self.assertEqual([d.severity for d in report.diagnostics], ['error', 'warning', 'error'])
+    err = report.diagnostics[0]
+    self.assertEqual((err.file, err.line, err.column), ('/build/include/c++/v1/__vector/vector.h', 42, 7))
+    self.assertEqual(err.text, "no viable overloaded '+='")
+    self.assertEqual([i.line for i in err.include_stack], [3, 10])
+    self.assertEqual(len(err.snippet), 2)
+    self.assertEqual([n.line for n in err.notes], [12, 1216])
+    self.assertEqual(len(err.notes[0].snippet), 2)
+    self.assertEqual(report.diagnostics[2].file, None)
+    self.assertEqual(report.diagnostics[2].text, 'linker command failed with exit code 1')
+    self.assertEqual((report.errors_generated, report.warnings_generated), (2, 1))
+    self.assertEqual(len(report.errors), 2)
+    self.assertIn('note: candidate function not viable', err.render())
+
+  def test_assertion_is_not_a_diagnostic(self):
+    report = parse_diagnostics("t.tmp.exe: /src/foo.pass.cpp:4: int main(): Assertion `false' failed.")
+    self.assertEqual(report.diagnostics, [])
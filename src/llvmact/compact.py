@@ -0,0 +1,168 @@
+import re
+import sys
+from typing import Optional, Union
+
+from .clang_diagnostics import Diagnostic
+from .libcxx_test_parser import (ClangError, CommandBlock, ExecutedCommandBlock, LibcxxTestOutput,
+                                 StatusBlock, TEST_CASES, parse_test_output)
+
+# Command line arguments which name something specific to a single test: the
+# test source itself, or a file in its Output directory.
+_per_test_arg_re = re.compile(r'/Output/|\.(?:pass|fail|verify|compile|link|sh|gen)\.')
+
+
+# Interns command lines. Every command is split into a template, which is the
+# command with the test specific arguments replaced by holes, and the values
+# for those holes. Within a configuration nearly every compile command shares
+# a template, so each one only costs a handful of references.
+class CommandTable:
+  def __init__(self):
+    self.templates: list[tuple[Optional[str], ...]] = []
+    self._ids: dict[tuple[Optional[str], ...], int] = {}
+
+  def __len__(self):
+    return len(self.templates)
+
+  def intern(self, command: str) -> 'CompactCommand':
+    template = []
+    args = []
+    for part in command.split(' '):
+      if _per_test_arg_re.search(part):
+        template.append(None)
+        args.append(sys.intern(part))
+      else:
+        template.append(part)
+    template = tuple(template)
+    tid = self._ids.get(template)
+    if tid is None:
+      tid = self._ids[template] = len(self.templates)
+      self.templates.append(tuple(sys.intern(p) if p is not None else None for p in template))
+    return CompactCommand(self, tid, tuple(args))
+
+  def expand(self, template_id: int, args: tuple[str, ...]) -> str:
+    it = iter(args)
+    return ' '.join([p if p is not None else next(it) for p in self.templates[template_id]])
+
+  def compact(self, output: LibcxxTestOutput) -> 'CompactTestOutput':
+    blocks = []
+    for b in output.Output:
+      if isinstance(b, ExecutedCommandBlock):
+        blocks.append(CompactExecutedCommand(self.intern(b.command), b.stdout, b.stderr,
+                                             sys.intern(b.error_message) if b.error_message else None))
+      elif isinstance(b, CommandBlock):
+        blocks.append(CompactCommandBlock(sys.intern(b.header), self.intern(b.body)))
+      elif isinstance(b, StatusBlock):
+        blocks.append(CompactStatusBlock(b.exit_code, sys.intern(b.stdout)))
+      else:
+        blocks.append(sys.intern(b))
+    errors = tuple((sys.intern(e.file), e.line, e.column, e.text) for e in output.clang_errors)
+    return CompactTestOutput(tuple(blocks), errors, tuple(output.diagnostics))
+
+
+# A command line stored as a reference to its template plus the test specific
+# arguments. The full string is only rebuilt when `text` is read.
+class CompactCommand:
+  __slots__ = ('table', 'template_id', 'args')
+
+  def __init__(self, table: CommandTable, template_id: int, args: tuple[str, ...]):
+    self.table = table
+    self.template_id = template_id
+    self.args = args
+
+  @property
+  def text(self) -> str:
+    return self.table.expand(self.template_id, self.args)
+
+  def __str__(self):
+    return self.text
+
+  def __eq__(self, other):
+    if isinstance(other, CompactCommand):
+      if other.table is self.table:
+        return self.template_id == other.template_id and self.args == other.args
+      return self.text == other.text
+    return NotImplemented
+
+  def __hash__(self):
+    return hash(self.text)
+
+
+class CompactExecutedCommand:
+  __slots__ = ('command', 'stdout', 'stderr', 'error_message')
+
+  def __init__(self, command: CompactCommand, stdout: Optional[str], stderr: Optional[str], error_message: Optional[str]):
+    self.command = command
+    self.stdout = stdout
+    self.stderr = stderr
+    self.error_message = error_message
+
+  def to_model(self) -> ExecutedCommandBlock:
+    return ExecutedCommandBlock(command=self.command.text, stdout=self.stdout, stderr=self.stderr,
+                                error_message=self.error_message)
+
+
+class CompactCommandBlock:
+  __slots__ = ('header', 'body')
+
+  def __init__(self, header: str, body: CompactCommand):
+    self.header = header
+    self.body = body
+
+  def to_model(self) -> CommandBlock:
+    return CommandBlock(header=self.header, body=self.body.text)
+
+
+class CompactStatusBlock:
+  __slots__ = ('exit_code', 'stdout')
+
+  def __init__(self, exit_code: int, stdout: str):
+    self.exit_code = exit_code
+    self.stdout = stdout
+
+  def to_model(self) -> StatusBlock:
+    return StatusBlock(exit_code=self.exit_code, stdout=self.stdout)
+
+
+CompactBlock = Union[CompactStatusBlock, CompactExecutedCommand, CompactCommandBlock, str]
+
+
+# The compact counterpart of LibcxxTestOutput, which is what aggregate holds
+# for every failure of every configuration. Clang errors are kept as plain
+# (file, line, column, text) tuples. It has the clang_errors and diagnostics
+# Report.add_failure() reads, so it can be reported without to_model().
+class CompactTestOutput:
+  __slots__ = ('blocks', 'clang_errors', 'diagnostics')
+
+  def __init__(self, blocks: tuple[CompactBlock, ...], clang_errors: tuple[tuple[str, int, int, str], ...],
+               diagnostics: tuple[Diagnostic, ...] = ()):
+    self.blocks = blocks
+    self.clang_errors = clang_errors
+    self.diagnostics = diagnostics
+
+  def to_model(self) -> LibcxxTestOutput:
+    return LibcxxTestOutput(
+      Output=[b if isinstance(b, str) else b.to_model() for b in self.blocks],
+      clang_errors=[ClangError(file=f, line=l, column=c, text=t) for f, l, c, t in self.clang_errors],
+      diagnostics=list(self.diagnostics))
+
+
+import unittest
+
+class TestCompact(unittest.TestCase):
+  def test_round_trip(self):
+    table = CommandTable()
+    for t in TEST_CASES:
+      parsed = parse_test_output(t, cache=False)
+      self.assertEqual(table.compact(parsed).to_model(), parsed)
+
+  def test_shared_templates(self):
+    table = CommandTable()
+    compacted = [table.compact(parse_test_output(t, cache=False)) for t in TEST_CASES]
+    # Every example shares the same compile and run templates. The commands
+    # under '# COMPILED WITH' and '# EXECUTED AS' differ from the executed
+    # ones in spacing, so there are two of each.
+    self.assertEqual(len(table), 4)
+    cmd = compacted[0].blocks[2].command
+    self.assertEqual(len(cmd.args), 2)
+    self.assertIn('runs.pass.cpp', cmd.args[0])
+    self.assertEqual(compacted[1].blocks[2].command.template_id, cmd.template_id)
@@ -0,0 +1,139 @@
+import re
+from typing import Any, Iterable, NamedTuple, Optional
+
+from pydantic import BaseModel, Field
+
+from .clang_diagnostics import Diagnostic
+from .libcxx_test_parser import ClangError
+
+# Installed headers live under <build>/.../include/c++/v1, map them back to
+# the source tree so that every build directory produces the same path.
+_installed_header_re = re.compile(r'^(?:.*/)?include/c\+\+/v1/(?P<REST>.*)$')
+_source_path_re = re.compile(r'^(?:.*?/)?(?P<REST>(?:libcxx|libcxxabi|libunwind|runtimes)/.*)$')
+
+
+def normalize_path(path: str) -> str:
+  path = path.strip().replace('\\', '/')
+  if m := _installed_header_re.match(path):
+    return 'libcxx/include/' + m.group('REST')
+  if m := _source_path_re.match(path):
+    return m.group('REST')
+  return path
+
+
+class DiagnosticKey(NamedTuple):
+  file: str
+  line: int
+  column: int
+  text: str
+
+
+class DiagnosticGroup(BaseModel):
+  file: str
+  line: int
+  column: int
+  text: str
+  tests: set[str] = Field(default_factory=set)
+  configs: set[str] = Field(default_factory=set)
+  # The full diagnostic (with notes) from the first test that hit it.
+  rendered: Optional[str] = None
+
+
+# Groups clang diagnostics from many tests (and configurations) by where they
+# point and what they say, so a single broken header is reported once rather
+# than once per test which includes it.
+class DiagnosticIndex:
+  def __init__(self):
+    self.groups: dict[DiagnosticKey, DiagnosticGroup] = {}
+
+  def __len__(self):
+    return len(self.groups)
+
+  def _group(self, test: str, config: Optional[str], file: str, line: int, column: int, text: str) -> DiagnosticGroup:
+    key = DiagnosticKey(normalize_path(file), line, column, text.strip())
+    group = self.groups.get(key)
+    if group is None:
+      group = self.groups[key] = DiagnosticGroup(**key._asdict())
+    group.tests.add(test)
+    if config is not None:
+      group.configs.add(config)
+    return group
+
+  def add(self, test: str, config: Optional[str], errors: Iterable[ClangError]):
+    for e in errors:
+      self._group(test, config, e.file, e.line, e.column, e.text)
+
+  # Like add(), but takes the diagnostic tree so the notes can be reported.
+  def add_diagnostics(self, test: str, config: Optional[str], diagnostics: Iterable[Diagnostic]):
+    for d in diagnostics:
+      if d.severity not in ('error', 'fatal error') or d.file is None:
+        continue
+      group = self._group(test, config, d.file, d.line, d.column or 0, d.text)
+      if group.rendered is None:
+        group.rendered = d.render()
+
+  # Groups ordered by how many tests hit them, most first.
+  def sorted_groups(self) -> list[DiagnosticGroup]:
+    return sorted(self.groups.values(), key=lambda g: (-len(g.tests), g.file, g.line, g.column))
+
+  def annotation(self, g: DiagnosticGroup, max_tests: int = 50, details_budget: Optional[int] = None) -> dict[str, Any]:
+    from .failure_summary import DETAILS_BUDGET, truncate
+    tests = sorted(g.tests)
+    details = '\n'.join(tests[:max_tests])
+    if len(tests) > max_tests:
+      details += f'\n... and {len(tests) - max_tests} more'
+    if g.configs:
+      details = f"Configurations: {', '.join(sorted(g.configs))}\n\n" + details
+    if g.rendered:
+      details = g.rendered + '\n\n' + details
+    title = f'Error in {len(tests)} test{"s" if len(tests) != 1 else ""}'
+    if len(g.configs) > 1:
+      title += f' across {len(g.configs)} configurations'
+    return {
+      'path': g.file,
+      'start_line': g.line,
+      'end_line': g.line,
+      'annotation_level': 'failure',
+      'message': g.text,
+      'raw_details': truncate(details, details_budget or DETAILS_BUDGET),
+      'title': title,
+    }
+
+  def annotations(self, max_tests: int = 50, details_budget: Optional[int] = None) -> list[dict[str, Any]]:
+    return [self.annotation(g, max_tests, details_budget) for g in self.sorted_groups()]
+
+import unittest
+
+class TestDiagnosticIndex(unittest.TestCase):
+  def test_normalize_path(self):
+    self.assertEqual(normalize_path('/home/eric/llvm-project/build/libcxx/include/c++/v1/string'),
+                     'libcxx/include/string')
+    self.assertEqual(normalize_path('/build/generic-cxx23/include/c++/v1/__ranges/view.h'),
+                     'libcxx/include/__ranges/view.h')
+    self.assertEqual(normalize_path('/home/eric/llvm-project/libcxx/test/libcxx/foo.pass.cpp'),
+                     'libcxx/test/libcxx/foo.pass.cpp')
+    self.assertEqual(normalize_path('foo.cpp'), 'foo.cpp')
+
+  def test_group(self):
+    index = DiagnosticIndex()
+    err = lambda root: ClangError(file=f'{root}/include/c++/v1/vector', line=10, column=3, text='bad')
+    index.add('a.pass.cpp', 'generic-cxx20', [err('/b1'), err('/b1')])
+    index.add('b.pass.cpp', 'generic-cxx23', [err('/b2')])
+    index.add('b.pass.cpp', 'generic-cxx23', [ClangError(file='/x/libcxx/test/b.pass.cpp', line=1, column=1, text='other')])
+    self.assertEqual(len(index), 2)
+    top = index.sorted_groups()[0]
+    self.assertEqual(top.file, 'libcxx/include/vector')
+    self.assertEqual(top.tests, {'a.pass.cpp', 'b.pass.cpp'})
+    self.assertEqual(top.configs, {'generic-cxx20', 'generic-cxx23'})
+    annotations = index.annotations()
+    self.assertEqual(annotations[0]['title'], 'Error in 2 tests across 2 configurations')
+    self.assertEqual(annotations[0]['start_line'], 10)
+
+  def test_add_diagnostics(self):
+    from .libcxx_test_parser import TEST_CASES, parse_test_output
+    parsed = parse_test_output(TEST_CASES[2], cache=False)
+    index = DiagnosticIndex()
+    index.add_diagnostics('fails-to-compile.pass.cpp', None, parsed.diagnostics)
+    [annotation] = index.annotations()
+    self.assertEqual(annotation['path'], 'libcxx/test/std/example/fails-to-compile.pass.cpp')
+    self.assertIn('note: candidate template ignored', annotation['raw_details'])
@@ -0,0 +1,182 @@
+import io
+import re
+from typing import Iterable, NamedTuple, Optional, Union
+
+from .clang_diagnostics import _diag_re, _include_re
+from .diagnostic_index import normalize_path
+from .libcxx_test_parser import TokenKind, classify_line
+
+# Cuts a failing test's output down to what's worth reading in an annotation.
+#
+# Failures which blow up in a template can print megabytes of `# | ` stderr,
+# and GitHub refuses annotation details over 64 KB. The summary is built in a
+# single pass over the lines, holding on to no more than the budget, and keeps:
+#
+#   - the exit code,
+#   - the command that failed and its `# error:` trailer,
+#   - the first error from its stderr with the notes and snippets that follow
+#     it, or without any error, the first lines of its stderr,
+#
+# and says how many lines it left out. It also finds where the failure
+# points: the first error's file and line, or the first `file:line` in the
+# stderr under the source tree (such as a failed assertion).
+
+# Bytes of annotation details allowed by default, well below GitHub's limit.
+DETAILS_BUDGET = 16 * 1024
+
+# Lines of stderr kept when there's no error to show.
+HEAD_LINES = 20
+
+# Commands are long (every flag of the compiler), so only this much is kept.
+COMMAND_BUDGET = 1024
+
+_location_re = re.compile(r'(?P<file>[\w./+-]+\.\w+):(?P<line>\d+)\b')
+
+
+class FailureSummary(NamedTuple):
+  text: str
+  # Where the failure points, relative to the source tree, when known.
+  file: Optional[str] = None
+  line: Optional[int] = None
+  omitted: int = 0
+
+
+def _clip(text: str, budget: int) -> str:
+  data = text.encode('utf-8')
+  if len(data) <= budget:
+    return text
+  return data[:max(budget - 3, 0)].decode('utf-8', 'ignore') + '...'
+
+
+# The first `budget` bytes of `text`, cut at a line, noting what was cut.
+def truncate(text: str, budget: int = DETAILS_BUDGET) -> str:
+  if len(text.encode('utf-8')) <= budget:
+    return text
+  note = '\n... {} more lines omitted'
+  clipped = _clip(text, budget - len(note) - 8)
+  cut = clipped.rfind('\n')
+  kept = clipped[:cut] if cut > 0 else clipped
+  return kept + note.format(text.count('\n') - kept.count('\n'))
+
+
+def _source_location(file: str, line: str) -> Optional[tuple[str, int]]:
+  path = normalize_path(file)
+  if path == file.strip() and not path.startswith(('libcxx/', 'libcxxabi/', 'libunwind/', 'runtimes/')):
+    return None
+  return path, int(line)
+
+
+def summarize_failure(output: Union[str, Iterable[str]], budget: int = DETAILS_BUDGET) -> FailureSummary:
+  lines = io.StringIO(output) if isinstance(output, str) else output
+  exit_code = None
+  command = None          # The last command run, until one fails.
+  failed = None           # (command, trailer) of the first failure.
+  chain: list[str] = []   # The first error, its include stack and notes.
+  head: list[str] = []    # The start of the last command's stderr.
+  includes: list[str] = []
+  in_chain = done = False
+  size = 0
+  omitted = 0
+  location = fallback = None
+
+  for ln in lines:
+    tok = classify_line(ln.rstrip('\r\n'))
+    if tok.kind is TokenKind.STATUS and exit_code is None:
+      exit_code = tok.value
+    elif tok.kind is TokenKind.EXECUTED_COMMAND and failed is None:
+      command = tok.value
+      if not chain:
+        omitted += len(head)
+        head = []
+    elif tok.kind is TokenKind.ERROR and failed is None:
+      failed = (command, tok.value)
+    elif tok.kind is TokenKind.PAYLOAD:
+      payload = tok.value
+      if done:
+        omitted += 1
+        continue
+      m = _diag_re.match(payload)
+      if m is not None and m.group('severity') != 'note' and in_chain:
+        # The next diagnostic: the chain is complete.
+        done = True
+        omitted += 1
+        continue
+      if m is not None and m.group('severity') in ('error', 'fatal error'):
+        in_chain = True
+        chain = includes
+        size = sum(len(i) + 1 for i in chain)
+        if m.group('file'):
+          location = _source_location(m.group('file'), m.group('line'))
+      includes = includes + [payload] if _include_re.match(payload) else []
+      if in_chain:
+        if size + len(payload) + 1 > budget:
+          omitted += 1
+        else:
+          chain.append(payload)
+          size += len(payload) + 1
+        continue
+      if fallback is None and (loc := _location_re.search(payload)):
+        fallback = _source_location(loc.group('file'), loc.group('line'))
+      if len(head) < HEAD_LINES:
+        head.append(payload)
+      else:
+        omitted += 1
+
+  if chain:
+    omitted += len(head)
+  parts = []
+  if exit_code is not None:
+    parts.append(f'Exit Code: {exit_code}')
+  cmd, trailer = failed if failed is not None else (command, None)
+  if cmd:
+    parts.append(f'Command: {_clip(cmd, COMMAND_BUDGET)}')
+  tail = []
+  if omitted:
+    tail.append(f'... {omitted} more lines omitted')
+  if trailer:
+    tail.append(f'error: {trailer}')
+  # Whatever the budget, the exit status and trailer are kept and the body
+  # gives way.
+  fixed = len('\n'.join(parts + tail).encode('utf-8')) + 2
+  body = '\n'.join(chain or head)
+  if body:
+    parts.append(truncate(body, max(budget - fixed, 0)))
+  file, line = location or fallback or (None, None)
+  return FailureSummary(_clip('\n'.join(parts + tail), budget), file, line, omitted)
+
+
+import unittest
+
+class TestFailureSummary(unittest.TestCase):
+  def test_compile_error(self):
+    from .libcxx_test_parser import TEST_CASES
+    output = TEST_CASES[2]
+    s = summarize_failure(output)
+    self.assertEqual((s.file, s.line), ('libcxx/test/std/example/fails-to-compile.pass.cpp', 6))
+    self.assertTrue(s.text.startswith('Exit Code: 1\nCommand: /usr/local/bin/clang++'))
+    self.assertIn("error: no viable overloaded '+='", s.text)
+    self.assertIn('note: candidate template ignored', s.text)
+    self.assertTrue(s.text.endswith('error: command failed with exit status: 1'))
+
+  def test_assertion(self):
+    from .libcxx_test_parser import TEST_CASES
+    s = summarize_failure(TEST_CASES[1])
+    self.assertEqual((s.file, s.line), ('libcxx/test/std/example/fails-to-run.pass.cpp', 4))
+    self.assertIn("Assertion `false", s.text)
+    self.assertIn('error: command failed with exit status: 250', s.text)
+
+  def test_budget(self):
+    note = "# | /src/libcxx/include/vector:10:3: note: in instantiation of 'std::vector<" + 'T' * 200 + ">'\n"
+    output = ('Exit Code: 1\n\nCommand Output (stdout):\n--\n# executed command: clang++ t.pass.cpp\n'
+              '# .---command stderr------------\n'
+              '# | /src/libcxx/test/t.pass.cpp:3:1: error: boom\n' + note * 20000 +
+              '# | /src/libcxx/test/t.pass.cpp:9:1: error: second\n' + '# | more\n' * 100 +
+              '# `-----------------------------\n# error: command failed with exit status: 1\n--\n')
+    s = summarize_failure(output, budget=4096)
+    self.assertLessEqual(len(s.text.encode()), 4096)
+    self.assertIn('error: boom', s.text)
+    self.assertNotIn('second', s.text)
+    self.assertGreater(s.omitted, 19000)
+    self.assertIn(f'... {s.omitted} more lines omitted', s.text)
+    self.assertTrue(s.text.endswith('exit status: 1'))
+    self.assertEqual((s.file, s.line), ('libcxx/test/t.pass.cpp', 3))
@@ -0,0 +1,119 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+from .checks import MAX_ANNOTATIONS_PER_REQUEST
+
+
+# A stand-in for the parts of the GitHub REST API used by llvmact, served
+# over HTTP on localhost so the real clients can be exercised in tests.
+#
+#   with FakeGitHub() as gh:
+#     uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url)
+#
+# `check_runs` maps a check run id to its state, with every annotation it has
+# received collected in `annotations`. `requests` records (method, path) for
+# each request, and `fail_next` can be used to inject error responses: each
+# entry is a (status, headers) pair returned instead of handling the next
+# request.
+class FakeGitHub:
+  def __init__(self):
+    self.check_runs: dict[int, dict[str, Any]] = {}
+    self.requests: list[tuple[str, str]] = []
+    self.fail_next: list[tuple[int, dict[str, str]]] = []
+    self.routes: list[tuple[str, str, Callable]] = []
+    self.lock = threading.Lock()
+    self._next_id = 1
+    self._server: Optional[ThreadingHTTPServer] = None
+    self._thread: Optional[threading.Thread] = None
+
+  @property
+  def url(self) -> str:
+    host, port = self._server.server_address[:2]
+    return f'http://{host}:{port}'
+
+  def __enter__(self):
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def log_message(self, *args):
+        pass
+
+      def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        with fake.lock:
+          fake.requests.append((self.command, self.path))
+          failure = fake.fail_next.pop(0) if fake.fail_next else None
+        if failure is not None:
+          status, headers, payload = failure[0], failure[1], {'message': 'injected failure'}
+        else:
+          status, headers, payload = fake.dispatch(self.command, self.path, body, self.headers)
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        for k, v in headers.items():
+          self.send_header(k, v)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      do_GET = do_POST = do_PATCH = _handle
+
+    self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self._server.shutdown()
+    self._server.server_close()
+    self._thread.join()
+
+  # Register a handler for `method` requests whose path starts with `prefix`.
+  # The handler is called with (path, body, headers) and returns
+  # (status, headers, payload).
+  def route(self, method: str, prefix: str, handler: Callable):
+    self.routes.append((method, prefix, handler))
+
+  def dispatch(self, method, path, body, headers):
+    for m, prefix, handler in self.routes:
+      if m == method and path.startswith(prefix):
+        return handler(path, body, headers)
+    parts = path.strip('/').split('/')
+    if len(parts) == 4 and parts[0] == 'repos' and parts[3] == 'check-runs' and method == 'POST':
+      return self._create_check_run(body)
+    if len(parts) == 5 and parts[0] == 'repos' and parts[3] == 'check-runs' and method == 'PATCH':
+      return self._update_check_run(int(parts[4]), body)
+    return 404, {}, {'message': 'Not Found'}
+
+  def _apply_output(self, run, body):
+    output = body.get('output') or {}
+    annotations = output.get('annotations') or []
+    if len(annotations) > MAX_ANNOTATIONS_PER_REQUEST:
+      return False
+    run['annotations'].extend(annotations)
+    for k, v in body.items():
+      if k != 'output':
+        run[k] = v
+    run['output'] = {k: v for k, v in output.items() if k != 'annotations'}
+    return True
+
+  def _create_check_run(self, body):
+    with self.lock:
+      run_id = self._next_id
+      self._next_id += 1
+      run = self.check_runs[run_id] = {'id': run_id, 'annotations': []}
+      if not self._apply_output(run, body):
+        return 422, {}, {'message': 'Too many annotations'}
+      return 201, {}, {k: v for k, v in run.items() if k != 'annotations'}
+
+  def _update_check_run(self, run_id, body):
+    with self.lock:
+      run = self.check_runs.get(run_id)
+      if run is None:
+        return 404, {}, {'message': 'Not Found'}
+      if not self._apply_output(run, body):
+        return 422, {}, {'message': 'Too many annotations'}
+      return 200, {}, {k: v for k, v in run.items() if k != 'annotations'}
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .instrument import get_instrumentation
+
+# A small client for the GitHub REST API, shared by the commands which look
+# things up (pull request commits and the like) and by CheckRunUploader.
+#
+# Every request goes through one keep-alive session. Rate limited and server
+# error responses are retried with exponential backoff, waiting for longer
+# when GitHub says how long to wait through `Retry-After` or
+# `X-RateLimit-Reset`. POST requests are only retried when rate limited:
+# after a server error the resource may have been created anyway, and a retry
+# would create a second one. With a cache directory,
+# responses are stored with their ETag (or Last-Modified) and asked for again
+# conditionally: GitHub answers 304 Not Modified without counting it against
+# the rate limit, which matters when dozens of matrix jobs fetch the same pull
+# request at once. Lists are paginated transparently, and once the first
+# page's `Link` header says how many pages there are, the rest are fetched
+# concurrently. Every request is timed, in `timings` and the instrumentation.
+#
+#   client = GitHubClient(token, cache_dir='.github-cache')
+#   commits = client.paginate(f'/repos/{repo}/pulls/{number}/commits')
+
+
+class GitHubAPIError(Exception):
+  def __init__(self, response: requests.Response):
+    super().__init__(f'{response.request.method} {response.url} failed with {response.status_code}: {response.text[:200]}')
+    self.response = response
+
+
+class RequestTiming(NamedTuple):
+  url: str
+  status: int
+  elapsed: float
+  # Answered from the cache after a 304.
+  cached: bool
+
+
+# Responses on disk, one JSON file per URL (and token, since what a token may
+# see differs). Files are replaced atomically so concurrent processes can
+# share a directory.
+class ETagCache:
+  def __init__(self, directory: Union[str, os.PathLike]):
+    self.directory = Path(directory)
+    self.directory.mkdir(parents=True, exist_ok=True)
+
+  def _path(self, key: str) -> Path:
+    return self.directory / (hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+  def get(self, key: str) -> Optional[dict[str, Any]]:
+    try:
+      return json.loads(self._path(key).read_text())
+    except (OSError, ValueError):
+      return None
+
+  def put(self, key: str, entry: dict[str, Any]):
+    fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+      json.dump(entry, f)
+    os.replace(tmp, self._path(key))
+
+
+def _with_page(url: str, page: int) -> str:
+  parts = urlsplit(url)
+  query = [(k, v) for k, v in parse_qsl(parts.query) if k != 'page'] + [('page', str(page))]
+  return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _page_of(url: str) -> Optional[int]:
+  page = dict(parse_qsl(urlsplit(url).query)).get('page')
+  return int(page) if page and page.isdigit() else None
+
+
+class GitHubClient:
+  def __init__(self, token: Optional[str] = None, api_url: str = 'https://api.github.com',
+               cache_dir: Optional[Union[str, os.PathLike]] = None, max_workers: int = 4,
+               per_page: int = 100, session: Optional[requests.Session] = None, timeout: float = 60,
+               max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+               sleep: Callable[[float], None] = time.sleep):
+    self.api_url = api_url.rstrip('/')
+    self.max_workers = max_workers
+    self.per_page = per_page
+    self.timeout = timeout
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.sleep = sleep
+    self.cache = ETagCache(cache_dir) if cache_dir else None
+    self.timings: list[RequestTiming] = []
+    self._lock = threading.Lock()
+    self._token_key = hashlib.sha256(token.encode('utf-8')).hexdigest()[:16] if token else ''
+    if session is None:
+      session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+      session.mount('https://', adapter)
+      session.mount('http://', adapter)
+    session.headers.update({
+      'Accept': 'application/vnd.github+json',
+      'X-GitHub-Api-Version': '2022-11-28',
+    })
+    if token:
+      session.headers['Authorization'] = f'Bearer {token}'
+    self.session = session
+
+  def url(self, path: str) -> str:
+    return path if '://' in path else f'{self.api_url}/{path.lstrip("/")}'
+
+  def _retry_delay(self, method: str, response: requests.Response, attempt: int) -> Optional[float]:
+    status = response.status_code
+    headers = response.headers
+    if status in (403, 429):
+      if 'Retry-After' in headers:
+        return float(headers['Retry-After'])
+      if headers.get('X-RateLimit-Remaining') == '0' and 'X-RateLimit-Reset' in headers:
+        return max(0.0, float(headers['X-RateLimit-Reset']) - time.time())
+      if status == 403 and 'rate limit' not in response.text.lower():
+        return None
+    elif status < 500 or method == 'POST':
+      return None
+    return min(self.max_backoff, self.backoff * (2 ** attempt))
+
+  # Send a request, retrying it as described above. Returns the last response
+  # and the number of attempts it took.
+  def _send(self, method: str, url: str, **kwargs) -> tuple[requests.Response, int]:
+    inst = get_instrumentation()
+    attempt = 0
+    while True:
+      attempt += 1
+      start = time.perf_counter()
+      response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+      elapsed = time.perf_counter() - start
+      # A 304 is only ever the answer to a request made conditional by the cache.
+      with self._lock:
+        self.timings.append(RequestTiming(url, response.status_code, elapsed, response.status_code == 304))
+      inst.count('github.requests')
+      inst.observe('github.latency', elapsed)
+      if response.ok or response.status_code == 304:
+        return response, attempt
+      delay = self._retry_delay(method, response, attempt - 1)
+      if delay is None or attempt > self.max_retries:
+        return response, attempt
+      inst.count('github.retries')
+      self.sleep(delay)
+
+  def request(self, method: str, path: str, json: Optional[Any] = None) -> tuple[Any, int]:
+    response, attempts = self._send(method, self.url(path), json=json)
+    if not response.ok:
+      raise GitHubAPIError(response)
+    return response.json(), attempts
+
+  def _get(self, url: str) -> tuple[Any, requests.Response]:
+    key = f'{self._token_key} {url}'
+    entry = self.cache.get(key) if self.cache else None
+    headers = {}
+    if entry is not None:
+      if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+      if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    response, _ = self._send('GET', url, headers=headers)
+    if response.status_code == 304 and entry is not None:
+      get_instrumentation().count('github.not_modified')
+      # The Link header isn't sent again with a 304.
+      response.headers.setdefault('Link', entry.get('link') or '')
+      return entry['body'], response
+    if not response.ok:
+      raise GitHubAPIError(response)
+    body = response.json()
+    if self.cache and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+      self.cache.put(key, {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                           'link': response.headers.get('Link'), 'body': body})
+    return body, response
+
+  def get(self, path: str, params: Optional[dict[str, Any]] = None) -> Any:
+    url = self.url(path)
+    if params:
+      url += ('&' if '?' in url else '?') + urlencode(params)
+    return self._get(url)[0]
+
+  # Every item of a list endpoint. The first page is fetched alone; if its
+  # `last` link gives the number of pages the others are fetched together,
+  # otherwise the `next` links are followed one by one.
+  def paginate(self, path: str, params: Optional[dict[str, Any]] = None) -> list[Any]:
+    url = self.url(path)
+    query = {'per_page': self.per_page, **(params or {})}
+    url += ('&' if '?' in url else '?') + urlencode(query)
+    body, response = self._get(url)
+    items = list(body)
+    last = response.links.get('last', {}).get('url')
+    pages = _page_of(last) if last else None
+    if pages is not None and pages > 1:
+      urls = [_with_page(last, page) for page in range(2, pages + 1)]
+      with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+        for page in pool.map(lambda u: self._get(u)[0], urls):
+          items.extend(page)
+      return items
+    while next_url := response.links.get('next', {}).get('url'):
+      body, response = self._get(next_url)
+      items.extend(body)
+    return items
+
+
+import unittest
+
+class TestGitHubClient(unittest.TestCase):
+  def serve_commits(self, gh, n, per_page):
+    def handler(path, body, headers):
+      query = dict(parse_qsl(urlsplit(path).query))
+      page = int(query.get('page', 1))
+      etag = f'"page-{page}"'
+      if headers.get('If-None-Match') == etag:
+        return 304, {'ETag': etag}, None
+      last = -(-n // per_page)
+      base = f'{gh.url}/repos/efcs/action/pulls/1/commits?per_page={per_page}'
+      link = f'<{base}&page={min(page + 1, last)}>; rel="next", <{base}&page={last}>; rel="last"'
+      items = [{'sha': str(i)} for i in range((page - 1) * per_page, min(page * per_page, n))]
+      return 200, {'ETag': etag, 'Link': link}, items
+    gh.route('GET', '/repos/efcs/action/pulls/1/commits', handler)
+
+  def test_paginate(self):
+    from .fake_github import FakeGitHub
+    with FakeGitHub() as gh:
+      self.serve_commits(gh, 250, 100)
+      client = GitHubClient('token', api_url=gh.url)
+      commits = client.paginate('/repos/efcs/action/pulls/1/commits')
+      self.assertEqual([c['sha'] for c in commits], [str(i) for i in range(250)])
+      self.assertEqual(len(gh.requests), 3)
+      self.assertEqual(len(client.timings), 3)
+
+  def test_etag_cache(self):
+    import tempfile
+    from .fake_github import FakeGitHub
+    with tempfile.TemporaryDirectory() as d, FakeGitHub() as gh:
+      self.serve_commits(gh, 150, 100)
+      first = GitHubClient('token', api_url=gh.url, cache_dir=d).paginate('/repos/efcs/action/pulls/1/commits')
+      client = GitHubClient('token', api_url=gh.url, cache_dir=d)
+      self.assertEqual(client.paginate('/repos/efcs/action/pulls/1/commits'), first)
+      self.assertEqual([(t.status, t.cached) for t in client.timings], [(304, True), (304, True)])
+      # Another token doesn't see the cached responses.
+      other = GitHubClient('other', api_url=gh.url, cache_dir=d)
+      other.paginate('/repos/efcs/action/pulls/1/commits')
+      self.assertEqual([t.status for t in other.timings], [200, 200])
+
+  def test_retries(self):
+    from .fake_github import FakeGitHub
+    delays = []
+    with FakeGitHub() as gh:
+      self.serve_commits(gh, 150, 100)
+      client = GitHubClient('token', api_url=gh.url, sleep=delays.append)
+      gh.fail_next = [(502, {}), (403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'})]
+      self.assertEqual(len(client.paginate('/repos/efcs/action/pulls/1/commits')), 150)
+      self.assertEqual(delays, [1.0, 0.0])
+      self.assertEqual([t.status for t in client.timings], [502, 403, 200, 200])
+      gh.fail_next = [(404, {})]
+      with self.assertRaises(GitHubAPIError):
+        client.get('/repos/efcs/action/pulls/1/commits')
+      self.assertEqual(len(delays), 2)
@@ -0,0 +1,241 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Iterable, Literal, NamedTuple, Optional, Union
+
+from .instrument import get_instrumentation
+from .report import config_of
+from .types.llvm import FAILING_CODES, LITTestResults, TestResult
+
+# How a test's result compares with the last time it ran in the same
+# configuration.
+#   new        it failed, and didn't fail last time (or has never run)
+#   changed    it failed last time too, but its output is different
+#   unchanged  it failed last time with exactly the same output
+#   fixed      it failed last time and doesn't now
+#   ok         it didn't fail either time
+Status = Literal['new', 'changed', 'unchanged', 'fixed', 'ok']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+  id INTEGER PRIMARY KEY,
+  started REAL NOT NULL,
+  label TEXT
+);
+-- One row per test per run.
+CREATE TABLE IF NOT EXISTS results (
+  run_id INTEGER NOT NULL REFERENCES runs(id),
+  config TEXT NOT NULL,
+  name TEXT NOT NULL,
+  code TEXT NOT NULL,
+  output_hash TEXT,
+  elapsed REAL,
+  PRIMARY KEY (run_id, config, name)
+);
+CREATE INDEX IF NOT EXISTS results_by_test ON results (config, name);
+-- The numeric entries of each result's lit metrics.
+CREATE TABLE IF NOT EXISTS metrics (
+  run_id INTEGER NOT NULL REFERENCES runs(id),
+  config TEXT NOT NULL,
+  name TEXT NOT NULL,
+  metric TEXT NOT NULL,
+  value REAL NOT NULL,
+  PRIMARY KEY (run_id, config, name, metric)
+);
+-- The latest result of every test, and counters used for flakiness.
+CREATE TABLE IF NOT EXISTS tests (
+  config TEXT NOT NULL,
+  name TEXT NOT NULL,
+  code TEXT NOT NULL,
+  output_hash TEXT,
+  runs INTEGER NOT NULL,
+  failures INTEGER NOT NULL,
+  flips INTEGER NOT NULL,
+  last_run INTEGER NOT NULL,
+  PRIMARY KEY (config, name)
+);
+'''
+
+
+def output_hash(output: str) -> str:
+  return hashlib.sha256(output.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _failed(code: str) -> bool:
+  return code in FAILING_CODES
+
+
+class Flakiness(NamedTuple):
+  config: str
+  name: str
+  runs: int
+  failures: int
+  # Fraction of consecutive runs where the test went from passing to
+  # failing or back.
+  rate: float
+
+
+# Results of previous runs, kept in a SQLite database so that a run can be
+# reported as a delta against the last one.
+#
+#   store = HistoryStore('history.db')
+#   with store.run('abc123') as run:
+#     for test in tests:
+#       status = run.add(test, 'generic-cxx23')
+#
+# Only failing outputs are hashed, and a failure whose hash matches the
+# previous run is 'unchanged', so callers can skip parsing it.
+class HistoryStore:
+  def __init__(self, path: Union[str, os.PathLike] = ':memory:'):
+    self.path = path
+    self.db = sqlite3.connect(str(path))
+    self.db.executescript(_SCHEMA)
+
+  def close(self):
+    self.db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def run(self, label: Optional[str] = None) -> 'HistoryRun':
+    return HistoryRun(self, label)
+
+  # Record a whole results file at once.
+  def record(self, results: Union[LITTestResults, Iterable[TestResult]], config: Optional[str] = None,
+             label: Optional[str] = None) -> dict[Status, int]:
+    tests = results.tests if isinstance(results, LITTestResults) else results
+    with self.run(label) as run:
+      for test in tests:
+        run.add(test, config)
+    return run.counts
+
+  def latest_run(self) -> Optional[int]:
+    row = self.db.execute('SELECT max(id) FROM runs').fetchone()
+    return row[0]
+
+  def flakiness(self, config: str, name: str) -> Optional[Flakiness]:
+    row = self.db.execute('SELECT runs, failures, flips FROM tests WHERE config = ? AND name = ?',
+                          (config, name)).fetchone()
+    if row is None:
+      return None
+    runs, failures, flips = row
+    return Flakiness(config, name, runs, failures, flips / max(runs - 1, 1))
+
+  # Tests which have flipped between passing and failing in at least
+  # `min_rate` of their runs, most flaky first.
+  def flaky_tests(self, min_rate: float = 0.1, min_runs: int = 5,
+                  config: Optional[str] = None) -> list[Flakiness]:
+    query = '''SELECT config, name, runs, failures, flips FROM tests
+               WHERE runs >= ? AND flips > 0 AND CAST(flips AS REAL) / (runs - 1) >= ?'''
+    params = [min_runs, min_rate]
+    if config is not None:
+      query += ' AND config = ?'
+      params.append(config)
+    rows = self.db.execute(query, params).fetchall()
+    flaky = [Flakiness(c, n, r, f, fl / max(r - 1, 1)) for c, n, r, f, fl in rows]
+    return sorted(flaky, key=lambda f: (-f.rate, f.config, f.name))
+
+
+# A run being recorded. Each test is classified against the previous state
+# of the store as it's added; the new rows are written in one transaction
+# when the run is closed. Previous results are loaded a configuration at a
+# time, on first use.
+class HistoryRun:
+  def __init__(self, store: HistoryStore, label: Optional[str] = None):
+    self.store = store
+    self.label = label
+    self.id: Optional[int] = None
+    self.counts: dict[Status, int] = {'new': 0, 'changed': 0, 'unchanged': 0, 'fixed': 0, 'ok': 0}
+    self._previous: dict[str, dict[str, tuple[str, Optional[str]]]] = {}
+    self._rows: list[tuple] = []
+    self._metrics: list[tuple] = []
+
+  def __enter__(self):
+    cur = self.store.db.execute('INSERT INTO runs (started, label) VALUES (?, ?)', (time.time(), self.label))
+    self.id = cur.lastrowid
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is not None:
+      self.store.db.rollback()
+      return
+    self._flush()
+
+  def _previous_for(self, config: str) -> dict[str, tuple[str, Optional[str]]]:
+    previous = self._previous.get(config)
+    if previous is None:
+      rows = self.store.db.execute('SELECT name, code, output_hash FROM tests WHERE config = ?', (config,))
+      previous = self._previous[config] = {name: (code, h) for name, code, h in rows}
+    return previous
+
+  def add(self, test: TestResult, config: Optional[str] = None) -> Status:
+    config = config_of(test, config)
+    failed = _failed(test.code)
+    h = output_hash(test.output) if failed else None
+    prev = self._previous_for(config).get(test.name)
+    was_failing = prev is not None and _failed(prev[0])
+    if failed:
+      status = 'new' if not was_failing else 'unchanged' if prev[1] == h else 'changed'
+    else:
+      status = 'fixed' if was_failing else 'ok'
+    self.counts[status] += 1
+    self._rows.append((self.id, config, test.name, test.code, h, test.elapsed, int(failed),
+                       int(prev is not None and was_failing != failed)))
+    for metric, value in test.metrics.items():
+      if isinstance(value, (int, float)) and not isinstance(value, bool):
+        self._metrics.append((self.id, config, test.name, metric, value))
+    return status
+
+  def _flush(self):
+    inst = get_instrumentation()
+    with self.store.db:
+      self.store.db.executemany(
+        'INSERT OR REPLACE INTO results (run_id, config, name, code, output_hash, elapsed) VALUES (?, ?, ?, ?, ?, ?)',
+        (r[:6] for r in self._rows))
+      self.store.db.executemany('''
+        INSERT INTO tests (config, name, code, output_hash, runs, failures, flips, last_run)
+        VALUES (?2, ?3, ?4, ?5, 1, ?7, 0, ?1)
+        ON CONFLICT (config, name) DO UPDATE SET
+          code = excluded.code, output_hash = excluded.output_hash, runs = runs + 1,
+          failures = failures + ?7, flips = flips + ?8, last_run = ?1''',
+        self._rows)
+      self.store.db.executemany(
+        'INSERT OR REPLACE INTO metrics (run_id, config, name, metric, value) VALUES (?, ?, ?, ?, ?)',
+        self._metrics)
+    for status, n in self.counts.items():
+      inst.count(f'history.{status}', n)
+    self._rows = []
+    self._metrics = []
+
+
+import unittest
+
+class TestHistoryStore(unittest.TestCase):
+  def test_delta(self):
+    store = HistoryStore()
+    t = lambda name, code, output='': TestResult(code=code, elapsed=0.1, name=f'suite :: {name}', output=output)
+    with store.run('1') as run:
+      self.assertEqual([run.add(x, 'cxx23') for x in [t('a', 'FAIL', 'x'), t('b', 'FAIL', 'y'), t('c', 'FAIL', 'z'), t('d', 'PASS')]],
+                       ['new', 'new', 'new', 'ok'])
+    with store.run('2') as run:
+      self.assertEqual([run.add(x, 'cxx23') for x in [t('a', 'FAIL', 'x'), t('b', 'FAIL', 'y2'), t('c', 'PASS'), t('d', 'FAIL', 'w')]],
+                       ['unchanged', 'changed', 'fixed', 'new'])
+    # Other configurations have their own history.
+    self.assertEqual(store.record([t('a', 'FAIL', 'x')], config='cxx20'), {'new': 1, 'changed': 0, 'unchanged': 0, 'fixed': 0, 'ok': 0})
+    self.assertEqual(store.latest_run(), 3)
+    self.assertEqual(store.db.execute('SELECT count(*) FROM results').fetchone()[0], 9)
+
+  def test_flakiness(self):
+    store = HistoryStore()
+    for i in range(6):
+      store.record([TestResult(code='FAIL' if i % 2 else 'PASS', elapsed=0.1, name='s :: flaky', output='x'),
+                    TestResult(code='FAIL', elapsed=0.1, name='s :: broken', output='x')], config='c')
+    f = store.flakiness('c', 's :: flaky')
+    self.assertEqual((f.runs, f.failures, f.rate), (6, 3, 1.0))
+    self.assertEqual(store.flakiness('c', 's :: broken').rate, 0.0)
+    self.assertEqual([f.name for f in store.flaky_tests()], ['s :: flaky'])
+    self.assertIsNone(store.flakiness('c', 'missing'))
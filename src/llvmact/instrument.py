@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Optional
+
+# Opt-in counters, timers and tracing for the parser and reporter.
+#
+# Code that wants to be measured asks for the current instrumentation with
+# get_instrumentation() and reports to it. By default that's a
+# NullInstrumentation whose methods do nothing, so the cost when nobody is
+# looking is a method call. Hot loops should check `enabled` before doing any
+# work just to produce a number.
+#
+#   inst = enable_instrumentation()
+#   with inst.phase('parse'):
+#     ...
+#   inst.count('blocks.status')
+#   print(inst.to_json())
+
+
+class NullInstrumentation:
+  enabled = False
+  tracing = False
+
+  def count(self, name: str, n: int = 1):
+    pass
+
+  def observe(self, name: str, value: float):
+    pass
+
+  def phase(self, name: str):
+    return nullcontext()
+
+  def trace(self, event: str, **fields):
+    pass
+
+
+class Instrumentation(NullInstrumentation):
+  enabled = True
+
+  def __init__(self, trace: bool = False, max_events: int = 10000):
+    self.tracing = trace
+    self.max_events = max_events
+    self.counters: dict[str, int] = defaultdict(int)
+    self.phases: dict[str, float] = defaultdict(float)
+    self.observations: dict[str, dict[str, float]] = {}
+    self.events: list[dict[str, Any]] = []
+    self.dropped_events = 0
+    self._start = time.perf_counter()
+
+  def count(self, name: str, n: int = 1):
+    self.counters[name] += n
+
+  def observe(self, name: str, value: float):
+    o = self.observations.get(name)
+    if o is None:
+      self.observations[name] = {'count': 1, 'total': value, 'min': value, 'max': value}
+    else:
+      o['count'] += 1
+      o['total'] += value
+      o['min'] = min(o['min'], value)
+      o['max'] = max(o['max'], value)
+
+  @contextmanager
+  def phase(self, name: str):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start
+      self.phases[name] += elapsed
+      self.trace('phase', name=name, elapsed=elapsed)
+
+  def trace(self, event: str, **fields):
+    if not self.tracing:
+      return
+    if len(self.events) >= self.max_events:
+      self.dropped_events += 1
+      return
+    self.events.append({'t': time.perf_counter() - self._start, 'event': event, **fields})
+
+  def summary(self) -> dict[str, Any]:
+    s = {
+      'elapsed': time.perf_counter() - self._start,
+      'phases': dict(self.phases),
+      'counters': dict(sorted(self.counters.items())),
+      'observations': self.observations,
+    }
+    if self.tracing:
+      s['events'] = self.events
+      s['dropped_events'] = self.dropped_events
+    return s
+
+  def to_json(self, **kwargs) -> str:
+    return json.dumps(self.summary(), **kwargs)
+
+  def to_markdown(self) -> str:
+    lines = ['### llvmact timings', '', '| phase | seconds |', '| --- | ---: |']
+    lines += [f'| {k} | {v:.3f} |' for k, v in self.phases.items()]
+    if self.counters:
+      lines += ['', '| counter | value |', '| --- | ---: |']
+      lines += [f'| {k} | {v} |' for k, v in sorted(self.counters.items())]
+    if self.observations:
+      lines += ['', '| measurement | count | mean | max |', '| --- | ---: | ---: | ---: |']
+      lines += [f"| {k} | {o['count']} | {o['total'] / o['count']:.3f} | {o['max']:.3f} |"
+                for k, o in self.observations.items()]
+    return '\n'.join(lines) + '\n'
+
+  def write_step_summary(self, path: Optional[str] = None):
+    from .workflow import WorkflowCommands
+    with WorkflowCommands(environ={'GITHUB_STEP_SUMMARY': path} if path else None) as wf:
+      wf.summary(self.to_markdown())
+
+
+_current: NullInstrumentation = NullInstrumentation()
+
+
+def get_instrumentation() -> NullInstrumentation:
+  return _current
+
+
+# Start collecting. LLVMACT_TRACE=1 in the environment turns on tracing of
+# individual events too.
+def enable_instrumentation(trace: Optional[bool] = None) -> Instrumentation:
+  global _current
+  if trace is None:
+    trace = os.environ.get('LLVMACT_TRACE', '') not in ('', '0')
+  _current = Instrumentation(trace=trace)
+  return _current
+
+
+def disable_instrumentation():
+  global _current
+  _current = NullInstrumentation()
+
+
+import unittest
+
+class TestInstrumentation(unittest.TestCase):
+  def tearDown(self):
+    disable_instrumentation()
+
+  def test_null(self):
+    inst = get_instrumentation()
+    self.assertFalse(inst.enabled)
+    with inst.phase('x'):
+      inst.count('y')
+
+  def test_summary(self):
+    inst = enable_instrumentation(trace=True)
+    self.assertIs(get_instrumentation(), inst)
+    with inst.phase('parse'):
+      inst.count('blocks.status', 2)
+    inst.observe('latency', 1.0)
+    inst.observe('latency', 3.0)
+    s = json.loads(inst.to_json())
+    self.assertIn('parse', s['phases'])
+    self.assertEqual(s['counters'], {'blocks.status': 2})
+    self.assertEqual(s['observations']['latency'], {'count': 2, 'total': 4.0, 'min': 1.0, 'max': 3.0})
+    self.assertEqual(s['events'][0]['event'], 'phase')
+    self.assertIn('| blocks.status | 2 |', inst.to_markdown())
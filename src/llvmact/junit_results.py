@@ -0,0 +1,215 @@
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from .types.llvm import TestResult
+
+# Incremental reader for the JUnit XML written by `lit --xunit-xml-output`,
+# the test-results.xml every CI job uploads. It yields the same TestResults
+# (or with validate=False, dicts) as LITResultsReader, so everything which
+# reads lit's JSON reads these too.
+#
+#   for test in JUnitResultsReader('test-results.xml'):
+#     ...
+#
+# The file is read with iterparse and each testcase is dropped once it has
+# been yielded, so memory doesn't grow with the number of tests.
+#
+# lit doesn't write the test's name, it has to be put back together from:
+#
+#   <testcase classname="<suite>.<directory>" name="<file>" time="...">
+#
+# where <suite> is the suite name with '.' replaced by '-' and <directory> is
+# the path of the test's directory with '.' replaced by '_'. Directories such
+# as 'vector.cons' are everywhere in libc++, so this is undone:
+#
+#   - against the test tree on disk, when `root` is given;
+#   - for failures, from the source path in the test's output;
+#   - otherwise it can't be, and the mangled directory is kept.
+#
+# Suite names are the config names ending in '.cfg.in', which is restored.
+#
+# lit writes <skipped> for UNSUPPORTED, SKIPPED and EXCLUDED tests, and the
+# code is recovered from the message it gives. XFAIL tests are written as
+# passes and can't be told apart.
+
+_suite_suffixes = {'-cfg-in': '.cfg.in', '-cfg': '.cfg'}
+
+
+def _suite_name(safe: str) -> str:
+  for mangled, suffix in _suite_suffixes.items():
+    if safe.endswith(mangled):
+      return safe[:-len(mangled)] + suffix
+  return safe
+
+
+# The start of the messages lit's XunitReport gives tests it didn't run,
+# other than the unsupported ones.
+_skip_codes = {'Test not selected': 'EXCLUDED', 'User interrupt': 'SKIPPED'}
+
+
+def _skip_code(message: str) -> str:
+  for prefix, code in _skip_codes.items():
+    if message.startswith(prefix):
+      return code
+  return 'UNSUPPORTED'
+
+
+def _mangle(directory: str) -> str:
+  return directory.replace('.', '_')
+
+
+# The real directory of a test, given `root` (the test suite's source
+# directory). Listings are cached, a run has thousands of tests in a few
+# hundred directories.
+class _DirectoryResolver:
+  def __init__(self, root: Union[str, os.PathLike]):
+    self.root = Path(root)
+    self._children: dict[str, dict[str, str]] = {}
+    self._resolved: dict[str, Optional[str]] = {}
+
+  def _listing(self, directory: str) -> dict[str, str]:
+    children = self._children.get(directory)
+    if children is None:
+      try:
+        children = {_mangle(p.name): p.name for p in (self.root / directory).iterdir() if p.is_dir()}
+      except OSError:
+        children = {}
+      self._children[directory] = children
+    return children
+
+  def resolve(self, mangled: str) -> Optional[str]:
+    if mangled in self._resolved:
+      return self._resolved[mangled]
+    real = ''
+    for part in mangled.split('/'):
+      child = self._listing(real).get(part)
+      if child is None:
+        real = None
+        break
+      real = f'{real}/{child}' if real else child
+    self._resolved[mangled] = real
+    return real
+
+
+def _directory_from_output(mangled: str, file: str, output: str) -> Optional[str]:
+  for m in re.finditer(r'[\w.+/-]*/' + re.escape(file) + r'\b', output):
+    directory = m.group(0)[:-len(file) - 1]
+    parts = directory.split('/')
+    n = mangled.count('/') + 1
+    if len(parts) >= n and _mangle('/'.join(parts[-n:])) == mangled:
+      return '/'.join(parts[-n:])
+  return None
+
+
+class JUnitResultsReader:
+  def __init__(self, source: Union[str, os.PathLike, io.IOBase], root: Optional[Union[str, os.PathLike]] = None,
+               validate: bool = True):
+    self.source = source
+    self.validate = validate
+    self.resolver = _DirectoryResolver(root) if root is not None else None
+    self.fields: dict[str, Any] = {}
+
+  @property
+  def elapsed(self) -> Optional[float]:
+    return self.fields.get('elapsed')
+
+  def _name(self, suite: str, classname: str, file: str, output: str) -> str:
+    prefix = suite + '.'
+    mangled = classname[len(prefix):] if classname.startswith(prefix) else classname
+    if mangled == suite:
+      # lit uses the suite name when the test is at the top of the suite.
+      mangled = ''
+    directory = None
+    if mangled and self.resolver is not None:
+      directory = self.resolver.resolve(mangled)
+    if mangled and directory is None and output:
+      directory = _directory_from_output(mangled, file, output)
+    directory = directory or mangled
+    return f"{_suite_name(suite)} :: {directory + '/' if directory else ''}{file}"
+
+  def _result(self, suite: str, case: ET.Element) -> Union[TestResult, dict[str, Any]]:
+    code, output = 'PASS', ''
+    for child in case:
+      if child.tag in ('failure', 'error'):
+        code, output = 'FAIL', child.text or child.get('message') or ''
+        break
+      if child.tag == 'skipped':
+        output = child.get('message') or ''
+        code = _skip_code(output)
+    name = self._name(suite, case.get('classname', ''), case.get('name', ''), output if code == 'FAIL' else '')
+    test = {'code': code, 'elapsed': float(case.get('time') or 0.0), 'name': name, 'output': output}
+    return TestResult.model_validate(test) if self.validate else test
+
+  def __iter__(self) -> Iterator[TestResult]:
+    suites: list[ET.Element] = []
+    suite_name = ''
+    for event, elem in ET.iterparse(self.source, events=('start', 'end')):
+      if event == 'start':
+        if elem.tag == 'testsuite':
+          suites.append(elem)
+          suite_name = elem.get('name', '')
+        elif elem.tag == 'testsuites' and elem.get('time'):
+          self.fields['elapsed'] = float(elem.get('time'))
+        continue
+      if elem.tag == 'testcase':
+        yield self._result(suite_name, elem)
+        # Drop the test now that it's been read; it's the suite's only child.
+        if suites:
+          suites[-1].remove(elem)
+        elem.clear()
+      elif elem.tag == 'testsuite':
+        suites.pop()
+        elem.clear()
+
+
+import unittest
+
+class TestJUnitResultsReader(unittest.TestCase):
+  # As written by lit's XunitReport.
+  xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<testsuites time="12.50">
+<testsuite name="llvm-libc++-shared-cfg-in" tests="4" failures="1" skipped="1">
+<testcase classname="llvm-libc++-shared-cfg-in.std/containers/sequences/vector/vector_cons" name="default.pass.cpp" time="1.25"/>
+<testcase classname="llvm-libc++-shared-cfg-in.std/example" name="fails-to-compile.pass.cpp" time="0.50">
+  <failure><![CDATA[{output}]]></failure>
+</testcase>
+<testcase classname="llvm-libc++-shared-cfg-in.std/utilities/function_objects/func_bind_front" name="bind_front.pass.cpp" time="0.00">
+  <skipped message="Missing required feature(s): c++20"/>
+</testcase>
+<testcase classname="llvm-libc++-shared-cfg-in.llvm-libc++-shared-cfg-in" name="top.sh.cpp" time="0.10"/>
+</testsuite>
+</testsuites>
+'''
+
+  def test_reader(self):
+    from .libcxx_test_parser import TEST_CASES
+    xml = self.xml.replace('{output}', TEST_CASES[2])
+    reader = JUnitResultsReader(io.BytesIO(xml.encode('utf-8')))
+    tests = list(reader)
+    self.assertEqual([t.code for t in tests], ['PASS', 'FAIL', 'UNSUPPORTED', 'PASS'])
+    self.assertEqual([t.name for t in tests], [
+      'llvm-libc++-shared.cfg.in :: std/containers/sequences/vector/vector_cons/default.pass.cpp',
+      'llvm-libc++-shared.cfg.in :: std/example/fails-to-compile.pass.cpp',
+      'llvm-libc++-shared.cfg.in :: std/utilities/function_objects/func_bind_front/bind_front.pass.cpp',
+      'llvm-libc++-shared.cfg.in :: top.sh.cpp'])
+    self.assertEqual(tests[1].output, TEST_CASES[2])
+    self.assertEqual((tests[0].elapsed, reader.elapsed), (1.25, 12.5))
+    raw = list(JUnitResultsReader(io.BytesIO(xml.encode('utf-8')), validate=False))
+    self.assertEqual(raw[2]['output'], 'Missing required feature(s): c++20')
+    self.assertEqual(_skip_code('Test not selected (--filter, --max-tests)'), 'EXCLUDED')
+
+  def test_directories(self):
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+      for directory in ['std/containers/sequences/vector/vector.cons', 'std/utilities/function.objects/func.bind_front']:
+        Path(d, directory).mkdir(parents=True)
+      tests = list(JUnitResultsReader(io.StringIO(self.xml.replace('{output}', '')), root=d))
+    self.assertEqual(tests[0].name, 'llvm-libc++-shared.cfg.in :: std/containers/sequences/vector/vector.cons/default.pass.cpp')
+    self.assertEqual(tests[2].name, 'llvm-libc++-shared.cfg.in :: std/utilities/function.objects/func.bind_front/bind_front.pass.cpp')
+    output = '/src/libcxx/test/std/utilities/function.objects/func.bind_front/bind_front.pass.cpp:3:1: error: x'
+    self.assertEqual(_directory_from_output('std/utilities/function_objects/func_bind_front', 'bind_front.pass.cpp', output),
+                     'std/utilities/function.objects/func.bind_front')
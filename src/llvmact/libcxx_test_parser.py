@@ -2,9 +2,12 @@ import re
 from typing import Tuple, Union
 from pydantic import BaseModel, Field
 import os, sys, re
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-import rich
-from typing import Any, Optional
+from .clang_diagnostics import Diagnostic, parse_diagnostics
+from .instrument import get_instrumentation
+from .parse_cache import ParseCache, get_parse_cache
+from typing import Any, NamedTuple, Optional
 import re
 
 clang_error_re = re.compile(r"^(# \||)(?P<file>.*):(?P<line>\d+):(?P<column>\d+): error: (?P<text>.*)$", re.MULTILINE)
@@ -148,10 +151,100 @@ class ExecutedCommandBlock(BaseModel):
   stderr : Optional[str] = None
   error_message : Optional[str] = None
 
+class TokenKind(Enum):
+  BLANK = 'blank'
+  TEXT = 'text'
+  COMMENT = 'comment'
+  STATUS = 'status'
+  OUTPUT_HEADER = 'output-header'
+  EXECUTED_COMMAND = 'executed-command'
+  FENCE_BEGIN = 'fence-begin'
+  FENCE_END = 'fence-end'
+  PAYLOAD = 'payload'
+  TITLE = 'title'
+  ERROR = 'error'
+
+
+# A token is a single classified line of lit output. `value` holds the
+# interesting part of the line (the exit code, the command, the payload with
+# the '# | ' prefix removed, ...), `line` the raw text.
+class Token(NamedTuple):
+  kind: TokenKind
+  line: str
+  value: Optional[str]
+
+
+# Dispatch table used to classify a line. It's keyed by the first character
+# of the line, and each entry is a list of (prefix, kind, pattern) rules tried
+# in order followed by the kind to use when no rule matches. When a rule has
+# no pattern the token value is everything after the prefix, otherwise it's
+# the first group of the pattern.
+_COMMENT_RULES = (
+  ('# |', TokenKind.PAYLOAD, None),
+  ('# .---', TokenKind.FENCE_BEGIN, re.compile(r'^# \.---[-]*(?P<HEADER>[^-]+)[-]+$')),
+  ('# `---', TokenKind.FENCE_END, None),
+  ('# executed command: ', TokenKind.EXECUTED_COMMAND, None),
+  ('# error: ', TokenKind.ERROR, None),
+  ('# ', TokenKind.TITLE, re.compile(r'^# (?P<TITLE>[A-Z\s]+?)\s*$')),
+)
+
+_LINE_DISPATCH = {
+  '#': (_COMMENT_RULES, TokenKind.COMMENT),
+  'E': ((('Exit Code: ', TokenKind.STATUS, re.compile(r'^Exit Code: (?P<EXIT_CODE>\d+)$')),), TokenKind.TEXT),
+  'C': ((('Command Output (', TokenKind.OUTPUT_HEADER, re.compile(r'^Command Output \((?P<STREAM>\w+)\):$')),), TokenKind.TEXT),
+}
+
+
+def classify_line(line: str) -> Token:
+  entry = _LINE_DISPATCH.get(line[:1])
+  if entry is not None:
+    rules, fallback = entry
+    for prefix, kind, pattern in rules:
+      if not line.startswith(prefix):
+        continue
+      if pattern is None:
+        # '# |' payload lines are usually followed by a space we don't keep.
+        return Token(kind, line, line[len(prefix) + 1:] if kind is TokenKind.PAYLOAD else line[len(prefix):])
+      m = pattern.match(line)
+      if m is not None:
+        return Token(kind, line, m.group(1))
+    if fallback is TokenKind.COMMENT:
+      return Token(fallback, line, line[1:].strip())
+  if not line.strip():
+    return Token(TokenKind.BLANK, line, None)
+  return Token(TokenKind.TEXT, line, line)
+
+
+def tokenize(lines) -> list[Token]:
+  return list(map(classify_line, lines))
+
+
+# Tokens which come from a '#' line. Plain command and status bodies end at
+# the first one of these.
+_COMMENT_KINDS = frozenset([
+  TokenKind.COMMENT, TokenKind.EXECUTED_COMMAND, TokenKind.FENCE_BEGIN,
+  TokenKind.FENCE_END, TokenKind.PAYLOAD, TokenKind.TITLE, TokenKind.ERROR])
+
+_BODY_KINDS = frozenset([TokenKind.TEXT, TokenKind.BLANK])
+
+_pattern_cache = {}
+
+
+def _compile(pattern):
+  r = _pattern_cache.get(pattern)
+  if r is None:
+    r = _pattern_cache[pattern] = re.compile(pattern)
+  return r
+
+
 class LineLexer:
+  # `lines` is either a list of strings or a line_source.LineSource, which
+  # knows how to tokenize itself and join runs of payload lines without
+  # decoding every line on its own.
   def __init__(self, lines, n):
     self.lines = lines
     self.n = n
+    self.tokens = lines.tokenize() if hasattr(lines, 'tokenize') else tokenize(lines)
 
   def peek(self):
     if self.n < len(self.lines):
@@ -159,8 +252,14 @@ class LineLexer:
     else:
       return None
 
+  def peek_token(self):
+    if self.n < len(self.tokens):
+      return self.tokens[self.n]
+    else:
+      return None
+
   def ignore_blank(self, one = False):
-    while self.peek() and self.peek().strip() == '':
+    while (tok := self.peek_token()) is not None and tok.kind is TokenKind.BLANK:
       self.n += 1
       if one:
         return
@@ -184,13 +283,8 @@ class LineLexer:
     else:
       return TryParseResult(False, None)
 
-  def take_while(self, pred):
-    while self.__bool__() and pred(self.peek()):
-      yield self.take()
-
   def take_matching(self, pattern, group = None):
-    r = re.compile(pattern)
-    m = r.match(self.peek())
+    m = _compile(pattern).match(self.peek())
     if m is None:
       return TryParseResult(False, None)
     self.take()
@@ -207,84 +301,109 @@ class LineLexer:
     else:
       raise IndexError("No more lines")
 
+  def take_token(self, kind):
+    tok = self.peek_token()
+    if tok is None or tok.kind is not kind:
+      return TryParseResult(False, None)
+    self.n += 1
+    return TryParseResult(True, tok.value, raw = tok.line)
+
+  # Take the longest run of tokens whose kind is in `kinds`.
+  def take_run(self, kinds):
+    toks = self.tokens
+    start = end = self.n
+    while end < len(toks) and toks[end].kind in kinds:
+      end += 1
+    self.n = end
+    return toks[start:end]
+
+  def take_body(self):
+    return '\n'.join([tok.line for tok in self.take_run(_BODY_KINDS)])
+
   def try_take_comment(self):
     if self.peek().startswith('#'):
-      ln = self.take()
+      ln = self.take().value
       return TryParseResult(True, ln[1:].strip(), raw = ln)
     else:
       return TryParseResult(False, None)
 
   def try_take_comment_block(self):
-
-    if self.peek().startswith('# '):
-      header = self.take()[1:].strip()
-      body = ''
-      while self.peek() and not self.peek().startswith('#'):
-        body += self.take()
-      return TryParseResult(True, NestedCommentBlock(header=header, body=body))
+    tok = self.peek_token()
+    if tok is not None and tok.kind in _COMMENT_KINDS and tok.line.startswith('# '):
+      self.n += 1
+      header = tok.line[1:].strip()
+      return TryParseResult(True, CommandBlock(header=header, body=self.take_body()))
     else:
       return TryParseResult(False, None)
 
   def try_parse_executed_command_block(self):
-    ln = self.peek()
-    if not ln.startswith('# executed command:'):
-      return TryParseResult(False, None)
-    else:
-      cmd = self.take().value
-      cmd = cmd[len('# executed command: '):]
-      blocks = {}
-      while self.peek() and self.peek().startswith('# .---'):
-        cmd_header = self.take_matching(r'# \.---([-]*)(?P<HEADER>[^-]+)[-]+$', 'HEADER')
-        rich.print('command header', cmd_header)
-        lines = [ln.value[len('# | '):] for ln in self.take_while(lambda x: x.startswith('# |'))]
-        end_ln = self.take_if_prefix('# `---').raise_if_failed()
-        blocks[cmd_header.value] = '\n'.join(lines)
-
-      res = self.take_matching('# error: (?P<ERROR_MSG>.*)', 'ERROR_MSG').raise_if_failed()
-      full =  {
-        'command': cmd,
-        'stderr': blocks['command stderr'] if 'command stderr' in blocks else None,
-        'stdout': blocks['command stdout'] if 'command stdout' in blocks else None,
-        'error_message': res.value
-      }
-      return TryParseResult(True, ExecutedCommandBlock(**full))
+    tok = self.take_token(TokenKind.EXECUTED_COMMAND)
+    if not tok:
+      return tok
+    cmd = tok.value
+    blocks = {}
+    while cmd_header := self.take_token(TokenKind.FENCE_BEGIN):
+      start = self.n
+      toks = self.take_run((TokenKind.PAYLOAD,))
+      join = getattr(self.lines, 'join_payload', None)
+      payload = join(start, self.n) if join is not None else '\n'.join([t.value for t in toks])
+      self.take_token(TokenKind.FENCE_END).raise_if_failed()
+      blocks[cmd_header.value] = payload
+
+    # Commands which succeed don't have an error trailer.
+    res = self.take_token(TokenKind.ERROR)
+    full =  {
+      'command': cmd,
+      'stderr': blocks.get('command stderr'),
+      'stdout': blocks.get('command stdout'),
+      'error_message': res.value if res else None
+    }
+    return TryParseResult(True, ExecutedCommandBlock(**full))
 
   def try_parse_command_block(self):
-    ln = self.peek()
-    if ln := self.take_matching(r'^# (?P<TITLE>[A-Z\s]+)\s*$', 'TITLE'):
-      title = ln.value
-      body = ''
-      while self.peek() and not self.peek().startswith('#'):
-        body += self.take().value
-      return TryParseResult(True, CommandBlock(header=title, body=body))
+    if ln := self.take_token(TokenKind.TITLE):
+      return TryParseResult(True, CommandBlock(header=ln.value, body=self.take_body()))
     else:
       return TryParseResult(False, None)
 
   def try_parse_status_block(self):
-    if not self.peek().startswith('Exit Code:'):
-      return TryParseResult(False, None)
-    exit_code = self.take_matching(r'^Exit Code: (?P<EXIT_CODE>\d+)$', 'EXIT_CODE').raise_if_failed()
+    exit_code = self.take_token(TokenKind.STATUS)
+    if not exit_code:
+      return exit_code
     self.ignore_blank()
-    self.take_matching(r'^Command Output \(stdout\):$').raise_if_failed()
+    self.take_token(TokenKind.OUTPUT_HEADER).raise_if_failed()
     self.ignore_blank()
-    output = ''
-    while self.peek() and not self.peek().startswith('#'):
-      output += self.take()
-    return TryParseResult(True, StatusBlock(exit_code=exit_code.value, stdout=output))
+    return TryParseResult(True, StatusBlock(exit_code=int(exit_code.value), stdout=self.take_body()))
+
+  # Each block starts with a distinct kind of token, so dispatch on the kind
+  # of the next token rather than trying every parser in turn.
+  _BLOCK_PARSERS = {
+    TokenKind.STATUS: try_parse_status_block,
+    TokenKind.EXECUTED_COMMAND: try_parse_executed_command_block,
+    TokenKind.TITLE: try_parse_command_block,
+  }
 
   def try_parse_block(self):
-    if sb := self.try_parse_status_block():
-      return sb
-    elif eb := self.try_parse_executed_command_block():
-      return eb
-    elif cb := self.try_parse_command_block():
-      return cb
-    else:
+    tok = self.peek_token()
+    parser = self._BLOCK_PARSERS.get(tok.kind) if tok is not None else None
+    if parser is None:
       return TryParseResult(False, None)
+    return parser(self)
+
+  # Parse every block in the remaining input. Lines which aren't part of any
+  # block (other than blank lines) are yielded as plain strings.
+  def parse_blocks(self):
+    while (tok := self.peek_token()) is not None:
+      if b := self.try_parse_block():
+        yield b.value
+      else:
+        self.n += 1
+        if tok.kind is not TokenKind.BLANK:
+          yield tok.line
 
 
   def take_while(self, pred):
-    while self.peek() and pred(self.peek()):
+    while self.peek() is not None and pred(self.peek()):
       yield self.take()
 
 
@@ -309,7 +428,6 @@ class TestParse(unittest.TestCase):
     value = exe.value
     self.assertTrue(exe)
     self.assertEqual(value.command, 'foo bar')
-    rich.print(value)
     self.assertEqual(value.stdout, 'hello\nworld')
 
   def test_take_command_block(self):
@@ -334,6 +452,79 @@ g++ bar
     self.assertTrue(b)
     self.assertEqual(b.value.header, 'EXECUTED')
 
+  def test_tokenize(self):
+    lines = [
+      'Exit Code: 1',
+      '',
+      'Command Output (stdout):',
+      '# COMPILED WITH',
+      'clang++ foo.cpp',
+      '# executed command: clang++ foo.cpp',
+      '# .---command stderr------------',
+      '# | foo.cpp:1:1: error: bad',
+      '# `-----------------------------',
+      '# error: command failed with exit status: 1',
+      '# some other comment',
+    ]
+    toks = tokenize(lines)
+    self.assertEqual([t.kind for t in toks], [
+      TokenKind.STATUS, TokenKind.BLANK, TokenKind.OUTPUT_HEADER, TokenKind.TITLE,
+      TokenKind.TEXT, TokenKind.EXECUTED_COMMAND, TokenKind.FENCE_BEGIN, TokenKind.PAYLOAD,
+      TokenKind.FENCE_END, TokenKind.ERROR, TokenKind.COMMENT])
+    self.assertEqual(toks[0].value, '1')
+    self.assertEqual(toks[3].value, 'COMPILED WITH')
+    self.assertEqual(toks[5].value, 'clang++ foo.cpp')
+    self.assertEqual(toks[6].value, 'command stderr')
+    self.assertEqual(toks[7].value, 'foo.cpp:1:1: error: bad')
+    self.assertEqual(toks[9].value, 'command failed with exit status: 1')
+
+  def test_parse_test_output(self):
+    for t, exit_code in zip(TEST_CASES, [0, 250, 1]):
+      out = parse_test_output(t).Output
+      self.assertIsInstance(out[0], StatusBlock)
+      self.assertEqual(out[0].exit_code, exit_code)
+      self.assertEqual(out[1].header, 'COMPILED WITH')
+      self.assertIsInstance(out[2], ExecutedCommandBlock)
+    out = parse_test_output(TEST_CASES[2]).Output
+    self.assertIn("error: no viable overloaded '+='", out[2].stderr)
+    self.assertEqual(out[2].stderr.splitlines()[-1], '1 error generated.')
+    self.assertEqual(out[2].error_message, 'command failed with exit status: 1')
+    self.assertIsNone(parse_test_output(TEST_CASES[0]).Output[2].error_message)
+
+  def test_parse_test_outputs(self):
+    outputs = TEST_CASES * 40
+    serial = parse_test_outputs(outputs, jobs=1)
+    parallel = parse_test_outputs(outputs, jobs=4, chunk_size=8, threshold=0)
+    self.assertEqual(serial, parallel)
+    self.assertEqual([len(p.clang_errors) for p in serial[:3]], [0, 0, 1])
+    self.assertEqual(serial[2].clang_errors[0].line, 6)
+    self.assertEqual(len(serial[2].diagnostics[0].notes), 6)
+
+  def test_parse_cache(self):
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+      cache = ParseCache(d)
+      first = parse_test_outputs(TEST_CASES + TEST_CASES[:1], cache=cache)
+      self.assertEqual((cache.hits, cache.misses), (0, 4))
+      second = parse_test_outputs(TEST_CASES, cache=cache)
+      self.assertEqual((cache.hits, cache.misses), (3, 4))
+      self.assertEqual(first[:3], second)
+      self.assertEqual(parse_test_output(TEST_CASES[2], cache=cache), second[2])
+      self.assertEqual(parse_test_output(TEST_CASES[2], cache=False), second[2])
+
+  def test_instrumentation(self):
+    from .instrument import enable_instrumentation, disable_instrumentation
+    inst = enable_instrumentation()
+    try:
+      parse_test_outputs(TEST_CASES, cache=False)
+      parse_test_output(TEST_CASES[2], cache=False)
+    finally:
+      disable_instrumentation()
+    self.assertEqual(inst.counters['parse.outputs'], 4)
+    self.assertEqual(inst.counters['parse.blocks.StatusBlock'], 4)
+    self.assertEqual(inst.counters['parse.clang_errors'], 2)
+    self.assertGreater(inst.counters['parse.stderr_bytes'], 0)
+
   def test_clang_error_re(self):
     test_diags = [
 '''
@@ -345,11 +536,128 @@ g++ bar
     ]
     for t in test_diags:
       t = t.strip()
-      m = ClangError.parse(t)
+      m = ClangError.try_parse(t)
       self.assertIsNotNone(m)
       self.assertEqual(m.line, 6)
 
 
 class LibcxxTestOutput(BaseModel):
-  Output : list[Union[ExecutedCommandBlock, CommandBlock, str]] = Field(default_factory=list)
+  Output : list[Union[StatusBlock, ExecutedCommandBlock, CommandBlock, str]] = Field(default_factory=list)
+  clang_errors : list[ClangError] = Field(default_factory=list)
+  # Every diagnostic from every command's stderr, with notes attached.
+  diagnostics : list[Diagnostic] = Field(default_factory=list)
+
+
+def find_clang_errors(text: str) -> list[ClangError]:
+  return [ClangError(file=m.group('file'), line=int(m.group('line')), column=int(m.group('column')), text=m.group('text'))
+          for m in clang_error_re.finditer(text)]
+
+
+# Bump this whenever a change to the parser changes what it produces for the
+# same output, it's part of the key for cached parse results.
+PARSER_VERSION = '2'
+
+
+def _parse_test_output(output) -> LibcxxTestOutput:
+  lexer = LineLexer(output.splitlines() if isinstance(output, str) else output, 0)
+  blocks = list(lexer.parse_blocks())
+  diagnostics = []
+  for b in blocks:
+    if isinstance(b, ExecutedCommandBlock) and b.stderr:
+      diagnostics.extend(parse_diagnostics(b.stderr).diagnostics)
+  errors = [ClangError(file=d.file, line=d.line, column=d.column or 0, text=d.text)
+            for d in diagnostics if d.severity in ('error', 'fatal error') and d.file is not None]
+  return LibcxxTestOutput(Output=blocks, clang_errors=errors, diagnostics=diagnostics)
+
+
+def _cached_parse(output: str, cache: ParseCache) -> Tuple[Optional[LibcxxTestOutput], str]:
+  key = cache.key(output, PARSER_VERSION)
+  data = cache.get(key)
+  if data is None:
+    return None, key
+  return LibcxxTestOutput.model_validate_json(data), key
+
+
+def _cache_put(cache: ParseCache, key: str, parsed: LibcxxTestOutput):
+  cache.put(key, parsed.model_dump_json(exclude_defaults=True).encode('utf-8'))
+
+
+def _record_parse(inst, output, parsed: LibcxxTestOutput):
+  lines = output.count('\n') + 1 if isinstance(output, str) else len(output)
+  inst.count('parse.outputs')
+  inst.count('parse.lines', lines)
+  for b in parsed.Output:
+    inst.count(f'parse.blocks.{type(b).__name__}')
+    if isinstance(b, ExecutedCommandBlock) and b.stderr:
+      inst.count('parse.stderr_bytes', len(b.stderr))
+  inst.count('parse.clang_errors', len(parsed.clang_errors))
+  inst.trace('parse', lines=lines, blocks=len(parsed.Output), clang_errors=len(parsed.clang_errors))
+
+
+# Parse the output of a single test, given either as a string or as a
+# LineSource. Results for strings are looked up in and added to `cache`,
+# which defaults to the one returned by get_parse_cache(). Pass cache=False
+# to always parse.
+def parse_test_output(output, cache=None) -> LibcxxTestOutput:
+  if cache is None:
+    cache = get_parse_cache()
+  if not cache or not isinstance(output, str):
+    parsed = _parse_test_output(output)
+  else:
+    parsed, key = _cached_parse(output, cache)
+    if parsed is None:
+      parsed = _parse_test_output(output)
+      _cache_put(cache, key, parsed)
+  inst = get_instrumentation()
+  if inst.enabled:
+    _record_parse(inst, output, parsed)
+  return parsed
+
+
+# Below this many outputs it's cheaper to parse in this process than to start
+# a pool and pickle everything across.
+PARALLEL_PARSE_THRESHOLD = 64
+
+
+# Parse many test outputs, using a pool of `jobs` processes (defaulting to the
+# number of CPUs) when there are enough of them to be worth it. Outputs are
+# sent to the workers in batches of `chunk_size`, and the results are returned
+# in the same order as `outputs`.
+#
+# The parse cache is consulted in this process, only outputs which miss are
+# handed to the workers.
+def parse_test_outputs(outputs, jobs: Optional[int] = None, chunk_size: int = 16,
+                       threshold: int = PARALLEL_PARSE_THRESHOLD, cache=None) -> list[LibcxxTestOutput]:
+  outputs = list(outputs)
+  if cache is None:
+    cache = get_parse_cache()
+  results = [None] * len(outputs)
+  keys = {}
+  if cache:
+    for i, o in enumerate(outputs):
+      results[i], keys[i] = _cached_parse(o, cache)
+  todo = [i for i, r in enumerate(results) if r is None]
+
+  if jobs is None:
+    jobs = os.cpu_count() or 1
+  jobs = min(jobs, -(-len(todo) // chunk_size))
+  if jobs <= 1 or len(todo) < threshold:
+    parsed = [_parse_test_output(outputs[i]) for i in todo]
+  else:
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+      parsed = list(pool.map(_parse_test_output, [outputs[i] for i in todo], chunksize=chunk_size))
+
+  for i, p in zip(todo, parsed):
+    results[i] = p
+    if cache:
+      _cache_put(cache, keys[i], p)
+
+  # Workers don't report to the instrumentation, count everything here.
+  inst = get_instrumentation()
+  if inst.enabled:
+    inst.count('parse.parallel_jobs', jobs if len(todo) >= threshold else 1)
+    for o, p in zip(outputs, results):
+      _record_parse(inst, o, p)
+  return results
+
 
@@ -0,0 +1,196 @@
+import mmap
+import os
+import re
+from array import array
+from typing import Iterator, Union
+
+from .libcxx_test_parser import _COMMENT_RULES, Token, TokenKind, classify_line
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# Rules from the parser's dispatch table which can be decided on the raw bytes
+# of a line, without decoding it. Lines matching one of these get a token
+# whose text is only decoded when it's asked for.
+_LAZY_RULES = tuple((prefix.encode('ascii'), kind, len(prefix) + (1 if kind is TokenKind.PAYLOAD else 0))
+                    for prefix, kind, pattern in _COMMENT_RULES if pattern is None)
+
+_WS = b' \t\r\n\f\v'
+_PAYLOAD_PREFIX = b'# | '
+
+
+# A line of a LineSource, with the same fields as a Token but decoded lazily.
+class LazyToken:
+  __slots__ = ('kind', 'source', 'index', 'offset')
+
+  def __init__(self, kind: TokenKind, source: 'LineSource', index: int, offset: int):
+    self.kind = kind
+    self.source = source
+    self.index = index
+    self.offset = offset
+
+  @property
+  def line(self) -> str:
+    return self.source[self.index]
+
+  @property
+  def value(self) -> str:
+    return self.source.decode(self.index, self.offset)
+
+
+# A sequence of lines backed by a bytes-like object (bytes, a memoryview, or a
+# memory mapped file) rather than a list of strings.
+#
+# The newlines are indexed in a single pass up front and lines are decoded one
+# at a time when they're accessed, so text that's never looked at is never
+# copied. It has the same splitlines() semantics (for '\n' and '\r\n' line
+# endings) as the list of lines LineLexer normally works on, and LineLexer
+# accepts either.
+class LineSource:
+  def __init__(self, buffer: Buffer, encoding: str = 'utf-8', errors: str = 'replace'):
+    self.buffer = buffer
+    self.view = memoryview(buffer)
+    self.encoding = encoding
+    self.errors = errors
+    self._mmap = None
+    self._file = None
+    self.starts = self._index(buffer)
+
+  @classmethod
+  def from_file(cls, path: Union[str, os.PathLike], **kwargs) -> 'LineSource':
+    f = open(path, 'rb')
+    if os.fstat(f.fileno()).st_size == 0:
+      f.close()
+      return cls(b'', **kwargs)
+    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    source = cls(m, **kwargs)
+    source._mmap, source._file = m, f
+    return source
+
+  def close(self):
+    self.view.release()
+    if self._mmap is not None:
+      self._mmap.close()
+      self._file.close()
+      self._mmap = self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  @staticmethod
+  def _index(buffer: Buffer) -> array:
+    size = len(memoryview(buffer).cast('B'))
+    starts = array('q', [0])
+    find = getattr(buffer, 'find', None)
+    if find is not None:
+      pos = find(b'\n')
+      while pos != -1:
+        starts.append(pos + 1)
+        pos = find(b'\n', pos + 1)
+    else:
+      starts.extend(m.end() for m in re.finditer(b'\n', buffer))
+    # Like splitlines(), a trailing newline doesn't start another line. The
+    # final entry is where the line after the last one would start, so line i
+    # always ends one byte (its newline) before starts[i + 1].
+    trailing = starts[-1] == size
+    if trailing:
+      starts.pop()
+    starts.append(size if trailing else size + 1)
+    return starts
+
+  def __len__(self) -> int:
+    return len(self.starts) - 1
+
+  def span(self, i: int) -> tuple[int, int]:
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError('line index out of range')
+    start, end = self.starts[i], self.starts[i + 1] - 1
+    if end > start and self.view[end - 1] == 0x0d:
+      end -= 1
+    return start, end
+
+  def raw(self, i: int) -> memoryview:
+    start, end = self.span(i)
+    return self.view[start:end]
+
+  def decode(self, i: int, offset: int = 0) -> str:
+    start, end = self.span(i)
+    return str(self.view[min(start + offset, end):end], self.encoding, self.errors)
+
+  def startswith(self, i: int, prefix: bytes) -> bool:
+    start, end = self.span(i)
+    return end - start >= len(prefix) and self.view[start:start + len(prefix)] == prefix
+
+  def __getitem__(self, i: int) -> str:
+    return self.decode(i)
+
+  def __iter__(self) -> Iterator[str]:
+    for i in range(len(self)):
+      yield self.decode(i)
+
+  # The values of payload lines `start` to `end` joined with newlines, as the
+  # parser keeps them. When every line has the usual '# | ' prefix the run is
+  # decoded in one go rather than line by line.
+  def join_payload(self, start: int, end: int) -> str:
+    if start >= end:
+      return ''
+    first, last = self.starts[start], self.starts[end] - 1
+    raw = bytes(self.view[first:last])
+    if b'\r' not in raw and raw.startswith(_PAYLOAD_PREFIX) and raw.count(b'\n' + _PAYLOAD_PREFIX) == end - start - 1:
+      return str(raw[len(_PAYLOAD_PREFIX):].replace(b'\n' + _PAYLOAD_PREFIX, b'\n'), self.encoding, self.errors)
+    return '\n'.join([self.decode(i, len(_PAYLOAD_PREFIX)) for i in range(start, end)])
+
+  def tokenize(self) -> list[Union[Token, LazyToken]]:
+    tokens = []
+    view = self.view
+    for i in range(len(self)):
+      start, end = self.span(i)
+      first = view[start] if end > start else None
+      if first == 0x23:  # '#'
+        for prefix, kind, offset in _LAZY_RULES:
+          if end - start >= len(prefix) and view[start:start + len(prefix)] == prefix:
+            tokens.append(LazyToken(kind, self, i, offset))
+            break
+        else:
+          tokens.append(classify_line(self.decode(i)))
+      elif first is None or first in b'EC' or bytes(view[start:min(end, start + 1)]).strip(_WS) == b'':
+        tokens.append(classify_line(self.decode(i)))
+      else:
+        tokens.append(LazyToken(TokenKind.TEXT, self, i, 0))
+    return tokens
+
+
+import unittest
+
+class TestLineSource(unittest.TestCase):
+  def test_lines(self):
+    for text in ['', 'a', 'a\n', 'a\nb', 'a\r\nb\r\n', '\n\nx\n', 'café\n#\n']:
+      for buf in [text.encode('utf-8'), memoryview(text.encode('utf-8'))]:
+        self.assertEqual(list(LineSource(buf)), text.splitlines(), repr(text))
+
+  def test_lexer(self):
+    from .libcxx_test_parser import LineLexer, TEST_CASES, _parse_test_output
+    for t in TEST_CASES:
+      source = LineSource(t.encode('utf-8'))
+      expected = LineLexer(t.splitlines(), 0).tokens
+      self.assertEqual([(tok.kind, tok.line, tok.value) for tok in LineLexer(source, 0).tokens],
+                       [tuple(tok) for tok in expected])
+      self.assertEqual(_parse_test_output(source), _parse_test_output(t))
+      # Payload runs which can't be decoded in one go: CRLF line endings and
+      # lines with nothing after '# |'.
+      for odd in [t.replace('\n', '\r\n'), t.replace('# | ', '# |\n# | ', 1)]:
+        self.assertEqual(_parse_test_output(LineSource(odd.encode('utf-8'))), _parse_test_output(odd))
+
+  def test_from_file(self):
+    import tempfile
+    from .libcxx_test_parser import TEST_CASES, _parse_test_output
+    with tempfile.NamedTemporaryFile(suffix='.txt') as f:
+      f.write(TEST_CASES[2].encode('utf-8'))
+      f.flush()
+      with LineSource.from_file(f.name) as source:
+        self.assertTrue(source.startswith(3, b'Command Output'))
+        self.assertEqual(_parse_test_output(source), _parse_test_output(TEST_CASES[2]))
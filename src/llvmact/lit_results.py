@@ -0,0 +1,226 @@
+import codecs
+import io
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from .types.llvm import TestResult
+
+_WS = ' \t\n\r'
+# What can follow a complete value (or key) inside the results.
+_DELIMITERS = frozenset(',:]}' + _WS)
+
+
+# Incremental reader for the JSON file written by `lit --output`. Only the
+# test currently being decoded is held in memory, so reading a results file
+# costs the same no matter how many tests it contains.
+#
+#   reader = LITResultsReader('results.json')
+#   for test in reader:
+#     ...
+#
+# The top level fields other than `tests` (`__version__`, `elapsed`) are
+# stored on the reader as they are encountered. lit writes them before the
+# tests, so they're normally available once iteration has started.
+#
+# With validate=False the tests are yielded as the dicts decoded from the
+# JSON, skipping the cost of building a TestResult for each one.
+class LITResultsReader:
+  def __init__(self, source: Union[str, os.PathLike, io.IOBase], chunk_size: int = 1 << 16,
+               validate: bool = True):
+    self.source = source
+    self.chunk_size = chunk_size
+    self.validate = validate
+    self.fields: dict[str, Any] = {}
+    self._file = None
+    self._decoder = None
+    self._buf = ''
+    self._pos = 0
+    self._eof = False
+    self._json = json.JSONDecoder()
+
+  @property
+  def version(self) -> Optional[tuple[int, int, int]]:
+    v = self.fields.get('__version__')
+    return tuple(v) if v is not None else None
+
+  @property
+  def elapsed(self) -> Optional[float]:
+    return self.fields.get('elapsed')
+
+  def __iter__(self) -> Iterator[TestResult]:
+    if isinstance(self.source, (str, os.PathLike)):
+      with open(self.source, 'rb') as f:
+        yield from self._read(f)
+    else:
+      yield from self._read(self.source)
+
+  def _read(self, f) -> Iterator[TestResult]:
+    self._file = f
+    self._decoder = codecs.getincrementaldecoder('utf-8')()
+    self._buf, self._pos, self._eof = '', 0, False
+    self._expect('{')
+    while self._peek_char() != '}':
+      key = self._decode_value()
+      self._expect(':')
+      if key == 'tests':
+        yield from self._read_tests()
+      else:
+        self.fields[key] = self._decode_value()
+      if self._peek_char() == ',':
+        self._pos += 1
+    self._pos += 1
+
+  def _read_tests(self) -> Iterator[TestResult]:
+    self._expect('[')
+    while self._peek_char() != ']':
+      value = self._decode_value()
+      yield TestResult.model_validate(value) if self.validate else value
+      if self._peek_char() == ',':
+        self._pos += 1
+    self._pos += 1
+
+  def _fill(self, size: int) -> bool:
+    if self._eof:
+      return False
+    # Drop everything that's already been consumed before growing the buffer.
+    if self._pos:
+      self._buf = self._buf[self._pos:]
+      self._pos = 0
+    data = self._file.read(size)
+    if isinstance(data, bytes):
+      data = self._decoder.decode(data, final=not data)
+    if not data:
+      self._eof = True
+      return False
+    self._buf += data
+    return True
+
+  def _peek_char(self) -> str:
+    while True:
+      buf = self._buf
+      n = len(buf)
+      pos = self._pos
+      while pos < n and buf[pos] in _WS:
+        pos += 1
+      self._pos = pos
+      if pos < n:
+        return buf[pos]
+      if not self._fill(self.chunk_size):
+        raise ValueError('unexpected end of lit results')
+
+  def _expect(self, c: str):
+    if self._peek_char() != c:
+      raise ValueError(f'malformed lit results: expected {c!r} at {self._buf[self._pos:self._pos + 20]!r}')
+    self._pos += 1
+
+  def _decode_value(self) -> Any:
+    self._peek_char()
+    size = self.chunk_size
+    while True:
+      try:
+        value, end = self._json.raw_decode(self._buf, self._pos)
+        # A number cut off by the end of the buffer may look complete ('1'
+        # of '1.25') or end early ('1' of '1.'), so only a value followed by
+        # a delimiter is known to be whole.
+        if (end < len(self._buf) and self._buf[end] in _DELIMITERS) or self._eof:
+          self._pos = end
+          return value
+      except json.JSONDecodeError:
+        if self._eof:
+          raise
+      # Grow geometrically so that a single huge test output doesn't get
+      # re-scanned once per chunk.
+      self._fill(size)
+      size *= 2
+
+
+def iter_test_results(source: Union[str, os.PathLike, io.IOBase], chunk_size: int = 1 << 16) -> Iterator[TestResult]:
+  return iter(LITResultsReader(source, chunk_size))
+
+
+# Whether `source` holds lit's JSON ('json') or JUnit XML ('xml'), from its
+# first character. File objects are left where they were.
+def results_format(source: Union[str, os.PathLike, io.IOBase]) -> str:
+  if isinstance(source, (str, os.PathLike)):
+    with open(source, 'rb') as f:
+      head = f.read(256)
+  elif hasattr(source, 'peek'):
+    head = source.peek(256)[:256]
+  else:
+    pos = source.tell()
+    head = source.read(256)
+    source.seek(pos)
+  if isinstance(head, str):
+    head = head.encode('utf-8')
+  head = head.removeprefix(codecs.BOM_UTF8).lstrip()
+  return 'xml' if head.startswith(b'<') else 'json'
+
+
+# A reader for either kind of results file: lit's JSON, or the JUnit XML of
+# `lit --xunit-xml-output`. `root` is only used for XML, see
+# JUnitResultsReader.
+def read_results(source: Union[str, os.PathLike, io.IOBase], validate: bool = True,
+                 root: Optional[Union[str, os.PathLike]] = None):
+  if results_format(source) == 'xml':
+    from .junit_results import JUnitResultsReader
+    return JUnitResultsReader(source, root=root, validate=validate)
+  return LITResultsReader(source, validate=validate)
+
+
+import unittest
+
+class TestLITResultsReader(unittest.TestCase):
+  results_path = Path(__file__).resolve().parents[2] / 'python-test' / 'results.json'
+
+  def test_matches_model(self):
+    from .types.llvm import LITTestResults
+    expected = LITTestResults.model_validate_json(self.results_path.read_text())
+    for chunk_size in [1, 7, 1 << 16]:
+      reader = LITResultsReader(self.results_path, chunk_size=chunk_size)
+      tests = list(reader)
+      self.assertEqual(tests, expected.tests)
+      self.assertEqual(reader.version, expected.version)
+      self.assertEqual(reader.elapsed, expected.elapsed)
+
+  def test_file_objects(self):
+    text = '{"__version__": [18, 0, 0], "elapsed": 1.25, "tests": [' \
+           '{"code": "PASS", "elapsed": 0.5, "name": "s :: a.pass.cpp", "output": "café"},' \
+           '{"code": "FAIL", "elapsed": 0.75, "name": "s :: b.pass.cpp", "output": ""}]}'
+    for f in [io.StringIO(text), io.BytesIO(text.encode('utf-8'))]:
+      reader = LITResultsReader(f, chunk_size=3)
+      tests = list(reader)
+      self.assertEqual([t.code for t in tests], ['PASS', 'FAIL'])
+      self.assertEqual(tests[0].output, 'café')
+      self.assertEqual(reader.elapsed, 1.25)
+    raw = list(LITResultsReader(io.StringIO(text), validate=False))
+    self.assertEqual(raw[1], {'code': 'FAIL', 'elapsed': 0.75, 'name': 's :: b.pass.cpp', 'output': ''})
+
+  def test_result_codes(self):
+    codes = ['UNSUPPORTED', 'XFAIL', 'UNRESOLVED', 'TIMEOUT', 'FLAKYPASS', 'XPASS']
+    tests = ', '.join(f'{{"code": "{c}", "elapsed": 0.0, "name": "s :: {c}.pass.cpp", "output": ""}}' for c in codes)
+    reader = LITResultsReader(io.StringIO(f'{{"__version__": [18, 0, 0], "elapsed": 1.0, "tests": [{tests}]}}'))
+    self.assertEqual([t.code for t in reader], codes)
+
+  def test_read_results(self):
+    xml = b'<?xml version="1.0"?>\n<testsuites><testsuite name="s"><testcase classname="s.a" name="t.pass.cpp"/>' \
+          b'</testsuite></testsuites>'
+    self.assertEqual([t.name for t in read_results(io.BytesIO(xml))], ['s :: a/t.pass.cpp'])
+    self.assertEqual(results_format(self.results_path), 'json')
+    self.assertEqual(len(list(read_results(self.results_path))), len(list(LITResultsReader(self.results_path))))
+
+  def test_every_chunk_size(self):
+    doc = ('{"__version__": [18, 0, 0], "elapsed": 1.25, "tests": [{"code": "PASS", "elapsed": 1e-3, '
+           '"name": "s :: a.pass.cpp", "output": "x", "metrics": {"n": 12, "f": -0.5E+2, "ok": true, "z": null}}, '
+           '{"code": "FAIL", "elapsed": 10, "name": "s :: b.pass.cpp", "output": "caf\\u00e9 \\"q\\""}]}')
+    expected = json.loads(doc)
+    for chunk_size in range(1, len(doc) + 1):
+      reader = LITResultsReader(io.StringIO(doc), chunk_size=chunk_size, validate=False)
+      tests = list(reader)
+      self.assertEqual(tests, expected['tests'], chunk_size)
+      self.assertEqual((reader.fields['elapsed'], list(reader.version)), (1.25, [18, 0, 0]), chunk_size)
+
+  def test_truncated(self):
+    with self.assertRaises(ValueError):
+      list(LITResultsReader(io.StringIO('{"elapsed": 1.0, "tests": [{"code": "PASS"')))
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Optional, Union
+
+from .instrument import get_instrumentation
+
+# Default cap on the size of a cache directory.
+DEFAULT_MAX_BYTES = 256 << 20
+
+
+# A content addressed on-disk cache for parsed test output.
+#
+# Entries are keyed by a hash of the raw output together with a version
+# string, so bumping the version invalidates everything parsed by older code.
+# Values are opaque bytes, stored zlib compressed, one file per entry. Reads
+# refresh an entry's mtime, and when the directory grows past `max_bytes` the
+# least recently used entries are removed.
+#
+# Writes go through a temporary file and a rename, so several processes can
+# share a cache directory.
+class ParseCache:
+  def __init__(self, directory: Union[str, os.PathLike], max_bytes: int = DEFAULT_MAX_BYTES):
+    self.directory = Path(directory)
+    self.directory.mkdir(parents=True, exist_ok=True)
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.size = sum(st.st_size for _, st in self._entries())
+
+  @staticmethod
+  def key(output: str, version: str) -> str:
+    h = hashlib.sha256(version.encode('utf-8'))
+    h.update(b'\0')
+    h.update(output.encode('utf-8', 'surrogatepass'))
+    return h.hexdigest()
+
+  def _path(self, key: str) -> Path:
+    return self.directory / key[:2] / key[2:]
+
+  def _entries(self):
+    for sub in os.scandir(self.directory):
+      if not sub.is_dir():
+        continue
+      for e in os.scandir(sub.path):
+        if e.is_file() and not e.name.startswith('.'):
+          yield e.path, e.stat()
+
+  def get(self, key: str) -> Optional[bytes]:
+    path = self._path(key)
+    try:
+      data = path.read_bytes()
+    except FileNotFoundError:
+      self.misses += 1
+      get_instrumentation().count('parse_cache.misses')
+      return None
+    try:
+      os.utime(path)
+    except FileNotFoundError:
+      pass
+    self.hits += 1
+    get_instrumentation().count('parse_cache.hits')
+    return zlib.decompress(data)
+
+  def put(self, key: str, value: bytes):
+    path = self._path(key)
+    path.parent.mkdir(exist_ok=True)
+    data = zlib.compress(value)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.')
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    # The entry may already exist, written by us or another process.
+    try:
+      old = path.stat().st_size
+    except FileNotFoundError:
+      old = 0
+    os.replace(tmp, path)
+    self.size += len(data) - old
+    if self.size > self.max_bytes:
+      self.evict()
+
+  # Remove least recently used entries until the cache is comfortably under
+  # its cap, so that we don't end up evicting on every put.
+  def evict(self, target: Optional[int] = None):
+    if target is None:
+      target = self.max_bytes * 9 // 10
+    entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+    size = sum(st.st_size for _, st in entries)
+    for path, st in entries:
+      if size <= target:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        continue
+      size -= st.st_size
+      self.evictions += 1
+      get_instrumentation().count('parse_cache.evictions')
+    self.size = size
+
+  def stats(self) -> dict[str, int]:
+    return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'bytes': self.size}
+
+
+_default_cache: Optional[ParseCache] = None
+_default_cache_loaded = False
+
+
+# The cache used by the parser when one isn't passed explicitly. Unless one
+# has been installed with set_parse_cache(), it's created from the
+# LLVMACT_PARSE_CACHE (directory) and LLVMACT_PARSE_CACHE_MAX_BYTES
+# environment variables, and is None when those aren't set.
+def get_parse_cache() -> Optional[ParseCache]:
+  global _default_cache, _default_cache_loaded
+  if not _default_cache_loaded:
+    _default_cache_loaded = True
+    directory = os.environ.get('LLVMACT_PARSE_CACHE')
+    if directory:
+      max_bytes = int(os.environ.get('LLVMACT_PARSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+      _default_cache = ParseCache(directory, max_bytes)
+  return _default_cache
+
+
+def set_parse_cache(cache: Optional[ParseCache]):
+  global _default_cache, _default_cache_loaded
+  _default_cache = cache
+  _default_cache_loaded = True
+
+
+import unittest
+
+class TestParseCache(unittest.TestCase):
+  def test_get_put(self):
+    with tempfile.TemporaryDirectory() as d:
+      cache = ParseCache(d)
+      k = ParseCache.key('output', '1')
+      self.assertNotEqual(k, ParseCache.key('output', '2'))
+      self.assertIsNone(cache.get(k))
+      cache.put(k, b'parsed')
+      self.assertEqual(cache.get(k), b'parsed')
+      self.assertEqual((cache.hits, cache.misses), (1, 1))
+      self.assertEqual(ParseCache(d).get(k), b'parsed')
+
+  def test_overwrite(self):
+    with tempfile.TemporaryDirectory() as d:
+      cache = ParseCache(d)
+      k = ParseCache.key('output', '1')
+      cache.put(k, b'parsed')
+      cache.put(k, b'parsed again')
+      self.assertEqual(cache.size, cache._path(k).stat().st_size)
+      self.assertEqual(cache.stats()['bytes'], ParseCache(d).size)
+
+  def test_lru_eviction(self):
+    with tempfile.TemporaryDirectory() as d:
+      cache = ParseCache(d, max_bytes=1 << 30)
+      keys = [ParseCache.key(str(i), '1') for i in range(4)]
+      for i, k in enumerate(keys):
+        cache.put(k, os.urandom(1000))
+        os.utime(cache._path(k), (i, i))
+      # Reading the oldest entry makes it the most recently used.
+      self.assertIsNotNone(cache.get(keys[0]))
+      cache.evict(target=cache.size - 1500)
+      self.assertEqual(cache.evictions, 2)
+      self.assertEqual([cache.get(k) is not None for k in keys], [True, False, False, True])
@@ -0,0 +1,192 @@
+import argparse
+import os
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .failure_summary import DETAILS_BUDGET
+from .history import HistoryStore
+from .instrument import enable_instrumentation, get_instrumentation
+from .libcxx_test_parser import parse_test_outputs
+from .lit_results import LITResultsReader, read_results
+from .parse_cache import ParseCache, set_parse_cache
+from .report import Report, config_of
+from .types.llvm import FAILING_CODES, TestResult
+
+# Turns one lit results file into a check run. This is `python -m llvmact
+# report`, formerly python-test/main.py.
+
+# Tests flipping between pass and fail in at least this fraction of their
+# runs are called out as flaky in the summary.
+FLAKY_RATE = 0.2
+
+
+# With `history`, the run is recorded in the store. With `baseline_diff` as
+# well, failures which are the same as in the previous run are counted but
+# neither parsed nor annotated, and tests which no longer fail are listed.
+# With `perf` too (a regressions.Thresholds), passing tests whose
+# `perf_metric` grew compared with the median of their last `perf_runs` runs
+# get a warning.
+def process_results(tests: Iterable[TestResult], jobs: Optional[int] = None, config: Optional[str] = None,
+                    history: Optional[HistoryStore] = None, baseline_diff: bool = False,
+                    perf=None, perf_metric: str = 'elapsed', perf_runs: int = 5,
+                    details_budget: int = DETAILS_BUDGET) -> Report:
+  inst = get_instrumentation()
+  report = Report(details_budget)
+  failures = []
+  failing = []
+  passing = []
+  baseline = None
+  if history and perf:
+    from .regressions import Baseline
+    with inst.phase('baseline'):
+      baseline = Baseline.from_history(history, perf_runs, perf_metric, config)
+  with inst.phase('load'):
+    with history.run(os.environ.get('GITHUB_SHA')) if history else nullcontext() as run:
+      for test in tests:
+        report.add_result(test, config)
+        status = run.add(test, config) if run else None
+        if test.code in FAILING_CODES:
+          failing.append(test)
+        elif baseline is not None and test.code == 'PASS':
+          passing.append(test)
+        if baseline_diff and status == 'fixed':
+          report.add_fixed(test, config)
+        elif baseline_diff and status == 'unchanged':
+          report.add_known_failure(test, config)
+        elif test.code in FAILING_CODES:
+          failures.append(test)
+    if history:
+      for test in failing:
+        f = history.flakiness(config_of(test, config), test.name)
+        if f and f.runs >= 5 and f.rate >= FLAKY_RATE:
+          report.flaky.append((test.name, f.rate))
+  inst.count('report.failures', len(failures))
+  if baseline is not None:
+    from .regressions import find_regressions
+    with inst.phase('regressions'):
+      report.add_regressions(find_regressions(baseline, passing, config, perf_metric, perf), perf_metric)
+    inst.count('report.regressions', len(report.regressions))
+
+  with inst.phase('parse'):
+    parsed = parse_test_outputs([test.output for test in failures], jobs=jobs)
+  with inst.phase('annotate'):
+    for test, output in zip(failures, parsed):
+      report.add_failure(test, output, config)
+  return report
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+  parser.add_argument('input_file', help='the results.json produced by lit, or its test-results.xml')
+  parser.add_argument('-j', '--jobs', type=int, default=None,
+                      help='processes used to parse failing test output (default: CPU count)')
+  parser.add_argument('--parse-cache', default=os.environ.get('LLVMACT_PARSE_CACHE'),
+                      help='directory used to cache parsed test output across runs')
+  parser.add_argument('--config', default=None,
+                      help='name of the CI configuration the results came from')
+  parser.add_argument('--history', default=os.environ.get('LLVMACT_HISTORY'),
+                      help='SQLite database of previous runs; this run is added to it')
+  parser.add_argument('--baseline-diff', action='store_true',
+                      help='only annotate failures which are new or whose output changed since the previous run (needs --history)')
+  parser.add_argument('--perf-regressions', action='store_true',
+                      help='warn about passing tests which got slower than in previous runs (needs --history)')
+  parser.add_argument('--perf-metric', default='elapsed',
+                      help="what to compare: 'elapsed' or the name of a lit metric")
+  parser.add_argument('--perf-runs', type=int, default=5,
+                      help='number of previous runs whose median is the baseline')
+  parser.add_argument('--perf-ratio', type=float, default=1.5,
+                      help='flag tests at least this many times slower than the baseline')
+  parser.add_argument('--perf-min-delta', type=float, default=1.0,
+                      help='and at least this much slower in absolute terms')
+  parser.add_argument('--details-budget', type=int, default=DETAILS_BUDGET,
+                      help='bytes of test output kept in the details of each annotation')
+  parser.add_argument('--instrument', action='store_true', default=bool(os.environ.get('LLVMACT_INSTRUMENT')),
+                      help='collect timings and counters and add them to the step summary')
+  parser.add_argument('--stats-json', default=None,
+                      help='write the collected timings and counters to this file (implies --instrument)')
+  parser.add_argument('--name', default='Libc++ Test Suite', help='name of the check run')
+  parser.add_argument('--repo', default=os.environ.get('GITHUB_REPOSITORY', 'efcs/action'))
+  parser.add_argument('--sha', default=os.environ.get('GITHUB_SHA'), help='commit the check run is for')
+  parser.add_argument('--dry-run', action='store_true', help='print the summary instead of creating a check run')
+
+
+def run(args: argparse.Namespace) -> int:
+  if args.baseline_diff and not args.history:
+    raise SystemExit('--baseline-diff needs --history')
+  if args.perf_regressions and not args.history:
+    raise SystemExit('--perf-regressions needs --history')
+
+  if args.instrument or args.stats_json:
+    enable_instrumentation()
+  inst = get_instrumentation()
+
+  cache = None
+  if args.parse_cache:
+    cache = ParseCache(args.parse_cache)
+    set_parse_cache(cache)
+
+  perf = None
+  if args.perf_regressions:
+    from .regressions import Thresholds
+    perf = Thresholds(ratio=args.perf_ratio, min_delta=args.perf_min_delta)
+
+  # Stream the tests rather than loading the whole file, results from a
+  # full run can be hundreds of MB.
+  results = read_results(args.input_file)
+  history = HistoryStore(args.history) if args.history else None
+  try:
+    report = process_results(results, jobs=args.jobs, config=args.config, history=history,
+                             baseline_diff=args.baseline_diff, perf=perf, perf_metric=args.perf_metric,
+                             perf_runs=args.perf_runs, details_budget=args.details_budget)
+  finally:
+    if history is not None:
+      history.close()
+  annotations = report.annotations()
+  summary = report.summary()
+  inst.count('report.annotations', len(annotations))
+  if cache is not None:
+    print(cache.stats())
+
+  if args.dry_run:
+    print(summary)
+  else:
+    # The checks API only takes 50 annotations per request, so the uploader
+    # creates the run and then adds the annotations in batches.
+    from .checks import CheckRunUploader
+    uploader = CheckRunUploader(args.repo, os.environ['GITHUB_TOKEN'],
+                                api_url=os.environ.get('GITHUB_API_URL', 'https://api.github.com'))
+    with inst.phase('upload'):
+      check_run = uploader.publish(name=args.name, head_sha=args.sha, conclusion=report.conclusion,
+                                   title='Check Run Output', summary=summary, annotations=annotations)
+    print(f"Check run {check_run['id']} completed: {report.conclusion}, {len(annotations)} annotations")
+
+  if inst.enabled:
+    inst.write_step_summary()
+    if args.stats_json:
+      Path(args.stats_json).write_text(inst.to_json(indent=2))
+  return 0
+
+
+def main(argv=None) -> int:
+  parser = argparse.ArgumentParser(prog='python -m llvmact report', description='Create a check run from lit results')
+  add_arguments(parser)
+  return run(parser.parse_args(argv))
+
+
+import unittest
+
+class TestPipeline(unittest.TestCase):
+  results_path = Path(__file__).resolve().parents[2] / 'python-test' / 'results.json'
+
+  def test_process_results(self):
+    report = process_results(LITResultsReader(self.results_path), jobs=1)
+    self.assertEqual(report.conclusion, 'failure')
+    self.assertEqual(report.failures, 2)
+    self.assertEqual(len(report.annotations()), 2)
+
+  def test_baseline_diff(self):
+    history = HistoryStore()
+    process_results(LITResultsReader(self.results_path), jobs=1, history=history, baseline_diff=True)
+    report = process_results(LITResultsReader(self.results_path), jobs=1, history=history, baseline_diff=True)
+    self.assertEqual((report.failures, report.known_failures), (0, 2))
+    self.assertEqual(report.annotations(), [])
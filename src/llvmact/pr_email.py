@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+from typing import Any, Optional
+
+# The e-mail address of the author of a pull request's latest commit, so that
+# the results of a run can be sent to them. This is `python -m llvmact
+# email`, formerly get-email/main.py. Asking git (--ref) doesn't need
+# requests, so the API client is only imported when the API is used.
+
+
+# Every commit of the pull request, oldest first. The latest is on the last
+# page when there are more than 100.
+def get_commits(url: str, client: 'GitHubClient') -> list[dict[str, Any]]:
+  return client.paginate(url)
+
+
+def author_email(commits: list[dict[str, Any]]) -> Optional[str]:
+  if not commits:
+    return None
+  return commits[-1]['commit']['author']['email']
+
+
+# Without the API, ask git about the checked out branch.
+def git_author_email(ref: str = 'HEAD') -> str:
+  return subprocess.run(['git', 'log', '-n', '1', '--pretty=format:%ae', ref],
+                        check=True, capture_output=True, text=True).stdout.strip()
+
+
+def run(args) -> int:
+  url = args.commits_url or os.environ.get('PULL_REQUEST_COMMITS_HREF')
+  if url:
+    from .github_client import GitHubClient
+    client = GitHubClient(os.environ.get('GITHUB_TOKEN'), cache_dir=args.cache_dir,
+                          api_url=os.environ.get('GITHUB_API_URL', 'https://api.github.com'))
+    email = author_email(get_commits(url, client))
+  else:
+    email = git_author_email(args.ref)
+  if not email:
+    raise SystemExit('no commits to take an e-mail address from')
+  print(email)
+  if args.output:
+    from .workflow import WorkflowCommands
+    with WorkflowCommands() as wf:
+      wf.set_output(args.output, email)
+  return 0
+
+
+import unittest
+
+class TestPrEmail(unittest.TestCase):
+  def test_author_email(self):
+    from .fake_github import FakeGitHub
+    from .github_client import GitHubClient
+    commits = [{'commit': {'author': {'email': f'dev{i}@example.com'}}} for i in range(2)]
+    with FakeGitHub() as gh:
+      gh.route('GET', '/repos/efcs/action/pulls/1/commits', lambda *_: (200, {}, commits))
+      client = GitHubClient('token', api_url=gh.url)
+      self.assertEqual(author_email(get_commits('/repos/efcs/action/pulls/1/commits', client)),
+                       'dev1@example.com')
+    self.assertIsNone(author_email([]))
+
+  def test_git_without_requests(self):
+    from pathlib import Path
+    src = Path(__file__).resolve().parents[1]
+    code = ('import sys\n'
+            'from llvmact.pr_email import git_author_email\n'
+            'git_author_email()\n'
+            'print("requests" in sys.modules)\n')
+    out = subprocess.run([sys.executable, '-c', code], cwd=src, check=True, capture_output=True, text=True,
+                         env={**os.environ, 'PYTHONPATH': str(src)}).stdout
+    self.assertEqual(out.strip(), 'False')
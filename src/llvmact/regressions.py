@@ -0,0 +1,208 @@
+import warnings
+from typing import Any, Iterable, NamedTuple, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from .history import HistoryStore
+from .report import config_of
+from .types.llvm import TestResult
+
+# Flags tests which got slower than they used to be.
+#
+# The baseline for a test is the median of its last N passing runs in the
+# same configuration, read from the history store. A test has regressed when
+# its new value is well above that median by every measure in Thresholds, so
+# a single slow run in the baseline or a noisy short test doesn't trip it.
+#
+#   baseline = Baseline.from_history(store, runs=5)
+#   regressions = find_regressions(baseline, tests)
+#
+# Both sides are numpy arrays; the only per-test Python work is looking up a
+# test's row in the baseline.
+
+
+class Thresholds(BaseModel):
+  # New value must be at least this multiple of the baseline median...
+  ratio: float = 1.5
+  # ...and at least this much larger in absolute terms (seconds for elapsed),
+  # which keeps tests that take a few milliseconds out of it...
+  min_delta: float = 1.0
+  # ...and this many median absolute deviations above the median, so tests
+  # which are always noisy need a larger jump.
+  mad_factor: float = 3.0
+  # Tests with fewer baseline samples than this are never flagged.
+  min_samples: int = 3
+
+
+class Regression(NamedTuple):
+  config: str
+  name: str
+  value: float
+  baseline: float
+  samples: int
+
+  @property
+  def ratio(self) -> float:
+    return self.value / self.baseline if self.baseline else float('inf')
+
+
+# Baseline samples of one metric, one row per (config, test) and one column
+# per sample, padded with NaN.
+class Baseline:
+  def __init__(self, keys: dict[tuple[str, str], int], samples: np.ndarray):
+    self.keys = keys
+    self.samples = samples
+    self.count = np.count_nonzero(~np.isnan(samples), axis=1)
+    self.median = _nanmedian(samples)
+    self.mad = _nanmedian(np.abs(samples - self.median[:, None]))
+
+  def __len__(self):
+    return len(self.keys)
+
+  # From (config, name, value) triples, newest first; only the first `runs`
+  # samples of each test are kept.
+  @classmethod
+  def from_samples(cls, samples: Iterable[tuple[str, str, float]], runs: int = 5) -> 'Baseline':
+    keys: dict[tuple[str, str], int] = {}
+    seen: list[int] = []
+    rows, cols, values = [], [], []
+    for config, name, value in samples:
+      i = keys.setdefault((config, name), len(keys))
+      if i == len(seen):
+        seen.append(0)
+      if seen[i] >= runs:
+        continue
+      rows.append(i)
+      cols.append(seen[i])
+      values.append(value)
+      seen[i] += 1
+    matrix = np.full((len(keys), runs), np.nan)
+    matrix[np.array(rows, np.intp), np.array(cols, np.intp)] = values
+    return cls(keys, matrix)
+
+  # The last `runs` passing results of every test recorded in `store` (for
+  # one configuration, if given). `metric` is 'elapsed' or the name of one of
+  # lit's metrics.
+  @classmethod
+  def from_history(cls, store: HistoryStore, runs: int = 5, metric: str = 'elapsed',
+                   config: Optional[str] = None) -> 'Baseline':
+    if metric == 'elapsed':
+      source = "SELECT run_id, config, name, elapsed AS value FROM results WHERE code = 'PASS' AND elapsed IS NOT NULL"
+      params: list[Any] = []
+    else:
+      source = '''SELECT m.run_id, m.config, m.name, m.value FROM metrics m
+                  JOIN results r USING (run_id, config, name) WHERE r.code = 'PASS' AND m.metric = ?'''
+      params = [metric]
+    if config is not None:
+      source = f'SELECT * FROM ({source}) WHERE config = ?'
+      params.append(config)
+    rows = store.db.execute(f'''
+      SELECT config, name, value FROM (
+        SELECT config, name, value, row_number() OVER (PARTITION BY config, name ORDER BY run_id DESC) AS n
+        FROM ({source}))
+      WHERE n <= ?''', params + [runs])
+    return cls.from_samples(rows, runs)
+
+
+def _nanmedian(a: np.ndarray) -> np.ndarray:
+  if not a.size:
+    return np.full(len(a), np.nan)
+  # np.nanmedian warns about all-NaN rows; those are never flagged anyway
+  # because of min_samples.
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore', RuntimeWarning)
+    return np.nanmedian(a, axis=1)
+
+
+# Compare arrays of new values against the baseline. Returns a boolean mask
+# of regressed tests and the baseline row of each test (-1 when it has none).
+def compare(baseline: Baseline, keys: list[tuple[str, str]], values: np.ndarray,
+            thresholds: Thresholds = Thresholds()) -> tuple[np.ndarray, np.ndarray]:
+  get = baseline.keys.get
+  rows = np.fromiter((get(k, -1) for k in keys), dtype=np.intp, count=len(keys))
+  known = rows >= 0
+  if not len(baseline):
+    return np.zeros(len(keys), bool), rows
+  safe = np.where(known, rows, 0)
+  median, mad, count = baseline.median[safe], baseline.mad[safe], baseline.count[safe]
+  delta = values - median
+  with np.errstate(invalid='ignore'):
+    mask = (known & (count >= thresholds.min_samples)
+            & (values >= median * thresholds.ratio)
+            & (delta >= thresholds.min_delta)
+            & (delta >= mad * thresholds.mad_factor))
+  return mask, rows
+
+
+def value_of(test: TestResult, metric: str = 'elapsed') -> Optional[float]:
+  return test.elapsed if metric == 'elapsed' else test.metrics.get(metric)
+
+
+# The passing tests in `tests` which regressed, most regressed first.
+def find_regressions(baseline: Baseline, tests: Iterable[TestResult], config: Optional[str] = None,
+                     metric: str = 'elapsed', thresholds: Thresholds = Thresholds()) -> list[Regression]:
+  keys, values = [], []
+  for t in tests:
+    v = value_of(t, metric)
+    if t.code != 'PASS' or v is None:
+      continue
+    keys.append((config_of(t, config), t.name))
+    values.append(v)
+  values = np.array(values, dtype=np.float64)
+  mask, rows = compare(baseline, keys, values, thresholds)
+  found = [Regression(keys[i][0], keys[i][1], float(values[i]), float(baseline.median[rows[i]]),
+                      int(baseline.count[rows[i]])) for i in np.flatnonzero(mask)]
+  return sorted(found, key=lambda r: (-r.ratio, r.config, r.name))
+
+
+import unittest
+
+class TestRegressions(unittest.TestCase):
+  def test_baseline(self):
+    samples = [('c', 'a', 1.0), ('c', 'a', 3.0), ('c', 'a', 2.0), ('c', 'a', 100.0), ('c', 'b', 5.0)]
+    baseline = Baseline.from_samples(samples, runs=3)
+    self.assertEqual(baseline.keys, {('c', 'a'): 0, ('c', 'b'): 1})
+    np.testing.assert_array_equal(baseline.count, [3, 1])
+    np.testing.assert_array_equal(baseline.median, [2.0, 5.0])
+
+  def test_compare(self):
+    baseline = Baseline.from_samples(
+      [('c', n, v) for n, vs in [('fast', [0.01, 0.012, 0.011]), ('slow', [10.0, 10.5, 9.8]),
+                                 ('noisy', [10.0, 20.0, 5.0]), ('few', [1.0])] for v in vs])
+    keys = [('c', 'fast'), ('c', 'slow'), ('c', 'noisy'), ('c', 'few'), ('c', 'new'), ('d', 'slow')]
+    values = np.array([0.1, 16.0, 16.0, 10.0, 100.0, 100.0])
+    mask, rows = compare(baseline, keys, values)
+    # 'fast' is 10x slower but by less than min_delta, 'noisy' is within its
+    # usual spread, and 'few', 'new' and the other config lack a baseline.
+    self.assertEqual(mask.tolist(), [False, True, False, False, False, False])
+    self.assertEqual(rows.tolist(), [0, 1, 2, 3, -1, -1])
+
+  def test_history(self):
+    store = HistoryStore()
+    t = lambda e, code='PASS': TestResult(code=code, elapsed=e, name='s :: a.pass.cpp', output='',
+                                          metrics={'compile_time': e / 2})
+    for e in [2.0, 2.1, 1.9, 50.0]:
+      store.record([t(e, 'FAIL' if e == 50.0 else 'PASS')], config='c')
+    baseline = Baseline.from_history(store, runs=5)
+    np.testing.assert_array_equal(baseline.count, [3])
+    [r] = find_regressions(baseline, [t(4.0)], config='c')
+    self.assertEqual((r.name, r.value, r.baseline, r.samples), ('s :: a.pass.cpp', 4.0, 2.0, 3))
+    self.assertEqual(find_regressions(baseline, [t(2.5)], config='c'), [])
+    compile_baseline = Baseline.from_history(store, metric='compile_time', config='c')
+    np.testing.assert_array_equal(compile_baseline.median, [1.0])
+
+  def test_speed(self):
+    import time
+    n = 100000
+    rng = np.random.default_rng(0)
+    names = [f's :: t{i}.pass.cpp' for i in range(n)]
+    base = rng.uniform(0.1, 20.0, n)
+    samples = [('c', name, v) for run in range(5) for name, v in zip(names, base * rng.uniform(0.9, 1.1, n))]
+    baseline = Baseline.from_samples(samples)
+    values = base.copy()
+    values[::1000] *= 3
+    start = time.perf_counter()
+    mask, _ = compare(baseline, [('c', name) for name in names], values)
+    self.assertLess(time.perf_counter() - start, 1.0)
+    self.assertGreater(mask.sum(), 50)
@@ -0,0 +1,156 @@
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from .compact import CompactTestOutput
+from .diagnostic_index import DiagnosticIndex
+from .failure_summary import DETAILS_BUDGET, summarize_failure
+from .libcxx_test_parser import LibcxxTestOutput
+from .types.llvm import TestResult
+
+
+def config_of(test: TestResult, default: Optional[str] = None) -> str:
+  if test.config is not None:
+    return test.config
+  if default is not None:
+    return default
+  return test.name.split('::', 1)[0].strip()
+
+
+def annotation_path(name: str) -> str:
+  return str(Path('libcxx/test', name.split('::', 1)[-1].strip()))
+
+
+# Collects test results (from one or many configurations) and turns them into
+# the annotations and summary of a check run. Failures with clang diagnostics
+# are reported once per distinct diagnostic, everything else gets an
+# annotation of its own, pointing where its output does, with a summary of
+# the output no bigger than `details_budget` bytes.
+class Report:
+  def __init__(self, details_budget: int = DETAILS_BUDGET):
+    self.details_budget = details_budget
+    self.index = DiagnosticIndex()
+    self.counts: dict[str, Counter] = defaultdict(Counter)
+    self.failures = 0
+    self.other_annotations: list[dict[str, Any]] = []
+    # Only set when reporting against a previous run: failures which are the
+    # same as last time and aren't annotated again, tests which no longer
+    # fail, and (name, rate) of failing tests known to be flaky.
+    self.known_failures = 0
+    self.fixed: list[str] = []
+    self.flaky: list[tuple[str, float]] = []
+    # Passing tests which got slower, see llvmact.regressions.
+    self.regressions: list = []
+    # Results which couldn't be read, which fail the run since whatever they
+    # held is missing from it.
+    self.errors: list[str] = []
+
+  @property
+  def conclusion(self) -> str:
+    return 'failure' if self.failures or self.known_failures or self.errors else 'success'
+
+  def add_result(self, test: TestResult, config: Optional[str] = None):
+    self.counts[config_of(test, config)][test.code] += 1
+
+  def add_failure(self, test: TestResult, output: Union[LibcxxTestOutput, CompactTestOutput],
+                  config: Optional[str] = None):
+    self.failures += 1
+    if output.clang_errors:
+      self.index.add_diagnostics(test.name, config_of(test, config), output.diagnostics)
+      return
+    summary = summarize_failure(test.output, self.details_budget)
+    self.other_annotations.append({
+      'path': summary.file or annotation_path(test.name),
+      'start_line': summary.line or 1,
+      'end_line': summary.line or 1,
+      'annotation_level': 'failure',
+      'message': f'Test {test.name} FAILED',
+      'raw_details': summary.text,
+      'title': 'Test Failure',
+    })
+
+  def add_error(self, message: str):
+    self.errors.append(message)
+
+  def add_known_failure(self, test: TestResult, config: Optional[str] = None):
+    self.known_failures += 1
+
+  def add_fixed(self, test: TestResult, config: Optional[str] = None):
+    self.fixed.append(test.name)
+
+  def add_regressions(self, regressions: list, metric: str = 'elapsed'):
+    self.regressions += regressions
+    for r in regressions:
+      self.other_annotations.append({
+        'path': annotation_path(r.name),
+        'start_line': 1,
+        'end_line': 1,
+        'annotation_level': 'warning',
+        'message': f'{metric} went from {r.baseline:.2f} (median of {r.samples} runs) to {r.value:.2f} in {r.config}',
+        'title': f'Test is {r.ratio:.1f}x slower',
+      })
+
+  def annotations(self) -> list[dict[str, Any]]:
+    return self.index.annotations(details_budget=self.details_budget) + self.other_annotations
+
+  def summary(self) -> str:
+    summary = f'{self.failures + self.known_failures} tests failed.'
+    if self.known_failures:
+      summary += f' {self.known_failures} failed the same way in the previous run and are not annotated again.'
+    if len(self.index):
+      summary += f' {len(self.index)} distinct compiler errors.'
+    if self.errors:
+      summary += f'\n\n{len(self.errors)} results could not be read:\n' + '\n'.join(f'- {e}' for e in self.errors)
+    if self.fixed:
+      summary += f'\n\n{len(self.fixed)} tests no longer fail:\n' + '\n'.join(f'- {n}' for n in sorted(self.fixed))
+    if self.flaky:
+      summary += '\n\nFailures in tests known to be flaky:\n' + '\n'.join(
+        f'- {n} ({rate:.0%} of runs flip)' for n, rate in sorted(self.flaky))
+    if self.regressions:
+      summary += f'\n\n{len(self.regressions)} tests got slower:\n' + '\n'.join(
+        f'- {r.name} ({r.config}): {r.baseline:.2f} -> {r.value:.2f}' for r in self.regressions[:50])
+      if len(self.regressions) > 50:
+        summary += f'\n- ... and {len(self.regressions) - 50} more'
+    if len(self.counts) > 1:
+      codes = sorted({c for counts in self.counts.values() for c in counts})
+      lines = ['', '', '| configuration | ' + ' | '.join(codes) + ' |', '| --- |' + ' ---: |' * len(codes)]
+      for config, counts in sorted(self.counts.items()):
+        lines.append(f'| {config} | ' + ' | '.join(str(counts[c]) for c in codes) + ' |')
+      summary += '\n'.join(lines)
+    return summary
+
+
+import unittest
+
+class TestReport(unittest.TestCase):
+  def test_report(self):
+    from .libcxx_test_parser import TEST_CASES, parse_test_output
+    report = Report()
+    for i, (t, code) in enumerate(zip(TEST_CASES, ['PASS', 'FAIL', 'FAIL'])):
+      for config in ['generic-cxx20', 'generic-cxx23']:
+        test = TestResult(code=code, elapsed=1.0, name=f'suite :: std/example/t{i}.pass.cpp', output=t, config=config)
+        report.add_result(test)
+        if code == 'FAIL':
+          report.add_failure(test, parse_test_output(t, cache=False))
+    self.assertEqual(report.conclusion, 'failure')
+    self.assertEqual(report.failures, 4)
+    annotations = report.annotations()
+    # One for the compiler error shared by both configs, and one per runtime failure.
+    self.assertEqual(len(annotations), 3)
+    self.assertEqual(annotations[0]['title'], 'Error in 1 test across 2 configurations')
+    self.assertIn('| generic-cxx23 | 2 | 1 |', report.summary())
+    # Runtime failures point at the failed assertion.
+    self.assertEqual((annotations[1]['path'], annotations[1]['start_line']),
+                     ('libcxx/test/std/example/fails-to-run.pass.cpp', 4))
+    self.assertTrue(annotations[1]['raw_details'].endswith('error: command failed with exit status: 250'))
+
+  def test_delta(self):
+    report = Report()
+    test = TestResult(code='FAIL', elapsed=1.0, name='suite :: a.pass.cpp', output='')
+    report.add_known_failure(test)
+    report.add_fixed(TestResult(code='PASS', elapsed=1.0, name='suite :: b.pass.cpp', output=''))
+    self.assertEqual(report.conclusion, 'failure')
+    self.assertEqual(report.annotations(), [])
+    summary = report.summary()
+    self.assertIn('1 tests failed. 1 failed the same way', summary)
+    self.assertIn('- suite :: b.pass.cpp', summary)
@@ -0,0 +1,413 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+# Which tests and configurations a change can affect.
+#
+# Changed paths are looked up in a prefix trie of rules. Changes to headers,
+# test support files and tests themselves go through a dependency index built
+# from the #includes of the llvm-project checkout: a header affects every
+# test which includes it, directly or through other headers. Everything else
+# either affects nothing (docs) or everything (the library sources, the build,
+# the test harness), possibly restricted to some configurations.
+#
+#   index = DependencyIndex.build('llvm-project')
+#   selection = select(['libcxx/include/__vector/vector.h'], index)
+#   selection.tests        # under libcxx/test, ready to pass to lit
+#
+# Building the index reads every header and test once; it can be saved and
+# loaded, after which selecting is a trie walk and a graph traversal.
+
+INCLUDE_DIR = 'libcxx/include'
+TEST_DIR = 'libcxx/test'
+SUPPORT_DIR = 'libcxx/test/support'
+
+# Selecting more than this fraction of the test suite isn't worth filtering.
+EVERYTHING_FRACTION = 0.5
+
+_include_re = re.compile(r'^\s*#\s*(?:include|import)\s*([<"])([^>"]+)[>"]', re.M)
+_test_re = re.compile(r'\.(?:pass|fail|verify|sh|gen)\.(?:cpp|mm|py)$')
+
+
+def is_test(path: str) -> bool:
+  return _test_re.search(path) is not None
+
+
+class Rule(BaseModel):
+  # header: follow the includes of the changed header
+  # test: the changed test, or the tests including the changed file
+  # all: every test
+  # none: no tests
+  kind: Literal['header', 'test', 'all', 'none']
+  # Only these configurations (or ones starting with them followed by '-')
+  # need to run; None for all of them.
+  configs: Optional[list[str]] = None
+  # Extra test paths, relative to TEST_DIR.
+  tests: list[str] = Field(default_factory=list)
+
+
+MODULE_CONFIGS = ['generic-modules', 'generic-modules-lsv', 'generic-cxx26']
+
+# Paths without a rule of their own (or of a parent directory) affect
+# everything.
+DEFAULT_RULES: dict[str, Rule] = {
+  'libcxx/include/': Rule(kind='header'),
+  'libcxx/include/CMakeLists.txt': Rule(kind='all'),
+  'libcxx/include/__config_site.in': Rule(kind='all'),
+  'libcxx/include/module.modulemap.in': Rule(kind='all', configs=MODULE_CONFIGS),
+  'libcxx/modules/': Rule(kind='none', configs=MODULE_CONFIGS, tests=['std/modules']),
+  'libcxx/test/': Rule(kind='test'),
+  'libcxx/test/configs/': Rule(kind='all'),
+  'libcxx/test/support/': Rule(kind='test'),
+  'libcxx/test/tools/': Rule(kind='none', tests=['tools']),
+  'libcxx/docs/': Rule(kind='none'),
+  'libcxx/benchmarks/': Rule(kind='none'),
+  'libcxx/test/benchmarks/': Rule(kind='none'),
+  'libcxx/utils/gdb/': Rule(kind='none', tests=['libcxx/gdb']),
+  'libcxx/.clang-format': Rule(kind='none'),
+  'libcxx/.clang-tidy': Rule(kind='none'),
+  'libcxx/CREDITS.TXT': Rule(kind='none'),
+}
+
+
+# Maps path prefixes to values; looking a path up gives the value of its
+# longest prefix with one. Prefixes ending in '/' match directories, others
+# match a single file.
+class PathTrie:
+  def __init__(self, items: Optional[dict[str, object]] = None):
+    self.root: dict = {}
+    for prefix, value in (items or {}).items():
+      self.insert(prefix, value)
+
+  def insert(self, prefix: str, value: object):
+    node = self.root
+    for part in prefix.strip('/').split('/'):
+      node = node.setdefault(part, {})
+    node[None if prefix.endswith('/') else ''] = value
+
+  def lookup(self, path: str, default: object = None) -> object:
+    node = self.root
+    found = default
+    parts = path.strip('/').split('/')
+    for i, part in enumerate(parts):
+      node = node.get(part)
+      if node is None:
+        break
+      if i == len(parts) - 1 and '' in node:
+        return node['']
+      if None in node and i < len(parts) - 1:
+        found = node[None]
+    return found
+
+
+# Who includes whom, for the libc++ headers and everything under TEST_DIR.
+# Nodes are paths relative to INCLUDE_DIR for the libc++ headers and relative
+# to the checkout for everything else.
+class DependencyIndex:
+  def __init__(self, includes: dict[str, list[str]]):
+    self.includes = includes
+    self.tests = sorted(n for n in includes if is_test(n))
+    self._included_by: Optional[dict[str, list[str]]] = None
+
+  @property
+  def included_by(self) -> dict[str, list[str]]:
+    if self._included_by is None:
+      rev: dict[str, list[str]] = {}
+      for node, deps in self.includes.items():
+        for d in deps:
+          rev.setdefault(d, []).append(node)
+      self._included_by = rev
+    return self._included_by
+
+  # `node` and everything which includes it, directly or not.
+  def dependents(self, node: str) -> set[str]:
+    rev = self.included_by
+    seen = {node}
+    queue = deque([node])
+    while queue:
+      for n in rev.get(queue.popleft(), ()):
+        if n not in seen:
+          seen.add(n)
+          queue.append(n)
+    return seen
+
+  @classmethod
+  def build(cls, root: Union[str, os.PathLike]) -> 'DependencyIndex':
+    root = Path(root)
+    headers = {}
+    include_dir = root / INCLUDE_DIR
+    if include_dir.is_dir():
+      for p in include_dir.rglob('*'):
+        if p.is_file() and not p.name.startswith('.') and p.suffix not in ('.txt', '.in', '.py', '.json'):
+          headers[p.relative_to(include_dir).as_posix()] = p
+    files = {}
+    test_dir = root / TEST_DIR
+    if test_dir.is_dir():
+      for p in test_dir.rglob('*'):
+        if p.is_file() and (is_test(p.name) or p.suffix in ('.h', '.hpp', '.inc', '.ipp')):
+          files[p.relative_to(root).as_posix()] = p
+
+    # Quoted includes are looked for next to the including file first, and
+    # both kinds in the test support directory before the libc++ headers.
+    def resolve(src: str, bracket: str, name: str) -> str:
+      if bracket == '"':
+        local = os.path.normpath(os.path.join(os.path.dirname(src), name)).replace(os.sep, '/')
+        if local in files:
+          return local
+      support = f'{SUPPORT_DIR}/{name}'
+      if name not in headers and support in files:
+        return support
+      return name
+
+    includes = {}
+    for node, path in headers.items():
+      includes[node] = sorted({n for _, n in _include_re.findall(path.read_text(errors='replace'))})
+    for node, path in files.items():
+      includes[node] = sorted({resolve(node, b, n) for b, n in _include_re.findall(path.read_text(errors='replace'))})
+    return cls(includes)
+
+  def save(self, path: Union[str, os.PathLike]):
+    Path(path).write_text(json.dumps(self.includes, separators=(',', ':')))
+
+  @classmethod
+  def load(cls, path: Union[str, os.PathLike]) -> 'DependencyIndex':
+    return cls(json.loads(Path(path).read_text()))
+
+
+class Selection(BaseModel):
+  everything: bool = False
+  # Test files and directories relative to TEST_DIR.
+  tests: list[str] = Field(default_factory=list)
+  # Configuration prefixes which need to run; None for all of them.
+  configs: Optional[list[str]] = None
+  # Why each changed path selected what it did.
+  reasons: dict[str, str] = Field(default_factory=dict)
+
+  @property
+  def empty(self) -> bool:
+    return not self.everything and not self.tests
+
+  # The arguments to pass to lit.
+  def lit_paths(self, root: str = TEST_DIR) -> list[str]:
+    if self.everything:
+      return [root]
+    return [f'{root}/{t}' for t in self.tests]
+
+  def runs_config(self, config: str) -> bool:
+    if self.empty:
+      return False
+    return self.configs is None or any(config == c or config.startswith(c + '-') for c in self.configs)
+
+  # The configurations of each stage which need to run, dropping stages with
+  # none. `stages` maps configurations to stages, as workflow_stages() does.
+  def matrix(self, stages: dict[str, str]) -> dict[str, list[str]]:
+    result: dict[str, list[str]] = {}
+    for config, stage in stages.items():
+      if self.runs_config(config):
+        result.setdefault(stage, []).append(config)
+    return result
+
+
+def _relative_test(node: str) -> str:
+  return node[len(TEST_DIR) + 1:]
+
+
+def select(changed: Iterable[str], index: DependencyIndex, rules: Optional[dict[str, Rule]] = None,
+           everything_fraction: float = EVERYTHING_FRACTION) -> Selection:
+  trie = PathTrie(DEFAULT_RULES if rules is None else rules)
+  everything = False
+  tests: set[str] = set()
+  configs: Optional[set[str]] = set()
+  reasons = {}
+  for path in changed:
+    rule = trie.lookup(path)
+    if rule is None:
+      rule = Rule(kind='all')
+      reasons[path] = 'no rule, assuming everything'
+    # Changes which select nothing don't need any configuration either.
+    if rule.kind != 'none' or rule.tests:
+      if rule.configs is None:
+        configs = None
+      elif configs is not None:
+        configs.update(rule.configs)
+    tests.update(rule.tests)
+
+    if rule.kind == 'all':
+      everything = True
+      reasons.setdefault(path, 'affects every test')
+    elif rule.kind == 'none':
+      reasons[path] = f"affects {', '.join(rule.tests)}" if rule.tests else 'affects no tests'
+    else:
+      node = path[len(INCLUDE_DIR) + 1:] if rule.kind == 'header' else path
+      if rule.kind == 'test' and path not in index.includes and not is_test(path):
+        # Not something the index knows about (a lit.local.cfg, say); run its
+        # directory, or everything if it's shared support code.
+        directory = os.path.dirname(path)
+        if directory == SUPPORT_DIR or directory.startswith(SUPPORT_DIR + '/'):
+          everything = True
+          reasons[path] = 'unknown support file, assuming everything'
+        else:
+          tests.add(_relative_test(directory) or '.')
+          reasons[path] = 'unknown file, running its directory'
+        continue
+      hit = [n for n in index.dependents(node) if is_test(n)]
+      if is_test(path) and path.startswith(TEST_DIR + '/'):
+        hit.append(path)
+      tests.update(_relative_test(n) for n in hit)
+      reasons[path] = f'included by {len(hit)} tests' if not is_test(path) else 'changed test'
+
+  if not everything and index.tests and len(tests) > everything_fraction * len(index.tests):
+    everything = True
+  return Selection(everything=everything, tests=[] if everything else sorted(tests),
+                   configs=None if configs is None else sorted(configs), reasons=reasons)
+
+
+def changed_paths(base: str, head: str = 'HEAD', cwd: Optional[str] = None) -> list[str]:
+  out = subprocess.run(['git', 'diff', '--name-only', base, head], cwd=cwd, check=True,
+                       capture_output=True, text=True).stdout
+  return [line for line in out.splitlines() if line]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m llvmact select',
+                                   description='Select the tests and configurations affected by a change')
+  parser.add_argument('paths', nargs='*', help="changed paths ('-' reads them from stdin)")
+  parser.add_argument('--root', default='.', help='the llvm-project checkout')
+  parser.add_argument('--base', help='diff against this commit to find the changed paths')
+  parser.add_argument('--head', default='HEAD')
+  parser.add_argument('--index', help='dependency index to load, or to create if it does not exist')
+  parser.add_argument('--build-index', action='store_true', help='(re)build the index and exit')
+  parser.add_argument('--workflow', help='workflow whose matrix gives the configurations of each stage')
+  parser.add_argument('--tests-file', help='write the paths to pass to lit here, one per line')
+  parser.add_argument('--github-output', action='store_true',
+                      help='set the everything, tests and matrix step outputs')
+  args = parser.parse_args(argv)
+
+  if args.index and Path(args.index).exists() and not args.build_index:
+    index = DependencyIndex.load(args.index)
+  else:
+    index = DependencyIndex.build(args.root)
+    if args.index:
+      index.save(args.index)
+  if args.build_index:
+    print(f'{len(index.includes)} files, {len(index.tests)} tests')
+    return 0
+
+  paths = list(args.paths)
+  if paths == ['-']:
+    paths = [line.strip() for line in sys.stdin if line.strip()]
+  if args.base:
+    paths += changed_paths(args.base, args.head, cwd=args.root)
+  selection = select(paths, index)
+
+  for path, reason in selection.reasons.items():
+    print(f'{path}: {reason}', file=sys.stderr)
+  lit_paths = selection.lit_paths()
+  print('\n'.join(lit_paths))
+  if args.tests_file:
+    Path(args.tests_file).write_text(''.join(p + '\n' for p in lit_paths))
+  matrix = None
+  if args.workflow:
+    from .stages import workflow_stages
+    matrix = selection.matrix(workflow_stages(args.workflow))
+    print(json.dumps(matrix), file=sys.stderr)
+  if args.github_output:
+    from .workflow import WorkflowCommands
+    with WorkflowCommands() as wf:
+      wf.set_output('everything', str(selection.everything).lower())
+      wf.set_output('tests', ' '.join(lit_paths))
+      if matrix is not None:
+        wf.set_output('matrix', json.dumps(matrix))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestSelection(unittest.TestCase):
+  def make_tree(self, root: Path):
+    files = {
+      'libcxx/include/vector': '#include <__config>\n#include <__vector/vector.h>\n',
+      'libcxx/include/__vector/vector.h': '#include <__config>\n#include <__memory/allocator.h>\n',
+      'libcxx/include/__memory/allocator.h': '#include <__config>\n',
+      'libcxx/include/optional': '#include <__config>\n',
+      'libcxx/include/__config': '',
+      'libcxx/test/support/test_macros.h': '#include <__config>\n',
+      'libcxx/test/support/test_allocator.h': '#include <memory>\n',
+      'libcxx/test/std/containers/vector/push_back.pass.cpp': '#include <vector>\n#include "test_macros.h"\n',
+      'libcxx/test/std/containers/vector/helpers.h': '#include <vector>\n',
+      'libcxx/test/std/containers/vector/size.pass.cpp': '#include "helpers.h"\n',
+      'libcxx/test/std/utilities/optional/value.pass.cpp': '#include <optional>\n',
+      'libcxx/test/std/utilities/optional/bad.verify.cpp': '#include <optional>\n#include "test_macros.h"\n',
+    }
+    for name, text in files.items():
+      (root / name).parent.mkdir(parents=True, exist_ok=True)
+      (root / name).write_text(text)
+
+  def setUp(self):
+    import tempfile
+    self.tmp = tempfile.TemporaryDirectory()
+    self.root = Path(self.tmp.name)
+    self.make_tree(self.root)
+    self.index = DependencyIndex.build(self.root)
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_trie(self):
+    trie = PathTrie({'a/': 1, 'a/b/': 2, 'a/b/c.txt': 3})
+    self.assertEqual([trie.lookup(p) for p in ['a/x', 'a/b/y', 'a/b/c.txt', 'a/b/c.txtx', 'b/x', 'a']],
+                     [1, 2, 3, 2, None, None])
+
+  def test_index(self):
+    self.assertEqual(self.index.includes['libcxx/test/std/containers/vector/size.pass.cpp'],
+                     ['libcxx/test/std/containers/vector/helpers.h'])
+    self.assertEqual(self.index.includes['libcxx/test/std/containers/vector/push_back.pass.cpp'],
+                     ['libcxx/test/support/test_macros.h', 'vector'])
+    self.assertEqual(self.index.includes['vector'], ['__config', '__vector/vector.h'])
+    self.assertEqual(len(self.index.tests), 4)
+
+  def test_select(self):
+    s = select(['libcxx/include/__memory/allocator.h'], self.index, everything_fraction=1.0)
+    self.assertEqual(s.tests, ['std/containers/vector/push_back.pass.cpp', 'std/containers/vector/size.pass.cpp'])
+    self.assertIsNone(s.configs)
+    self.assertEqual(select(['libcxx/test/std/utilities/optional/value.pass.cpp'], self.index).tests,
+                     ['std/utilities/optional/value.pass.cpp'])
+    self.assertTrue(select(['libcxx/include/__config'], self.index).everything)
+    self.assertTrue(select(['libcxx/src/vector.cpp'], self.index).everything)
+    self.assertTrue(select(['libcxx/docs/index.rst'], self.index).empty)
+
+    s = select(['libcxx/modules/std/vector.inc'], self.index)
+    self.assertEqual((s.tests, s.configs), (['std/modules'], sorted(MODULE_CONFIGS)))
+    stages = {'generic-cxx03': 'stage1', 'generic-modules': 'stage1', 'generic-modules-lsv': 'stage3', 'generic-msan': 'stage3'}
+    self.assertEqual(s.matrix(stages), {'stage1': ['generic-modules'], 'stage3': ['generic-modules-lsv']})
+    self.assertEqual(select(['libcxx/docs/x.rst'], self.index).matrix(stages), {})
+    self.assertEqual(select(['libcxx/docs/x.rst', 'libcxx/modules/std.cppm.in'], self.index).configs,
+                     sorted(MODULE_CONFIGS))
+
+  def test_save_load(self):
+    self.index.save(self.root / 'index.json')
+    loaded = DependencyIndex.load(self.root / 'index.json')
+    self.assertEqual(loaded.includes, self.index.includes)
+
+  def test_speed(self):
+    import time
+    # A header included by every one of 20000 tests, through another header.
+    includes = {'__config': [], 'vector': ['__config']}
+    includes.update({f'libcxx/test/std/t{i}/t.pass.cpp': ['vector'] for i in range(20000)})
+    index = DependencyIndex(includes)
+    start = time.perf_counter()
+    s = select(['libcxx/include/vector', 'libcxx/test/std/t1/t.pass.cpp'], index, everything_fraction=1.0)
+    self.assertLess(time.perf_counter() - start, 0.5)
+    self.assertEqual(len(s.tests), 20000)
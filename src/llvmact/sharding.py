@@ -0,0 +1,250 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import statistics
+import sys
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from pydantic import BaseModel, Field
+
+# Splits each configuration's tests into shards of about equal run time, so
+# a matrix job per shard finishes at about the same time as the others.
+#
+# Times come from previous lit results (or the history store): the median of
+# every run of a test in a configuration. Tests with no history get the
+# median of their directory, else of their configuration, else
+# DEFAULT_ESTIMATE. Shards are filled with the longest processing time first
+# rule: tests from slowest to fastest, each to the shard with the least work
+# so far, which is within 4/3 of the best possible makespan.
+#
+#   times = KnownTimes.from_results(['results.json'], config='generic-cxx23')
+#   plan = plan_shards('generic-cxx23', tests, times, shards=4)
+
+# Seconds assumed for a test when nothing is known about it or its neighbours.
+DEFAULT_ESTIMATE = 1.0
+
+
+def path_of(name: str) -> str:
+  return name.split('::', 1)[-1].strip()
+
+
+class Shard(BaseModel):
+  index: int
+  estimate: float = 0.0
+  tests: list[str] = Field(default_factory=list)
+
+
+class ShardPlan(BaseModel):
+  config: str
+  shards: list[Shard]
+  # Tests whose time was estimated rather than known.
+  estimated: int = 0
+
+  @property
+  def total(self) -> float:
+    return sum(s.estimate for s in self.shards)
+
+  @property
+  def makespan(self) -> float:
+    return max((s.estimate for s in self.shards), default=0.0)
+
+
+# Known run times of tests, per configuration and test path.
+class KnownTimes:
+  def __init__(self, times: dict[tuple[str, str], float]):
+    self.times = times
+    self._config_median: dict[str, float] = {}
+    self._dir_median: dict[tuple[str, str], float] = {}
+    by_config: dict[str, list[float]] = {}
+    by_dir: dict[tuple[str, str], list[float]] = {}
+    for (config, path), t in times.items():
+      by_config.setdefault(config, []).append(t)
+      by_dir.setdefault((config, os.path.dirname(path)), []).append(t)
+    self._config_median = {k: statistics.median(v) for k, v in by_config.items()}
+    self._dir_median = {k: statistics.median(v) for k, v in by_dir.items()}
+
+  @property
+  def configs(self) -> list[str]:
+    return sorted(self._config_median)
+
+  def tests(self, config: str) -> list[str]:
+    return sorted(path for c, path in self.times if c == config)
+
+  # The time of a test, and whether it was known rather than estimated.
+  def estimate(self, config: str, path: str) -> tuple[float, bool]:
+    t = self.times.get((config, path))
+    if t is not None:
+      return t, True
+    directory = os.path.dirname(path)
+    while True:
+      t = self._dir_median.get((config, directory))
+      if t is not None:
+        return t, False
+      if not directory:
+        break
+      directory = os.path.dirname(directory)
+    return self._config_median.get(config, DEFAULT_ESTIMATE), False
+
+  # The median time of every test over one or more results files (or *-results
+  # artifacts), which are typically the last few runs.
+  @classmethod
+  def from_results(cls, paths: list[Union[str, os.PathLike]], config: Optional[str] = None) -> 'KnownTimes':
+    from .analytics import load
+    columns = load(paths, config)
+    configs, elapsed = columns.labels['config'], columns.elapsed.tolist()
+    samples: dict[tuple[str, str], list[float]] = {}
+    for name, c, e in zip(columns.names, columns.config.tolist(), elapsed):
+      samples.setdefault((configs[c], path_of(name)), []).append(e)
+    return cls({k: statistics.median(v) for k, v in samples.items()})
+
+  @classmethod
+  def from_history(cls, store, runs: int = 5, config: Optional[str] = None) -> 'KnownTimes':
+    from .regressions import Baseline
+    baseline = Baseline.from_history(store, runs=runs, config=config)
+    medians = baseline.median.tolist()
+    return cls({(c, path_of(name)): medians[i] for (c, name), i in baseline.keys.items()})
+
+
+def plan_shards(config: str, tests: Iterable[str], times: KnownTimes, shards: int) -> ShardPlan:
+  estimated = 0
+  work = []
+  for path in tests:
+    t, known = times.estimate(config, path)
+    estimated += not known
+    work.append((t, path))
+  # Slowest first; ties broken by path so plans are reproducible.
+  work.sort(key=lambda w: (-w[0], w[1]))
+  plan = [Shard(index=i) for i in range(max(shards, 1))]
+  heap = [(0.0, i) for i in range(len(plan))]
+  for t, path in work:
+    load, i = heapq.heappop(heap)
+    plan[i].tests.append(path)
+    plan[i].estimate = load + t
+    heapq.heappush(heap, (load + t, i))
+  for s in plan:
+    s.tests.sort()
+  return ShardPlan(config=config, shards=plan, estimated=estimated)
+
+
+# Enough shards that each takes about `target` seconds, but no more than
+# `max_shards`.
+def shards_for(total: float, target: float, max_shards: int) -> int:
+  return max(1, min(max_shards, math.ceil(total / target))) if target > 0 else 1
+
+
+# The `include` list for a workflow matrix: one job per shard.
+def matrix_fragment(plans: list[ShardPlan], shard_dir: Optional[str] = None) -> dict[str, list[dict]]:
+  include = []
+  for plan in plans:
+    for s in plan.shards:
+      entry = {'config': plan.config, 'shard': s.index, 'shards': len(plan.shards),
+               'estimate': round(s.estimate, 1)}
+      if shard_dir is not None:
+        entry['tests'] = shard_file(shard_dir, plan.config, s.index)
+      include.append(entry)
+  return {'include': include}
+
+
+def shard_file(directory: str, config: str, index: int) -> str:
+  return f'{directory}/{config}.{index}.txt'
+
+
+def write_shards(plans: list[ShardPlan], directory: str, root: str = 'libcxx/test'):
+  Path(directory).mkdir(parents=True, exist_ok=True)
+  for plan in plans:
+    for s in plan.shards:
+      Path(shard_file(directory, plan.config, s.index)).write_text(''.join(f'{root}/{t}\n' for t in s.tests))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m llvmact shard',
+                                   description='Split the tests of each configuration into balanced shards')
+  parser.add_argument('results', nargs='*', help='previous results.json files or *-results artifacts')
+  parser.add_argument('--history', help='take the times from this history database instead')
+  parser.add_argument('--config', action='append', default=None,
+                      help='configuration to plan (default: every one with results); may be repeated')
+  parser.add_argument('--tests', help='file listing the tests to shard, one path per line (default: the tests with results)')
+  parser.add_argument('--shards', type=int, default=None, help='shards per configuration')
+  parser.add_argument('--target', type=float, default=1800.0,
+                      help='without --shards, aim for shards taking about this many seconds')
+  parser.add_argument('--max-shards', type=int, default=8)
+  parser.add_argument('--out-dir', default='shards', help='where to write the test list of each shard')
+  parser.add_argument('--github-output', action='store_true', help='set the matrix step output')
+  args = parser.parse_args(argv)
+
+  if args.history:
+    from .history import HistoryStore
+    with HistoryStore(args.history) as store:
+      times = KnownTimes.from_history(store)
+  else:
+    times = KnownTimes.from_results(args.results, args.config[0] if args.config and len(args.config) == 1 else None)
+  tests = None
+  if args.tests:
+    tests = [line.strip() for line in Path(args.tests).read_text().splitlines() if line.strip()]
+    tests = [t.removeprefix('libcxx/test/') for t in tests]
+
+  plans = []
+  for config in args.config or times.configs:
+    config_tests = tests if tests is not None else times.tests(config)
+    n = args.shards
+    if n is None:
+      n = shards_for(sum(times.estimate(config, t)[0] for t in config_tests), args.target, args.max_shards)
+    plan = plan_shards(config, config_tests, times, n)
+    plans.append(plan)
+    print(f'{config}: {len(config_tests)} tests ({plan.estimated} estimated) in {n} shards, '
+          f'{plan.total:.0f}s of work, longest shard {plan.makespan:.0f}s', file=sys.stderr)
+
+  write_shards(plans, args.out_dir)
+  matrix = matrix_fragment(plans, args.out_dir)
+  print(json.dumps(matrix))
+  if args.github_output:
+    from .workflow import WorkflowCommands
+    with WorkflowCommands() as wf:
+      wf.set_output('matrix', json.dumps(matrix))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestSharding(unittest.TestCase):
+  def test_lpt(self):
+    times = KnownTimes({('c', f'std/a/t{i}.pass.cpp'): t for i, t in enumerate([7, 6, 5, 4, 3, 3, 2, 2])})
+    plan = plan_shards('c', times.tests('c'), times, 3)
+    self.assertEqual(plan.total, 32)
+    # The best possible split is 11/11/10.
+    self.assertEqual(sorted(s.estimate for s in plan.shards), [10, 11, 11])
+    self.assertEqual(sum(len(s.tests) for s in plan.shards), 8)
+    self.assertEqual(plan.estimated, 0)
+
+  def test_estimates(self):
+    times = KnownTimes({('c', 'std/a/x.pass.cpp'): 10.0, ('c', 'std/a/y.pass.cpp'): 20.0, ('c', 'std/b/z.pass.cpp'): 2.0})
+    self.assertEqual(times.estimate('c', 'std/a/x.pass.cpp'), (10.0, True))
+    self.assertEqual(times.estimate('c', 'std/a/new.pass.cpp'), (15.0, False))
+    self.assertEqual(times.estimate('c', 'libcxx/new.pass.cpp'), (10.0, False))
+    self.assertEqual(times.estimate('other', 'std/a/x.pass.cpp'), (DEFAULT_ESTIMATE, False))
+    plan = plan_shards('c', ['std/a/new.pass.cpp', 'std/b/z.pass.cpp'], times, 2)
+    self.assertEqual(plan.estimated, 1)
+    self.assertEqual(shards_for(3600, 1800, 8), 2)
+    self.assertEqual(shards_for(10 ** 6, 1800, 8), 8)
+
+  def test_from_results(self):
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+      for run, scale in enumerate([1.0, 3.0, 2.0]):
+        Path(d, f'{run}.json').write_text(json.dumps({'__version__': [18, 0, 0], 'elapsed': 1.0, 'tests': [
+          {'code': 'PASS', 'elapsed': scale * (i + 1), 'name': f'suite :: std/a/t{i}.pass.cpp', 'output': ''}
+          for i in range(4)]}))
+      times = KnownTimes.from_results(sorted(Path(d).glob('*.json')), config='c')
+      self.assertEqual(times.times[('c', 'std/a/t1.pass.cpp')], 4.0)
+      plans = [plan_shards('c', times.tests('c'), times, 2)]
+      write_shards(plans, d)
+      self.assertEqual(Path(shard_file(d, 'c', 0)).read_text().count('\n'), 2)
+      matrix = matrix_fragment(plans, d)
+      self.assertEqual([(e['config'], e['shard'], e['shards']) for e in matrix['include']], [('c', 0, 2), ('c', 1, 2)])
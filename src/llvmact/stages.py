@@ -0,0 +1,64 @@
+import os
+import re
+from pathlib import Path
+from typing import Union
+
+# The stages of the CI workflow, read from its matrix. analytics groups
+# timings by stage and selection reduces each stage's matrix to the
+# configurations a change affects. This is kept apart from analytics so
+# selection can use it without numpy.
+
+_job_re = re.compile(r'^  ([\w-]+):\s*$')
+_config_key_re = re.compile(r'^-?\s*config:\s*(.*)$')
+_quoted_re = re.compile(r'''['"]([^'"]+)['"]''')
+
+
+# The job (stage1, stage2, ...) each configuration runs in, from the matrix
+# of a workflow like .github/workflows/callable.yaml. Configurations in more
+# than one job keep the first.
+def workflow_stages(path: Union[str, os.PathLike]) -> dict[str, str]:
+  stages: dict[str, str] = {}
+  job = None
+  in_list = False
+  for line in Path(path).read_text().splitlines():
+    if m := _job_re.match(line):
+      job, in_list = m.group(1), False
+      continue
+    if job is None:
+      continue
+    s = line.strip()
+    if in_list:
+      names = _quoted_re.findall(s)
+      in_list = ']' not in s
+    elif m := _config_key_re.match(s):
+      rest = m.group(1)
+      names = _quoted_re.findall(rest) or ([rest] if rest and not rest.startswith('[') else [])
+      in_list = rest.startswith('[') and ']' not in rest
+    else:
+      continue
+    for name in names:
+      stages.setdefault(name, job)
+  return stages
+
+
+# Artifact and check names add the compiler to the configuration
+# ('generic-cxx03-clang++-18'), so match the longest known configuration
+# which is a prefix.
+def stage_of(config: str, stages: dict[str, str], default: str = 'other') -> str:
+  if config in stages:
+    return stages[config]
+  best = max((c for c in stages if config.startswith(c + '-')), key=len, default=None)
+  return stages[best] if best is not None else default
+
+
+import unittest
+
+class TestStages(unittest.TestCase):
+  def test_stages(self):
+    path = Path(__file__).resolve().parents[2] / '.github' / 'workflows' / 'callable.yaml'
+    stages = workflow_stages(path)
+    self.assertEqual((stages['generic-cxx03'], stages['generic-gcc'], stages['generic-cxx23'], stages['generic-msan']),
+                     ('stage1', 'stage1', 'stage2', 'stage3'))
+    self.assertEqual(stage_of('generic-modules-lsv', stages), 'stage3')
+    self.assertEqual(stage_of('generic-cxx03-clang++-18', stages), 'stage1')
+    self.assertEqual(stage_of('unknown', stages), 'other')
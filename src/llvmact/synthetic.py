@@ -0,0 +1,199 @@
+import argparse
+import json
+import random
+import sys
+from typing import Optional, TextIO
+
+# Generates lit results.json files which look like the ones produced by the
+# libc++ test suite, for benchmarking the parser and reporting pipeline
+# without waiting for a real CI run.
+
+ROOT = '/home/runner/llvm-project'
+BUILD = f'{ROOT}/build/generic-cxx26'
+SUITE = 'llvm-libc++-shared.cfg.in'
+
+TEST_DIRS = [
+  'std/algorithms/alg.modifying.operations/alg.copy',
+  'std/containers/sequences/vector/vector.modifiers',
+  'std/containers/associative/map/map.access',
+  'std/strings/basic.string/string.modifiers/string_append',
+  'std/utilities/optional/optional.object/optional.object.ctor',
+  'std/utilities/variant/variant.visit',
+  'std/ranges/range.adaptors/range.transform',
+  'std/iterators/predef.iterators/reverse.iterators',
+  'std/input.output/iostream.format/output.streams',
+  'std/thread/thread.mutex/thread.lock',
+  'libcxx/memory/shared_ptr',
+  'libcxx/utilities/format',
+]
+
+# Features whose absence makes a test UNSUPPORTED.
+FEATURES = ['c++03', 'c++20', 'c++23', 'no-exceptions', 'no-localization', 'libcpp-has-no-threads',
+            'availability-filesystem-missing', 'msan', 'has-unix-headers']
+
+HEADERS = ['vector', 'string', 'map', '__ranges/transform_view.h', 'optional', 'variant',
+           '__algorithm/copy.h', '__iterator/reverse_iterator.h', 'ostream', '__format/formatter.h']
+
+FLAGS = ' '.join([
+  '-pthread', '--target=x86_64-unknown-linux-gnu', '-nostdinc++',
+  f'-I {BUILD}/include/c++/v1', f'-I {BUILD}/include/c++/v1', f'-I {ROOT}/libcxx/test/support',
+  '-std=c++26', '-Werror', '-Wall', '-Wctad-maybe-unsupported', '-Wextra', '-Wshadow', '-Wundef',
+  '-Wunused-template', '-Wno-unused-command-line-argument', '-Wno-attributes', '-Wno-pessimizing-move',
+  '-Wno-noexcept-type', '-Wno-atomic-alignment', '-Wno-reserved-module-identifier', '-Wdeprecated-copy',
+  '-Wdeprecated-copy-dtor', '-Wno-user-defined-literals', '-Wno-tautological-compare', '-Wsign-compare',
+  '-Wunused-variable', '-Wunused-parameter', '-Wunreachable-code', '-Wno-unused-local-typedef',
+  '-Wno-local-type-template-args', '-Wno-c++11-extensions', '-Wno-unknown-pragmas', '-Wno-pass-failed',
+  '-Wno-mismatched-new-delete', '-Wno-redundant-move', '-Wno-self-move',
+  '-D_LIBCPP_HAS_NO_PRAGMA_SYSTEM_HEADER', '-D_LIBCPP_ENABLE_EXPERIMENTAL',
+  '-D_LIBCPP_HARDENING_MODE=_LIBCPP_HARDENING_MODE_NONE', '-Werror=thread-safety', '-Wuser-defined-warnings',
+  '-lc++experimental', '-nostdlib++', f'-L {BUILD}/lib', f'-Wl,-rpath,{BUILD}/lib', '-lc++',
+])
+
+
+def _commands(path: str) -> tuple[str, str]:
+  src = f'{ROOT}/libcxx/test/{path}'
+  out = f'{BUILD}/test/{path.rsplit("/", 1)[0]}/Output/{path.rsplit("/", 1)[1]}.dir'
+  compile_cmd = f'/usr/bin/clang++ {src} {FLAGS} -o {out}/t.tmp.exe'
+  run_cmd = f'/usr/bin/python3 {ROOT}/libcxx/utils/run.py --execdir {out} -- {out}/t.tmp.exe'
+  return compile_cmd, run_cmd
+
+
+def _compile_error(rng: random.Random, path: str, notes: int, padding: int) -> list[str]:
+  header = rng.choice(HEADERS)
+  src = f'{ROOT}/libcxx/test/{path}'
+  line, col = rng.randint(1, 200), rng.randint(1, 80)
+  lines = [
+    f'{BUILD}/include/c++/v1/{header}:{line * 7}:{col}: error: no matching function for call to \'__impl\'',
+    f'  {line * 7:4} |     return __impl(std::forward<_Args>(__args)...);',
+    f'       |            ^~~~~~',
+    f'{src}:{line}:{col}: note: in instantiation of function template specialization requested here',
+    f'  {line:4} |   auto r = f(v);',
+    f'       |            ^',
+  ]
+  for i in range(notes):
+    lines += [
+      f'{BUILD}/include/c++/v1/{header}:{100 + i}:5: note: candidate template ignored: substitution failure [with _Tp = int]',
+      f'  {100 + i:4} |     _LIBCPP_HIDE_FROM_ABI auto __impl(_Tp&& __t) {{',
+      f'       |     ^',
+    ]
+  lines += [f'    in template instantiation step {i}' for i in range(padding)]
+  lines.append('1 error generated.')
+  return lines
+
+
+def generate_test(rng: random.Random, index: int, code: str, notes: int = 10, stderr_lines: int = 0) -> dict:
+  path = f'{rng.choice(TEST_DIRS)}/test{index}.pass.cpp'
+  compile_cmd, run_cmd = _commands(path)
+  # XFAIL tests fail the same way failing tests do, lit just expected it.
+  failed = code in ('FAIL', 'XFAIL')
+  exit_code = 0
+  out = ['# COMPILED WITH', compile_cmd, f'# executed command: {compile_cmd}']
+  if failed and rng.random() < 0.7:
+    exit_code = 1
+    out.append('# .---command stderr------------')
+    out += ['# | ' + ln for ln in _compile_error(rng, path, notes, stderr_lines)]
+    out += ['# `-----------------------------', '# error: command failed with exit status: 1']
+  else:
+    out += ['# EXECUTED AS', run_cmd, f'# executed command: {run_cmd}']
+    if failed:
+      exit_code = 250
+      out.append('# .---command stderr------------')
+      out.append(f'# | t.tmp.exe: {ROOT}/libcxx/test/{path}:4: int main(): Assertion `false\' failed.')
+      out += [f'# | frame #{i}: 0x{rng.getrandbits(48):012x}' for i in range(stderr_lines)]
+      out += ['# `-----------------------------', '# error: command failed with exit status: 250']
+  if code == 'UNSUPPORTED':
+    output = f'Test requires the following unavailable features: {rng.choice(FEATURES)}'
+  elif code == 'UNRESOLVED':
+    output = (f"Exception during script execution:\nTraceback (most recent call last):\n"
+              f"ValueError: Test {path} has no 'RUN:' line and isn't a known test format\n")
+  else:
+    output = '\n'.join([f'Exit Code: {exit_code}', '', 'Command Output (stdout):', '--'] + out + ['', '--', ''])
+  return {
+    'code': code,
+    'elapsed': round(rng.lognormvariate(-0.5, 1.0), 6),
+    'metrics': {'meta': {'filename': path.rsplit('/', 1)[1], 'filepath': f'{ROOT}/libcxx/test/{path}'}},
+    'name': f'{SUITE} :: {path}',
+    'output': output,
+  }
+
+
+# Write a results file with `tests` tests to `out`, one test at a time so that
+# huge files can be generated in constant memory. `fail`, `unsupported`,
+# `xfail` and `unresolved` are the fractions of tests with those results (the
+# defaults for the last three are about what a libc++ CI configuration sees),
+# and `stderr_lines` pads each failure with that many extra lines of stderr.
+# `huge_fraction` of the failures get `huge_stderr_lines` instead.
+def write_results(out: TextIO, tests: int, fail: float = 0.1, unsupported: float = 0.12, xfail: float = 0.01,
+                  unresolved: float = 0.001, notes: int = 10, stderr_lines: int = 0, huge_fraction: float = 0.0,
+                  huge_stderr_lines: int = 0, seed: Optional[int] = 0):
+  codes = [('FAIL', fail), ('UNSUPPORTED', unsupported), ('XFAIL', xfail), ('UNRESOLVED', unresolved)]
+  rng = random.Random(seed)
+  out.write('{\n  "__version__": [18, 0, 0],\n')
+  out.write(f'  "elapsed": {tests * 0.5:.3f},\n  "tests": [\n')
+  for i in range(tests):
+    r = rng.random()
+    code = 'PASS'
+    for c, fraction in codes:
+      if r < fraction:
+        code = c
+        break
+      r -= fraction
+    padding = huge_stderr_lines if code == 'FAIL' and rng.random() < huge_fraction else stderr_lines
+    if i:
+      out.write(',\n')
+    out.write('    ')
+    out.write(json.dumps(generate_test(rng, i, code, notes, padding)))
+  out.write('\n  ]\n}\n')
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Generate a synthetic lit results.json')
+  parser.add_argument('output', help='file to write, or - for stdout')
+  parser.add_argument('--tests', type=int, default=1000)
+  parser.add_argument('--fail', type=float, default=0.1)
+  parser.add_argument('--unsupported', type=float, default=0.12)
+  parser.add_argument('--xfail', type=float, default=0.01)
+  parser.add_argument('--unresolved', type=float, default=0.001)
+  parser.add_argument('--notes', type=int, default=10)
+  parser.add_argument('--stderr-lines', type=int, default=0)
+  parser.add_argument('--huge-fraction', type=float, default=0.0)
+  parser.add_argument('--huge-stderr-lines', type=int, default=50000)
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args(argv)
+  kwargs = dict(tests=args.tests, fail=args.fail, unsupported=args.unsupported, xfail=args.xfail,
+                unresolved=args.unresolved, notes=args.notes,
+                stderr_lines=args.stderr_lines, huge_fraction=args.huge_fraction,
+                huge_stderr_lines=args.huge_stderr_lines, seed=args.seed)
+  if args.output == '-':
+    write_results(sys.stdout, **kwargs)
+  else:
+    with open(args.output, 'w') as f:
+      write_results(f, **kwargs)
+
+
+if __name__ == '__main__':
+  main()
+
+
+import unittest
+
+class TestSynthetic(unittest.TestCase):
+  def test_generate(self):
+    import io
+    from .libcxx_test_parser import ExecutedCommandBlock, parse_test_output
+    from .lit_results import LITResultsReader
+    buf = io.StringIO()
+    write_results(buf, 200, fail=0.5, xfail=0.05, unresolved=0.05, stderr_lines=3)
+    buf.seek(0)
+    tests = list(LITResultsReader(buf))
+    self.assertEqual(len(tests), 200)
+    self.assertEqual({t.code for t in tests}, {'PASS', 'FAIL', 'UNSUPPORTED', 'XFAIL', 'UNRESOLVED'})
+    failures = [t for t in tests if t.code == 'FAIL']
+    self.assertTrue(failures)
+    errors = 0
+    for t in failures:
+      parsed = parse_test_output(t.output, cache=False)
+      self.assertEqual(parsed.Output[0].exit_code != 0, True)
+      self.assertTrue(any(isinstance(b, ExecutedCommandBlock) and b.error_message for b in parsed.Output))
+      errors += len(parsed.clang_errors)
+    self.assertGreater(errors, 0)
@@ -1,13 +1,24 @@
 from pydantic import BaseModel, Field
-from typing import Literal, Any, Union, Optional
+from typing import Literal, Any, Union, Optional, get_args
+
+# The result codes lit writes.
+ResultCode = Literal["PASS", "FLAKYPASS", "XFAIL", "FAIL", "XPASS", "UNRESOLVED", "UNSUPPORTED", "TIMEOUT",
+                     "SKIPPED", "EXCLUDED"]
+RESULT_CODES = frozenset(get_args(ResultCode))
+
+# The codes lit counts as failures (ResultCode.isFailure in lit).
+FAILING_CODES = frozenset({"FAIL", "XPASS", "UNRESOLVED", "TIMEOUT"})
 
 
 class TestResult(BaseModel):
-    code: Literal["PASS", "FAIL", "SKIP", "XPASS"]
+    code: ResultCode
     elapsed: float
     metrics: dict[str, Any] = Field(default_factory=dict)
     name: str
     output: str
+    # The CI configuration the test ran in. lit doesn't record this, it's
+    # filled in when results from several configurations are combined.
+    config: Optional[str] = None
 
 class LITTestResults(BaseModel):
     version: tuple[int, int, int] = Field(alias="__version__")
@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Optional
+
+from .checks import MAX_ANNOTATIONS_PER_REQUEST, CheckRunUploader
+from .diagnostic_index import DiagnosticKey
+from .instrument import get_instrumentation
+from .libcxx_test_parser import parse_test_output
+from .report import Report
+from .types.llvm import FAILING_CODES, RESULT_CODES, TestResult
+
+# Reports failures to a check run while lit is still running.
+#
+# Lines of lit's verbose output (`lit -v`, from a log being written or from
+# lit itself) are turned into test results as they arrive. Failures are
+# parsed in worker processes and their annotations are added to an
+# in-progress check run in batches, so the first broken test shows up on the
+# pull request long before the last test finishes. Reading, parsing and
+# uploading are separate asyncio tasks connected by queues, so none of them
+# waits on the others.
+#
+#   python -m llvmact watch build/lit.log --follow
+#   python -m llvmact watch -- lit -v build/libcxx/test
+#
+# Lines which are JSON objects are read as single lit test results, so a
+# stream of them works as well as the console output.
+
+_status_re = re.compile(r'^(?P<code>[A-Z]+): (?P<name>.+?) \(\d+ of \d+\)$')
+_begin_re = re.compile(r"^\*{20} TEST '(?P<name>.+)' (?:FAILED|RESULTS) \*{20}$")
+_end_line = '*' * 20
+# lit prints this once every test has run.
+_done_re = re.compile(r'^(?:Testing Time:|Total Discovered Tests:)')
+
+
+# Incremental parser for lit's verbose console output. feed() takes one line
+# at a time and returns the tests it completes.
+#
+# lit prints the status line of a failure first and its output between two
+# rows of stars after it, so a failure is only complete at the closing row
+# (or at the next status line, when lit wasn't run with -v). Any code lit
+# counts as a failure has its output printed this way.
+class LitLogParser:
+  def __init__(self):
+    self.pending: Optional[TestResult] = None
+    self.output: Optional[list[str]] = None
+    self.done = False
+
+  def _finish(self) -> list[TestResult]:
+    test, self.pending = self.pending, None
+    if test is None:
+      return []
+    if self.output is not None:
+      test.output = '\n'.join(self.output) + '\n'
+      self.output = None
+    return [test]
+
+  def feed(self, line: str) -> list[TestResult]:
+    line = line.rstrip('\n')
+    if self.output is not None:
+      if line == _end_line:
+        return self._finish()
+      self.output.append(line)
+      return []
+    if m := _status_re.match(line):
+      code = m.group('code')
+      if code not in RESULT_CODES:
+        return []
+      done = self._finish()
+      test = TestResult(code=code, elapsed=0.0, name=m.group('name'), output='')
+      if code in FAILING_CODES:
+        self.pending = test
+        return done
+      return done + [test]
+    if m := _begin_re.match(line):
+      if self.pending is not None and self.pending.name == m.group('name'):
+        self.output = []
+      return []
+    if line.startswith('{'):
+      try:
+        return self._finish() + [TestResult.model_validate(json.loads(line))]
+      except ValueError:
+        return []
+    if _done_re.match(line):
+      self.done = True
+    return []
+
+  def close(self) -> list[TestResult]:
+    return self._finish()
+
+
+# Lines appended to `path`, as they're written. Stops at the end of the file
+# once lit has printed its summary, or when nothing was written for
+# `idle_timeout` seconds; without `follow`, at the end of the file.
+async def tail(path: str, follow: bool = True, poll: float = 0.5,
+               idle_timeout: Optional[float] = None) -> AsyncIterator[str]:
+  with open(path, errors='replace') as f:
+    partial = ''
+    done = False
+    last = time.monotonic()
+    while True:
+      chunk = f.readline()
+      if chunk:
+        last = time.monotonic()
+        partial += chunk
+        if partial.endswith('\n'):
+          done = done or _done_re.match(partial) is not None
+          yield partial
+          partial = ''
+        continue
+      if not follow or done or (idle_timeout is not None and time.monotonic() - last > idle_timeout):
+        break
+      await asyncio.sleep(poll)
+    if partial:
+      yield partial
+
+
+# The output of a command (lit itself), line by line, echoed to stdout so the
+# log still shows up in the job.
+async def command_lines(argv: list[str]) -> AsyncIterator[str]:
+  proc = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE,
+                                              stderr=asyncio.subprocess.STDOUT)
+  async for raw in proc.stdout:
+    line = raw.decode('utf-8', 'replace')
+    sys.stdout.write(line)
+    yield line
+  await proc.wait()
+
+
+class Watcher:
+  def __init__(self, uploader: CheckRunUploader, name: str, head_sha: Optional[str],
+               config: Optional[str] = None, jobs: Optional[int] = None, flush_interval: float = 10.0,
+               title: str = 'Check Run Output'):
+    self.uploader = uploader
+    self.name = name
+    self.head_sha = head_sha
+    self.config = config
+    self.jobs = jobs
+    self.flush_interval = flush_interval
+    self.title = title
+    self.report = Report()
+    self._sent_groups: set[DiagnosticKey] = set()
+    self._sent_other = 0
+
+  def summary(self, running: bool = False) -> str:
+    summary = self.report.summary()
+    if running:
+      total = sum(sum(c.values()) for c in self.report.counts.values())
+      summary = f'Running: {total} tests finished so far.\n\n' + summary
+    return summary
+
+  # The annotations for whatever add_failure() added to the report that
+  # hasn't been sent yet. A compiler error is sent when the first test hits
+  # it; the final summary counts the rest.
+  def _new_annotations(self) -> list[dict[str, Any]]:
+    index = self.report.index
+    new = [index.annotation(g, details_budget=self.report.details_budget) for key, g in index.groups.items() if key not in self._sent_groups]
+    self._sent_groups.update(index.groups)
+    other = self.report.other_annotations[self._sent_other:]
+    self._sent_other = len(self.report.other_annotations)
+    return new + other
+
+  # Failures start parsing as soon as they're read; the futures are queued so
+  # they're added to the report in the order lit finished them.
+  async def _add(self, test: TestResult, failures: asyncio.Queue, executor):
+    self.report.add_result(test, self.config)
+    if test.code in FAILING_CODES:
+      loop = asyncio.get_running_loop()
+      await failures.put((test, loop.run_in_executor(executor, parse_test_output, test.output, False)))
+
+  async def _parse(self, failures: asyncio.Queue, annotations: asyncio.Queue):
+    inst = get_instrumentation()
+    while (item := await failures.get()) is not None:
+      test, future = item
+      parsed = await future
+      inst.count('watch.parsed')
+      self.report.add_failure(test, parsed, self.config)
+      for a in self._new_annotations():
+        await annotations.put(a)
+    await annotations.put(None)
+
+  # Sends annotations once a batch is full, or when no more arrived for
+  # `flush_interval` seconds, so a lone failure isn't held back until the end.
+  async def _upload(self, annotations: asyncio.Queue):
+    inst = get_instrumentation()
+    batch: list[dict[str, Any]] = []
+    finished = False
+    while not finished:
+      try:
+        item = await asyncio.wait_for(annotations.get(), self.flush_interval if batch else None)
+      except asyncio.TimeoutError:
+        item = ...
+      if item is None:
+        finished = True
+      elif item is not ...:
+        batch.append(item)
+        if len(batch) < MAX_ANNOTATIONS_PER_REQUEST:
+          continue
+      if batch:
+        inst.count('watch.batches')
+        await asyncio.to_thread(self.uploader.upload, batch, self.title, self.summary(running=True))
+        batch = []
+
+  async def run(self, lines: AsyncIterator[str]) -> dict[str, Any]:
+    await asyncio.to_thread(self.uploader.create, self.name, self.head_sha, self.title, self.summary(running=True))
+    try:
+      await self._watch(lines)
+    except BaseException as e:
+      await self._abort(e)
+      raise
+    return await asyncio.to_thread(self.uploader.complete, self.report.conclusion, self.title, self.summary())
+
+  # Completes the check run when watching stops before lit finished, so it
+  # isn't left in progress on the pull request.
+  async def _abort(self, error: BaseException):
+    summary = (f'Stopped before every test finished: {type(error).__name__}: {error}\n\n'
+               'The results below are incomplete.\n\n' + self.summary())
+    try:
+      await asyncio.to_thread(self.uploader.complete, 'cancelled', self.title, summary)
+    except Exception as e:
+      print(f'warning: could not complete the check run: {e}', file=sys.stderr)
+
+  async def _watch(self, lines: AsyncIterator[str]):
+    # Parsing is CPU bound, so it gets processes of its own unless a single
+    # job was asked for; that one runs in the loop's default thread pool.
+    executor = None if self.jobs == 1 else ProcessPoolExecutor(max_workers=self.jobs or os.cpu_count())
+    failures: asyncio.Queue = asyncio.Queue()
+    annotations: asyncio.Queue = asyncio.Queue()
+    parser = LitLogParser()
+    tasks = [asyncio.create_task(self._parse(failures, annotations)),
+             asyncio.create_task(self._upload(annotations))]
+    try:
+      async for line in lines:
+        for test in parser.feed(line):
+          await self._add(test, failures, executor)
+      for test in parser.close():
+        await self._add(test, failures, executor)
+      await failures.put(None)
+      await asyncio.gather(*tasks)
+    finally:
+      for t in tasks:
+        t.cancel()
+      if executor is not None:
+        executor.shutdown()
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='python -m llvmact watch',
+                                   description='Report failures to a check run while lit is running')
+  parser.add_argument('log', nargs='?', help="lit's verbose output, as it's being written")
+  parser.add_argument('--follow', action='store_true', help='keep reading as the log grows until lit finishes')
+  parser.add_argument('--idle-timeout', type=float, default=3600.0,
+                      help='stop following after this many seconds without output')
+  parser.add_argument('--flush-interval', type=float, default=10.0,
+                      help='longest time an annotation waits for others to share its upload')
+  parser.add_argument('-j', '--jobs', type=int, default=None, help='processes parsing failures (default: one per CPU, 1 parses in a thread)')
+  parser.add_argument('--config', default=None)
+  parser.add_argument('--name', default='Libc++ Test Suite')
+  parser.add_argument('--repo', default=os.environ.get('GITHUB_REPOSITORY', 'efcs/action'))
+  parser.add_argument('--sha', default=os.environ.get('GITHUB_SHA'))
+  parser.add_argument('command', nargs=argparse.REMAINDER, help='-- lit ... to run lit and read its output')
+  args = parser.parse_args(argv)
+  command = args.command[1:] if args.command[:1] == ['--'] else args.command
+  if bool(args.log) == bool(command):
+    parser.error('give either a log file or a command')
+
+  uploader = CheckRunUploader(args.repo, os.environ.get('GITHUB_TOKEN'),
+                              api_url=os.environ.get('GITHUB_API_URL', 'https://api.github.com'))
+  watcher = Watcher(uploader, args.name, args.sha, config=args.config, jobs=args.jobs,
+                    flush_interval=args.flush_interval)
+  lines = command_lines(command) if command else tail(args.log, args.follow, idle_timeout=args.idle_timeout)
+  run = asyncio.run(watcher.run(lines))
+  print(f"Check run {run['id']} completed: {run['conclusion']}", file=sys.stderr)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
+
+
+import unittest
+
+class TestWatch(unittest.TestCase):
+  def log(self):
+    from .libcxx_test_parser import TEST_CASES
+    lines = []
+    for i, output in enumerate(TEST_CASES):
+      name = f'llvm-libc++-shared.cfg.in :: std/example/t{i}.pass.cpp'
+      lines.append(f'FAIL: {name} ({i + 1} of 6)')
+      lines.append(f"******************** TEST '{name}' FAILED ********************")
+      lines += output.rstrip('\n').split('\n')
+      lines.append('*' * 20)
+    lines.append('PASS: llvm-libc++-shared.cfg.in :: std/example/ok.pass.cpp (4 of 6)')
+    lines.append('UNSUPPORTED: llvm-libc++-shared.cfg.in :: std/example/skip.pass.cpp (5 of 6)')
+    lines.append('XFAIL: llvm-libc++-shared.cfg.in :: std/example/xfail.pass.cpp (6 of 6)')
+    return [l + '\n' for l in lines]
+
+  def test_parser(self):
+    from .libcxx_test_parser import TEST_CASES
+    parser = LitLogParser()
+    tests = [t for line in self.log() + ['Testing Time: 1.0s\n'] for t in parser.feed(line)] + parser.close()
+    self.assertEqual([t.code for t in tests], ['FAIL'] * len(TEST_CASES) + ['PASS', 'UNSUPPORTED', 'XFAIL'])
+    self.assertEqual(tests[0].output.strip(), TEST_CASES[0].strip())
+    self.assertTrue(parser.done)
+    # Without -v there's no output, and the failure ends at the next status.
+    parser = LitLogParser()
+    self.assertEqual(parser.feed('FAIL: s :: a.pass.cpp (1 of 2)'), [])
+    self.assertEqual([t.name for t in parser.feed('PASS: s :: b.pass.cpp (2 of 2)')], ['s :: a.pass.cpp', 's :: b.pass.cpp'])
+
+  def test_streams_before_lit_finishes(self):
+    from .fake_github import FakeGitHub
+    log = self.log()
+    seen_midway = []
+
+    with FakeGitHub() as gh:
+      async def lines():
+        for line in log[:-2]:
+          yield line
+        # Give the parser and uploader time to catch up while lit "runs".
+        for _ in range(100):
+          if len(gh.requests) >= 2:
+            break
+          await asyncio.sleep(0.02)
+        seen_midway.append(list(gh.requests))
+        for line in log[-2:]:
+          yield line
+
+      uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url, sleep=lambda s: None)
+      watcher = Watcher(uploader, 'Libc++ Test Suite', 'abc', flush_interval=0.05)
+      run = asyncio.run(watcher.run(lines()))
+      self.assertEqual([m for m, _ in seen_midway[0]], ['POST', 'PATCH'])
+      self.assertEqual((run['status'], run['conclusion']), ('completed', 'failure'))
+      self.assertEqual(len(gh.check_runs[run['id']]['annotations']), len(watcher.report.annotations()))
+      self.assertEqual(sum(c['PASS'] for c in watcher.report.counts.values()), 1)
+
+  def test_completes_on_error(self):
+    from .fake_github import FakeGitHub
+    log = self.log()
+
+    async def lines():
+      for line in log[:4]:
+        yield line
+      raise OSError('log went away')
+
+    with FakeGitHub() as gh:
+      uploader = CheckRunUploader('efcs/action', 'token', api_url=gh.url, sleep=lambda s: None)
+      watcher = Watcher(uploader, 'Libc++ Test Suite', 'abc', jobs=1, flush_interval=0.05)
+      with self.assertRaises(OSError):
+        asyncio.run(watcher.run(lines()))
+      run = gh.check_runs[uploader.check_run_id]
+      self.assertEqual((run['status'], run['conclusion']), ('completed', 'cancelled'))
+      self.assertIn('OSError: log went away', run['output']['summary'])
@@ -0,0 +1,196 @@
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+from typing import Any, Optional, TextIO
+
+# Workflow commands and step files, collected and written all at once.
+#
+# Annotations, groups and log lines go to stdout in one write when the
+# emitter is flushed, and outputs, environment variables and the step
+# summary are each appended to their file in one write, instead of a print
+# or `echo >>` per line. Annotations past GitHub's per-step limits would be
+# dropped by the runner without a word, so they're counted here instead and
+# the step summary says how many were left out.
+#
+#   with WorkflowCommands() as wf:
+#     wf.error('no viable overload', file='std/a.pass.cpp', line=12)
+#     with wf.group('Failing tests'):
+#       wf.log(name)
+#     wf.set_output('matrix', json.dumps(matrix))
+#     wf.summary(markdown)
+#
+# See https://docs.github.com/en/actions/using-workflows/workflow-commands-for-github-actions
+
+# Annotations of each kind the runner shows for one step.
+ANNOTATION_LIMITS = {'error': 10, 'warning': 10, 'notice': 10}
+
+# The largest step summary GitHub accepts, in bytes.
+SUMMARY_LIMIT = 1024 * 1024
+
+# Annotation properties, as the keyword arguments of error() and friends.
+_properties = {'title': 'title', 'file': 'file', 'line': 'line', 'end_line': 'endLine',
+               'col': 'col', 'end_column': 'endColumn'}
+
+
+def escape_data(value: Any) -> str:
+  return str(value).replace('%', '%25').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def escape_property(value: Any) -> str:
+  return escape_data(value).replace(':', '%3A').replace(',', '%2C')
+
+
+def format_command(command: str, message: Any = '', **properties) -> str:
+  props = ','.join(f'{_properties.get(k, k)}={escape_property(v)}'
+                   for k, v in properties.items() if v is not None)
+  return f"::{command}{' ' + props if props else ''}::{escape_data(message)}"
+
+
+# `name=value`, or a heredoc when the value spans lines. The delimiter is
+# random so the value can't end it early.
+def format_file_command(name: str, value: Any) -> str:
+  value = str(value)
+  if '\n' not in value and '\r' not in value:
+    return f'{name}={value}\n'
+  delimiter = f'ghadelimiter_{uuid.uuid4()}'
+  return f'{name}<<{delimiter}\n{value}\n{delimiter}\n'
+
+
+class WorkflowCommands:
+  def __init__(self, stream: Optional[TextIO] = None, environ: Optional[dict[str, str]] = None,
+               limits: Optional[dict[str, int]] = None):
+    self.stream = stream
+    self.environ = os.environ if environ is None else environ
+    self.limits = ANNOTATION_LIMITS if limits is None else limits
+    self.lines: list[str] = []
+    self.outputs: list[str] = []
+    self.env: list[str] = []
+    self.summaries: list[str] = []
+    self.annotations = {kind: 0 for kind in self.limits}
+    self.dropped = {kind: 0 for kind in self.limits}
+
+  def __enter__(self) -> 'WorkflowCommands':
+    return self
+
+  def __exit__(self, *exc):
+    self.flush()
+
+  def _annotate(self, kind: str, message: str, **properties) -> bool:
+    if self.annotations[kind] >= self.limits[kind]:
+      self.dropped[kind] += 1
+      return False
+    self.annotations[kind] += 1
+    self.lines.append(format_command(kind, message, **properties))
+    return True
+
+  # Each returns whether the annotation will be shown, rather than dropped
+  # for being over the limit.
+  def error(self, message: str, **properties) -> bool:
+    return self._annotate('error', message, **properties)
+
+  def warning(self, message: str, **properties) -> bool:
+    return self._annotate('warning', message, **properties)
+
+  def notice(self, message: str, **properties) -> bool:
+    return self._annotate('notice', message, **properties)
+
+  # Annotation dicts in the format of the checks API, as built by Report.
+  def annotate(self, annotation: dict[str, Any]) -> bool:
+    kind = {'failure': 'error', 'warning': 'warning'}.get(annotation.get('annotation_level'), 'notice')
+    return self._annotate(kind, annotation['message'], title=annotation.get('title'),
+                          file=annotation.get('path'), line=annotation.get('start_line'),
+                          end_line=annotation.get('end_line'), col=annotation.get('start_column'),
+                          end_column=annotation.get('end_column'))
+
+  def log(self, line: str):
+    self.lines.append(line)
+
+  @contextmanager
+  def group(self, title: str):
+    self.lines.append(format_command('group', title))
+    try:
+      yield self
+    finally:
+      self.lines.append('::endgroup::')
+
+  def mask(self, value: str):
+    self.lines.append(format_command('add-mask', value))
+
+  def set_output(self, name: str, value: Any):
+    self.outputs.append(format_file_command(name, value))
+
+  def set_env(self, name: str, value: Any):
+    self.env.append(format_file_command(name, value))
+
+  def summary(self, markdown: str):
+    self.summaries.append(markdown if markdown.endswith('\n') else markdown + '\n')
+
+  def _summary_text(self) -> str:
+    dropped = [f'{n} {kind}s' for kind, n in self.dropped.items() if n]
+    text = ''.join(self.summaries)
+    if dropped:
+      text += (f"\n{', '.join(dropped)} were not shown as annotations; "
+               f"GitHub shows at most {max(self.limits.values())} of each kind per step.\n")
+    data = text.encode('utf-8')
+    if len(data) > SUMMARY_LIMIT:
+      note = '\n\n*Summary truncated.*\n'
+      text = data[:SUMMARY_LIMIT - len(note)].decode('utf-8', 'ignore') + note
+    return text
+
+  def _append(self, variable: str, text: str):
+    path = self.environ.get(variable)
+    if not text or not path:
+      return
+    with open(path, 'a', encoding='utf-8') as f:
+      f.write(text)
+
+  # Writes everything collected so far. Annotations count towards the limits
+  # across flushes, since they all belong to the same step.
+  def flush(self):
+    self._append('GITHUB_OUTPUT', ''.join(self.outputs))
+    self._append('GITHUB_ENV', ''.join(self.env))
+    self._append('GITHUB_STEP_SUMMARY', self._summary_text() if self.summaries or any(self.dropped.values()) else '')
+    if self.lines:
+      stream = self.stream or sys.stdout
+      stream.write('\n'.join(self.lines) + '\n')
+      stream.flush()
+    self.lines, self.outputs, self.env, self.summaries = [], [], [], []
+    self.dropped = {kind: 0 for kind in self.limits}
+
+
+import unittest
+
+class TestWorkflowCommands(unittest.TestCase):
+  def test_escaping(self):
+    self.assertEqual(format_command('warning', '50%\ndone', file='a,b.cpp', line=3, title='x: y'),
+                     '::warning file=a%2Cb.cpp,line=3,title=x%3A y::50%25%0Adone')
+    self.assertEqual(format_command('endgroup'), '::endgroup::')
+    self.assertEqual(format_file_command('a', 'b'), 'a=b\n')
+    name, rest = format_file_command('a', 'b\nc').split('\n', 1)
+    self.assertEqual(rest, 'b\nc\n' + name.split('<<')[1] + '\n')
+
+  def test_flush(self):
+    import io
+    import tempfile
+    from pathlib import Path
+    with tempfile.TemporaryDirectory() as d:
+      environ = {v: str(Path(d, v)) for v in ('GITHUB_OUTPUT', 'GITHUB_ENV', 'GITHUB_STEP_SUMMARY')}
+      out = io.StringIO()
+      with WorkflowCommands(out, environ, limits={'error': 2, 'warning': 2, 'notice': 2}) as wf:
+        shown = [wf.error(f'e{i}', file='a.cpp', line=i) for i in range(5)]
+        with wf.group('tests'):
+          wf.log('t0')
+        wf.set_output('tests', 'a b')
+        wf.set_env('X', '1')
+        wf.summary('## Results')
+        self.assertEqual(out.getvalue(), '')
+      self.assertEqual(shown, [True, True, False, False, False])
+      self.assertEqual(out.getvalue().splitlines(),
+                       ['::error file=a.cpp,line=0::e0', '::error file=a.cpp,line=1::e1', '::group::tests', 't0',
+                        '::endgroup::'])
+      self.assertEqual(Path(environ['GITHUB_OUTPUT']).read_text(), 'tests=a b\n')
+      self.assertEqual(Path(environ['GITHUB_ENV']).read_text(), 'X=1\n')
+      summary = Path(environ['GITHUB_STEP_SUMMARY']).read_text()
+      self.assertTrue(summary.startswith('## Results\n'))
+      self.assertIn('3 errors were not shown', summary)